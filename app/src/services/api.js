@@ -8,18 +8,34 @@
 // Конфигурация API
 const API_BASE_URL = 'http://localhost:8000/api';
 const STATIC_BASE_URL = 'http://localhost:8000'; // Для иконок и скриншотов
+const REVIEWS_API_BASE_URL = 'http://localhost:5000/api'; // Сервис отзывов (Flask)
+const RATINGS_BATCH_SIZE = 300; // Максимум app_ids в одном запросе /api/ratings
+
+/**
+ * W3C traceparent для одного действия пользователя: один и тот же заголовок
+ * уходит и в каталог, и в сервис отзывов, поэтому их спаны попадают в одну трассу
+ */
+const newTraceparent = () => {
+  const hex = (bytes) => Array.from(crypto.getRandomValues(new Uint8Array(bytes)))
+    .map(b => b.toString(16).padStart(2, '0'))
+    .join('');
+  return `00-${hex(16)}-${hex(8)}-01`;
+};
+
+const traceHeaders = (traceparent) => (traceparent ? { traceparent } : {});
 
 /**
  * Утилита для выполнения fetch запросов с обработкой ошибок
  */
-const fetchAPI = async (url, options = {}) => {
+const fetchAPI = async (url, options = {}, traceparent) => {
   try {
     const response = await fetch(`${API_BASE_URL}${url}`, {
+      ...options,
       headers: {
         'Content-Type': 'application/json',
+        ...traceHeaders(traceparent),
         ...options.headers,
       },
-      ...options,
     });
 
     if (!response.ok) {
@@ -34,10 +50,46 @@ const fetchAPI = async (url, options = {}) => {
   }
 };
 
+/**
+ * Сводки рейтинга из сервиса отзывов для списка приложений:
+ * один запрос на пачку вместо запроса на каждое приложение
+ */
+const fetchRatings = async (apps, traceparent) => {
+  const ids = [...new Set(apps.map(app => app.id))];
+  const batches = [];
+  for (let i = 0; i < ids.length; i += RATINGS_BATCH_SIZE) {
+    batches.push(ids.slice(i, i + RATINGS_BATCH_SIZE));
+  }
+  try {
+    const results = await Promise.all(batches.map(async (batch) => {
+      const response = await fetch(`${REVIEWS_API_BASE_URL}/ratings?app_ids=${batch.join(',')}`, {
+        headers: traceHeaders(traceparent),
+      });
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      return (await response.json()).data || {};
+    }));
+    return Object.assign({}, ...results);
+  } catch (error) {
+    // Сервис отзывов недоступен - списки показываются без реальных сводок
+    console.error('API Error [/ratings]:', error);
+    return {};
+  }
+};
+
+/**
+ * Адаптер списка приложений вместе со сводками рейтинга
+ */
+const adaptAppsWithRatings = async (apps, traceparent) => {
+  const ratings = await fetchRatings(apps, traceparent);
+  return apps.map(app => adaptAppData(app, ratings[app.id]));
+};
+
 /**
  * Адаптер для преобразования данных бэкенда в формат фронтенда
  */
-const adaptAppData = (backendApp) => {
+const adaptAppData = (backendApp, ratingSummary) => {
   // Преобразуем относительные URL в полные
   const getFullUrl = (path) => {
     if (!path) return '';
@@ -51,7 +103,7 @@ const adaptAppData = (backendApp) => {
     name: backendApp.name,
     category: backendApp.category,
     rating: backendApp.rating || 0,
-    reviews: Math.floor(Math.random() * 50000) + 1000, // Mock, т.к. нет в БД
+    reviews: ratingSummary ? ratingSummary.reviews_count : 0, // 0, если сервис отзывов недоступен
     downloads: `${Math.floor(Math.random() * 20) + 1}M+`, // Mock
     icon: getFullUrl(backendApp.icon_url),
     size: backendApp.size || 'Н/Д',
@@ -156,11 +208,12 @@ const adaptCategoryData = (categories) => {
 
 // Получить все приложения
 export const getAllApps = async () => {
+  const traceparent = newTraceparent();
   try {
-    const apps = await fetchAPI('/apps');
+    const apps = await fetchAPI('/apps', {}, traceparent);
     return {
       success: true,
-      data: apps.map(adaptAppData)
+      data: await adaptAppsWithRatings(apps, traceparent)
     };
   } catch (error) {
     return {
@@ -172,11 +225,13 @@ export const getAllApps = async () => {
 
 // Получить приложение по ID
 export const getAppById = async (id) => {
+  const traceparent = newTraceparent();
   try {
-    const app = await fetchAPI(`/apps/${id}`);
+    const app = await fetchAPI(`/apps/${id}`, {}, traceparent);
+    const [adapted] = await adaptAppsWithRatings([app], traceparent);
     return {
       success: true,
-      data: adaptAppData(app)
+      data: adapted
     };
   } catch (error) {
     return {
@@ -188,11 +243,12 @@ export const getAppById = async (id) => {
 
 // Получить популярные приложения (топ по рейтингу)
 export const getFeaturedApps = async (limit = 3) => {
+  const traceparent = newTraceparent();
   try {
-    const apps = await fetchAPI('/featured');
+    const apps = await fetchAPI('/featured', {}, traceparent);
     return {
       success: true,
-      data: apps.slice(0, limit).map(adaptAppData)
+      data: await adaptAppsWithRatings(apps.slice(0, limit), traceparent)
     };
   } catch (error) {
     return {
@@ -204,14 +260,15 @@ export const getFeaturedApps = async (limit = 3) => {
 
 // Получить топ недели (случайная выборка из топовых)
 export const getTopWeekApps = async (limit = 5) => {
+  const traceparent = newTraceparent();
   try {
-    const apps = await fetchAPI('/apps');
+    const apps = await fetchAPI('/apps', {}, traceparent);
     const topApps = apps
       .sort((a, b) => b.rating - a.rating)
       .slice(0, limit);
     return {
       success: true,
-      data: topApps.map(adaptAppData)
+      data: await adaptAppsWithRatings(topApps, traceparent)
     };
   } catch (error) {
     return {
@@ -223,11 +280,12 @@ export const getTopWeekApps = async (limit = 5) => {
 
 // Поиск приложений
 export const searchApps = async (query) => {
+  const traceparent = newTraceparent();
   try {
-    const apps = await fetchAPI(`/search?q=${encodeURIComponent(query)}`);
+    const apps = await fetchAPI(`/search?q=${encodeURIComponent(query)}`, {}, traceparent);
     return {
       success: true,
-      data: apps.map(adaptAppData)
+      data: await adaptAppsWithRatings(apps, traceparent)
     };
   } catch (error) {
     return {
@@ -239,8 +297,9 @@ export const searchApps = async (query) => {
 
 // Получить все категории
 export const getCategories = async () => {
+  const traceparent = newTraceparent();
   try {
-    const categories = await fetchAPI('/categories');
+    const categories = await fetchAPI('/categories', {}, traceparent);
     return {
       success: true,
       data: adaptCategoryData(categories)
@@ -255,15 +314,16 @@ export const getCategories = async () => {
 
 // Получить приложения по категории
 export const getAppsByCategory = async (categoryId) => {
+  const traceparent = newTraceparent();
   try {
     // Преобразуем ID обратно в название категории
     const categoryName = categoryId.replace(/_/g, ' ');
     const capitalizedName = categoryName.charAt(0).toUpperCase() + categoryName.slice(1);
     
-    const apps = await fetchAPI(`/apps?category=${encodeURIComponent(capitalizedName)}`);
+    const apps = await fetchAPI(`/apps?category=${encodeURIComponent(capitalizedName)}`, {}, traceparent);
     return {
       success: true,
-      data: apps.map(adaptAppData)
+      data: await adaptAppsWithRatings(apps, traceparent)
     };
   } catch (error) {
     return {
@@ -301,8 +361,9 @@ export const getReviewsForApp = async (appId) => {
 
 // Получить скачанные приложения пользователя (mock)
 export const getUserDownloads = async () => {
+  const traceparent = newTraceparent();
   try {
-    const apps = await fetchAPI('/apps');
+    const apps = await fetchAPI('/apps', {}, traceparent);
     const randomApps = apps.slice(0, 4).map((app, index) => ({
       ...adaptAppData(app),
       downloadDate: `${index + 1} ${index === 0 ? 'день' : 'дня'} назад`
@@ -321,11 +382,12 @@ export const getUserDownloads = async () => {
 
 // Получить избранные приложения пользователя (mock)
 export const getUserFavorites = async () => {
+  const traceparent = newTraceparent();
   try {
-    const apps = await fetchAPI('/featured');
+    const apps = await fetchAPI('/featured', {}, traceparent);
     return {
       success: true,
-      data: apps.map(adaptAppData)
+      data: await adaptAppsWithRatings(apps, traceparent)
     };
   } catch (error) {
     return {
@@ -337,8 +399,9 @@ export const getUserFavorites = async () => {
 
 // Получить отзывы пользователя (mock)
 export const getUserReviews = async () => {
+  const traceparent = newTraceparent();
   try {
-    const apps = await fetchAPI('/apps');
+    const apps = await fetchAPI('/apps', {}, traceparent);
     const topApps = apps.slice(0, 3);
     return {
       success: true,
@@ -365,11 +428,12 @@ export const getUserReviews = async () => {
 
 // Создать новое приложение
 export const createApp = async (appData) => {
+  const traceparent = newTraceparent();
   try {
     const app = await fetchAPI('/apps', {
       method: 'POST',
       body: JSON.stringify(appData)
-    });
+    }, traceparent);
     return {
       success: true,
       data: adaptAppData(app)
@@ -384,11 +448,12 @@ export const createApp = async (appData) => {
 
 // Обновить приложение
 export const updateApp = async (appId, appData) => {
+  const traceparent = newTraceparent();
   try {
     const app = await fetchAPI(`/apps/${appId}`, {
       method: 'PUT',
       body: JSON.stringify(appData)
-    });
+    }, traceparent);
     return {
       success: true,
       data: adaptAppData(app)
@@ -403,10 +468,11 @@ export const updateApp = async (appId, appData) => {
 
 // Удалить приложение
 export const deleteApp = async (appId) => {
+  const traceparent = newTraceparent();
   try {
     const response = await fetchAPI(`/apps/${appId}`, {
       method: 'DELETE'
-    });
+    }, traceparent);
     return {
       success: true,
       message: response.message
@@ -0,0 +1,228 @@
+"""
+Контроль допуска запросов: адаптивный лимит параллельности и сброс нагрузки.
+
+- Лимит одновременно обрабатываемых запросов подстраивается под латентность
+  (градиентный алгоритм). Пока задержка близка к базовой, лимит растет,
+  при росте очереди в БД и задержек - снижается.
+- Сверх лимита запрос ждет в ограниченной очереди не дольше дедлайна.
+  Если очередь полна или дедлайн истек, сразу отвечаем 503 с Retry-After,
+  а не копим запросы на пуле соединений.
+- Для дорогих endpoints (/api/search) у каждого клиента свой лимит
+  частоты (token bucket). Превышение - 429 с Retry-After.
+"""
+import asyncio
+import json
+import math
+import time
+from collections import deque, OrderedDict, Counter
+
+from .config import (
+    ADMISSION_MIN_LIMIT,
+    ADMISSION_MAX_LIMIT,
+    ADMISSION_INITIAL_LIMIT,
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_QUEUE_TIMEOUT_MS,
+    ADMISSION_RETRY_AFTER,
+    ADMISSION_CLIENT_RATE,
+    ADMISSION_CLIENT_BURST,
+    ADMISSION_TRUST_FORWARDED,
+)
+
+# Служебные endpoints не ограничиваются: мониторинг должен работать под нагрузкой
+EXEMPT_PREFIXES = ("/health", "/metrics", "/debug/")
+# Дорогие endpoints с лимитом на клиента
+EXPENSIVE_PREFIXES = ("/api/search",)
+# Сколько клиентов помнить для лимитов (самые старые вытесняются)
+MAX_TRACKED_CLIENTS = 10000
+
+
+class GradientLimit:
+    """
+    Адаптивный лимит параллельности по отношению долгосрочной (базовой)
+    и текущей латентности: limit * gradient + sqrt(limit), со сглаживанием
+    """
+    TOLERANCE = 1.5
+    SMOOTHING = 0.2
+    LONG_WINDOW = 600
+    SHORT_ALPHA = 0.1
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(initial)
+        self.long_rtt = None
+        self.short_rtt = None
+
+    def on_sample(self, rtt: float, inflight: int):
+        if self.long_rtt is None:
+            self.long_rtt = self.short_rtt = rtt
+            return
+        self.short_rtt += (rtt - self.short_rtt) * self.SHORT_ALPHA
+        self.long_rtt += (rtt - self.long_rtt) / self.LONG_WINDOW
+        # После перегрузки базовая латентность завышена - быстро возвращаем ее вниз
+        if self.long_rtt / self.short_rtt > 2:
+            self.long_rtt *= 0.95
+
+        # Пока лимит не выбирается даже наполовину, задержка о нем ничего не говорит
+        if inflight < self.limit / 2:
+            return
+        gradient = max(0.5, min(1.0, self.TOLERANCE * self.long_rtt / self.short_rtt))
+        new_limit = self.limit * gradient + math.sqrt(self.limit)
+        self.limit = self.limit * (1 - self.SMOOTHING) + new_limit * self.SMOOTHING
+        self.limit = max(self.min_limit, min(self.max_limit, self.limit))
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+
+class AdmissionController:
+    """
+    Лимит параллельности с очередью ожидания и лимиты частоты по клиентам
+    """
+
+    def __init__(self):
+        self.limiter = GradientLimit(ADMISSION_INITIAL_LIMIT, ADMISSION_MIN_LIMIT, ADMISSION_MAX_LIMIT)
+        self.inflight = 0
+        self.queue = deque()
+        self.shed = Counter()
+        self._clients = OrderedDict()
+
+    def _try_acquire(self) -> bool:
+        if self.inflight < int(self.limiter.limit) and not self.queue:
+            self.inflight += 1
+            return True
+        return False
+
+    async def acquire(self) -> bool:
+        """Допуск запроса: сразу, после ожидания в очереди или отказ (False)"""
+        if self._try_acquire():
+            return True
+        if len(self.queue) >= ADMISSION_QUEUE_SIZE:
+            self.shed["queue_full"] += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.queue.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), ADMISSION_QUEUE_TIMEOUT_MS / 1000)
+            return True
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # Место выдали в момент истечения дедлайна - возвращаем его
+                self.release(None)
+            else:
+                waiter.cancel()
+            self.shed["queue_timeout"] += 1
+            return False
+        except asyncio.CancelledError:
+            # Клиент ушел: выданное место не должно потеряться
+            if waiter.done() and not waiter.cancelled():
+                self.release(None)
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            if waiter in self.queue:
+                self.queue.remove(waiter)
+
+    def release(self, rtt):
+        """Запрос завершен: замер латентности и передача места первому в очереди"""
+        self.inflight -= 1
+        if rtt is not None:
+            self.limiter.on_sample(rtt, self.inflight + 1)
+        while self.queue and self.inflight < int(self.limiter.limit):
+            waiter = self.queue.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(True)
+
+    def client_allowed(self, client: str) -> bool:
+        """Token bucket клиента для дорогих endpoints"""
+        now = time.monotonic()
+        bucket = self._clients.get(client)
+        if bucket is None:
+            bucket = self._clients[client] = TokenBucket(ADMISSION_CLIENT_BURST)
+            if len(self._clients) > MAX_TRACKED_CLIENTS:
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(client)
+        bucket.tokens = min(ADMISSION_CLIENT_BURST, bucket.tokens + (now - bucket.updated) * ADMISSION_CLIENT_RATE)
+        bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return True
+        self.shed["client_rate"] += 1
+        return False
+
+    def status(self) -> dict:
+        return {
+            "limit": round(self.limiter.limit, 2),
+            "inflight": self.inflight,
+            "queued": len(self.queue),
+            "long_rtt_ms": round(self.limiter.long_rtt * 1000, 2) if self.limiter.long_rtt else None,
+            "short_rtt_ms": round(self.limiter.short_rtt * 1000, 2) if self.limiter.short_rtt else None,
+            "shed": dict(self.shed),
+            "tracked_clients": len(self._clients),
+        }
+
+
+controller = AdmissionController()
+
+
+def _client_id(scope) -> str:
+    if ADMISSION_TRUST_FORWARDED:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def _reject(send, status: int, detail: str):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            (b"retry-after", str(ADMISSION_RETRY_AFTER).encode("latin-1")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware допуска запросов (см. AdmissionController)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        if scope["path"].startswith(EXPENSIVE_PREFIXES) and not controller.client_allowed(_client_id(scope)):
+            await _reject(send, 429, "Too many requests for this endpoint, retry later")
+            return
+
+        if not await controller.acquire():
+            await _reject(send, 503, "Server is overloaded, retry later")
+            return
+
+        started = time.perf_counter()
+        rtt = None
+        try:
+            await self.app(scope, receive, send)
+            rtt = time.perf_counter() - started
+        finally:
+            # Ошибки не участвуют в оценке латентности
+            controller.release(rtt)
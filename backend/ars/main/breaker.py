@@ -0,0 +1,303 @@
+"""
+Защита от медленной или недоступной БД: таймауты SQL запросов и circuit breaker.
+
+- SELECT из HTTP обработчика получает подсказку MAX_EXECUTION_TIME с пределом
+  своего маршрута (STATEMENT_TIMEOUTS, иначе STATEMENT_TIMEOUT_MS): зависший
+  запрос прерывается MySQL и не держит соединение пула и воркер. Запросы вне
+  HTTP (миграции, выгрузка снимка) не ограничиваются. Запись ждет блокировку
+  строки не дольше LOCK_WAIT_TIMEOUT.
+- Circuit breaker считает ошибки и медленные запросы за последние
+  BREAKER_WINDOW_SECONDS. При превышении порога он открывается: запросы к БД
+  отклоняются сразу (503 с Retry-After), кэш каталога отдает последние
+  значения. Через BREAKER_OPEN_SECONDS breaker полуоткрыт - пропускает
+  несколько пробных запросов и закрывается, если они успешны.
+
+Пробный запрос - HTTP запрос целиком (BreakerProbeMiddleware): сколько бы
+раз он ни вызвал check()/allow(), он занимает один слот и освобождает его
+при завершении. Запрос, завершившийся без ошибки перегрузки, засчитывается
+как успешный (ошибка в самом запросе, например нарушение ограничения, тоже
+означает, что БД ответила). Проба, не завершившаяся за BREAKER_PROBE_TIMEOUT,
+снова открывает breaker.
+"""
+import itertools
+import threading
+import time
+from collections import deque, Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+
+from .config import (
+    logger,
+    STATEMENT_TIMEOUT_MS,
+    STATEMENT_TIMEOUTS,
+    LOCK_WAIT_TIMEOUT,
+    BREAKER_ENABLED,
+    BREAKER_WINDOW_SECONDS,
+    BREAKER_MIN_CALLS,
+    BREAKER_ERROR_RATE,
+    BREAKER_SLOW_MS,
+    BREAKER_SLOW_RATE,
+    BREAKER_OPEN_SECONDS,
+    BREAKER_HALF_OPEN_PROBES,
+    BREAKER_PROBE_TIMEOUT,
+)
+from .metrics import current_route
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Коды MySQL, означающие перегрузку, а не ошибку в запросе:
+# превышен MAX_EXECUTION_TIME, таймаут блокировки, запрос прерван
+OVERLOAD_ERRNOS = {3024, 1205, 1317}
+
+
+class DatabaseUnavailable(Exception):
+    """БД временно недоступна (breaker открыт) - ответ 503 с Retry-After"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Database is temporarily unavailable")
+        self.retry_after = retry_after
+
+
+class RequestProbe:
+    """Проба breaker, занятая текущим HTTP запросом"""
+    __slots__ = ("probe",)
+
+    def __init__(self):
+        self.probe = None
+
+
+_request_probe: ContextVar[Optional[RequestProbe]] = ContextVar("ars_breaker_probe", default=None)
+
+
+def detach_probe():
+    """
+    Отвязать текущий контекст от пробы запроса. Вызывается в фоновых задачах:
+    они копируют контекст запроса и могут пережить его, поэтому их исход
+    учитывается только через record()
+    """
+    _request_probe.set(None)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker со скользящим окном по секундам. Обновляется из потоков
+    пула (запросы к БД идут в threadpool), поэтому под блокировкой.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.state = CLOSED
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        # [секунда, запросы, ошибки, медленные]
+        self._window = deque()
+        self._opened_at = 0.0
+        # Незавершенные пробы: токен -> время выдачи
+        self._probes = {}
+        self._probe_ids = itertools.count(1)
+        self._probe_successes = 0
+
+    @property
+    def closed(self) -> bool:
+        return self.state == CLOSED
+
+    def allow(self) -> bool:
+        """
+        Можно ли сейчас идти в БД. В полуоткрытом состоянии HTTP запрос
+        занимает пробный слот (один на запрос); вне запроса слот не
+        занимается - такой вызов нельзя связать с исходом
+        """
+        if not self.enabled or self.state == CLOSED:
+            return True
+        request_probe = _request_probe.get()
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= BREAKER_OPEN_SECONDS:
+                self._transition(HALF_OPEN)
+                self._probes.clear()
+                self._probe_successes = 0
+            if self.state == HALF_OPEN:
+                self._expire_probes(now)
+            if self.state == HALF_OPEN:
+                if request_probe is not None and request_probe.probe in self._probes:
+                    return True
+                if len(self._probes) < BREAKER_HALF_OPEN_PROBES:
+                    if request_probe is not None:
+                        request_probe.probe = next(self._probe_ids)
+                        self._probes[request_probe.probe] = now
+                    return True
+            if self.state == CLOSED:
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def check(self):
+        """Отказ сразу, если БД сейчас недоступна"""
+        if not self.allow():
+            raise DatabaseUnavailable(self.retry_after())
+
+    def release(self, probe):
+        """Проба завершилась без ошибки перегрузки; после нужного числа успехов breaker закрывается"""
+        if probe is None:
+            return
+        with self._lock:
+            # Пробы, выданные до повторного открытия, уже не учитываются
+            if self._probes.pop(probe, None) is None:
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= BREAKER_HALF_OPEN_PROBES:
+                self._window.clear()
+                self._transition(CLOSED)
+
+    def _expire_probes(self, now: float):
+        if self._probes and now - min(self._probes.values()) >= BREAKER_PROBE_TIMEOUT:
+            self._open(f"probe did not finish in {BREAKER_PROBE_TIMEOUT:g}s")
+
+    def retry_after(self) -> int:
+        remaining = BREAKER_OPEN_SECONDS - (time.monotonic() - self._opened_at)
+        return max(1, round(remaining))
+
+    def record(self, duration_ms: float, failed: bool):
+        if not self.enabled:
+            return
+        slow = duration_ms >= BREAKER_SLOW_MS
+        with self._lock:
+            if self.state == HALF_OPEN:
+                # Успех пробы засчитывает release() по завершении запроса
+                if failed or slow:
+                    self._open("probe failed")
+                return
+            if self.state == OPEN:
+                return
+
+            second = int(time.monotonic())
+            if not self._window or self._window[-1][0] != second:
+                self._window.append([second, 0, 0, 0])
+            bucket = self._window[-1]
+            bucket[1] += 1
+            bucket[2] += failed
+            bucket[3] += slow
+            while self._window[0][0] <= second - BREAKER_WINDOW_SECONDS:
+                self._window.popleft()
+
+            calls, failures, slow_calls = self._totals()
+            if calls < BREAKER_MIN_CALLS:
+                return
+            if failures / calls >= BREAKER_ERROR_RATE:
+                self._open(f"{failures}/{calls} queries failed")
+            elif slow_calls / calls >= BREAKER_SLOW_RATE:
+                self._open(f"{slow_calls}/{calls} queries slower than {BREAKER_SLOW_MS:g} ms")
+
+    def _totals(self):
+        return tuple(sum(bucket[i] for bucket in self._window) for i in (1, 2, 3))
+
+    def _open(self, reason: str):
+        self._opened_at = time.monotonic()
+        self._window.clear()
+        self._probes.clear()
+        self._transition(OPEN)
+        logger.warning(f"⚡ Database circuit breaker opened: {reason}, "
+                       f"rejecting queries for {BREAKER_OPEN_SECONDS:g}s")
+
+    def _transition(self, state: str):
+        if state == CLOSED and self.state != CLOSED:
+            logger.info("✅ Database circuit breaker closed")
+        self.state = state
+        self.stats[f"to_{state}"] += 1
+
+    def status(self) -> dict:
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._expire_probes(time.monotonic())
+            calls, failures, slow_calls = self._totals()
+            return {
+                "enabled": self.enabled,
+                "state": self.state,
+                "window": {"calls": calls, "failures": failures, "slow": slow_calls},
+                "retry_after": self.retry_after() if self.state == OPEN else None,
+                "probes": {"in_flight": len(self._probes), "successes": self._probe_successes}
+                if self.state == HALF_OPEN else None,
+                "stats": dict(self.stats),
+            }
+
+
+db_breaker = CircuitBreaker(BREAKER_ENABLED)
+
+
+class BreakerProbeMiddleware:
+    """
+    ASGI middleware: HTTP запрос - одна проба полуоткрытого breaker,
+    занятая при первом check()/allow() и освобождаемая по завершении запроса
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_probe = RequestProbe()
+        token = _request_probe.set(request_probe)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_probe.reset(token)
+            db_breaker.release(request_probe.probe)
+
+
+def statement_timeout_ms(route) -> int:
+    """Предел выполнения запроса для маршрута (0 - без предела)"""
+    if route is None:
+        return 0
+    return STATEMENT_TIMEOUTS.get(route, STATEMENT_TIMEOUT_MS)
+
+
+def _is_overload(exception_context) -> bool:
+    """Ошибка говорит о состоянии БД (недоступна, перегружена), а не о запросе"""
+    if exception_context.is_disconnect:
+        return True
+    if getattr(exception_context.original_exception, "errno", None) in OVERLOAD_ERRNOS:
+        return True
+    return isinstance(exception_context.sqlalchemy_exception, (exc.OperationalError, exc.InterfaceError))
+
+
+def instrument_breaker(engines):
+    """
+    Хуки SQLAlchemy: таймауты запросов и учет их результатов в breaker
+    """
+    for engine in engines:
+        if engine.dialect.name == "mysql" and LOCK_WAIT_TIMEOUT > 0:
+            @event.listens_for(engine, "connect")
+            def _set_lock_wait_timeout(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute(f"SET SESSION innodb_lock_wait_timeout = {LOCK_WAIT_TIMEOUT}")
+                cursor.close()
+
+    @event.listens_for(Engine, "before_cursor_execute", retval=True)
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._ars_breaker_started = time.perf_counter()
+        if conn.dialect.name == "mysql" and statement[:6].upper() == "SELECT":
+            timeout_ms = statement_timeout_ms(current_route())
+            if timeout_ms > 0:
+                statement = f"{statement[:6]} /*+ MAX_EXECUTION_TIME({timeout_ms}) */{statement[6:]}"
+        return statement, parameters
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        db_breaker.record((time.perf_counter() - context._ars_breaker_started) * 1000, failed=False)
+
+    @event.listens_for(Engine, "handle_error")
+    def _handle_error(exception_context):
+        # Ошибка pre-ping лечится переподключением, ошибки в самом запросе
+        # (ограничения, синтаксис) не говорят о здоровье БД
+        if getattr(exception_context, "is_pre_ping", False) or not _is_overload(exception_context):
+            return
+        started = getattr(exception_context.execution_context, "_ars_breaker_started", None)
+        duration_ms = (time.perf_counter() - started) * 1000 if started is not None else 0.0
+        db_breaker.record(duration_ms, failed=True)
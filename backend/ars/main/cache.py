@@ -0,0 +1,132 @@
+"""
+Кэш горячих ответов каталога с объединением запросов (single-flight)
+и stale-while-revalidate.
+
+- Свежая запись (моложе CACHE_TTL_SECONDS) отдается сразу.
+- Устаревшая, но не старше CACHE_STALE_SECONDS, тоже отдается сразу, а в
+  фоне запускается одно обновление.
+- При промахе значение вычисляет только первый запрос, остальные
+  запросы с тем же ключом ждут его результат, а не идут в MySQL.
+
+Пока circuit breaker БД открыт, новые вычисления не запускаются: отдается
+последнее значение, даже если оно старше CACHE_STALE_SECONDS.
+
+Кэш свой у каждого процесса. Запись в каталог сбрасывает кэш этого процесса,
+остальные воркеры обновятся по TTL.
+"""
+import asyncio
+import time
+from collections import Counter
+
+from .breaker import db_breaker, detach_probe, DatabaseUnavailable
+from .config import logger, CACHE_TTL_SECONDS, CACHE_STALE_SECONDS
+
+
+class CacheEntry:
+    __slots__ = ("value", "fresh_until", "stale_until")
+
+    def __init__(self, value, ttl: float, stale: float):
+        now = time.monotonic()
+        self.value = value
+        self.fresh_until = now + ttl
+        self.stale_until = now + ttl + stale
+
+
+class SingleFlightCache:
+    """
+    Кэш значений, вычисляемых блокирующей функцией (запрос к БД) в потоке
+    """
+
+    def __init__(self, ttl: float, stale: float, breaker=None):
+        self.ttl = ttl
+        self.stale = stale
+        self.breaker = breaker
+        self.stats = Counter()
+        self._entries = {}
+        self._inflight = {}
+        # Увеличивается при сбросе: результат вычисления, начатого до сброса,
+        # отдается своим ожидающим, но не сохраняется
+        self._generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    async def get(self, key, compute):
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and now < entry.fresh_until:
+            self.stats["hit"] += 1
+            return entry.value
+        if entry is not None and now < entry.stale_until:
+            self.stats["stale"] += 1
+            if key not in self._inflight and self._can_compute():
+                self._start(key, compute)
+            return entry.value
+
+        task = self._inflight.get(key)
+        if task is None and not self._can_compute():
+            # БД недоступна: лучше устаревший ответ, чем ошибка
+            if entry is None:
+                raise DatabaseUnavailable(self.breaker.retry_after())
+            self.stats["fallback"] += 1
+            return entry.value
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["miss"] += 1
+            task = self._start(key, compute)
+        # shield: отмена одного запроса (клиент ушел) не отменяет общее вычисление
+        return await asyncio.shield(task)
+
+    def _can_compute(self) -> bool:
+        return self.breaker is None or self.breaker.allow()
+
+    def _start(self, key, compute) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(self._compute(key, compute))
+        self._inflight[key] = task
+
+        def _done(finished):
+            if self._inflight.get(key) is finished:
+                del self._inflight[key]
+            if not finished.cancelled() and finished.exception() is not None:
+                self.stats["error"] += 1
+                logger.warning(f"⚠️ Cache refresh for {key} failed: {finished.exception()}")
+
+        task.add_done_callback(_done)
+        return task
+
+    async def _compute(self, key, compute):
+        # Задача работает в копии контекста запроса, который ее запустил
+        detach_probe()
+        generation = self._generation
+        value = await asyncio.to_thread(compute)
+        if generation == self._generation:
+            self._entries[key] = CacheEntry(value, self.ttl, self.stale)
+        return value
+
+    def prefill(self, key, compute):
+        """Синхронное заполнение при старте (прогрев до первого запроса)"""
+        self._entries[key] = CacheEntry(compute(), self.ttl, self.stale)
+
+    def invalidate(self):
+        """Сброс после записи: следующий запрос вычислит значение заново"""
+        self._generation += 1
+        self._entries.clear()
+        self._inflight.clear()
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        return {
+            "ttl_seconds": self.ttl,
+            "stale_seconds": self.stale,
+            "entries": {
+                str(key): "fresh" if now < entry.fresh_until else "stale" if now < entry.stale_until else "expired"
+                for key, entry in self._entries.items()
+            },
+            "inflight": [str(key) for key in self._inflight],
+            "stats": dict(self.stats),
+        }
+
+
+catalog_cache = SingleFlightCache(CACHE_TTL_SECONDS, CACHE_STALE_SECONDS, breaker=db_breaker)
@@ -0,0 +1,145 @@
+"""
+Версии изменений каталога для инкрементальной синхронизации клиентов.
+
+Каждый flush, который создает, меняет или удаляет приложение (или его
+скриншоты), получает следующую версию из счетчика catalog_change_counter.
+Версия записывается в apps.change_version, удаления - в app_tombstones.
+Клиент хранит последнюю полученную версию и запрашивает только разницу:
+
+    GET /api/apps/changes?since=42
+"""
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import event, update, select
+from sqlalchemy.orm import selectinload
+
+from .database import RoutingSession
+from .models import AppDB, ScreenshotDB, AppTombstoneDB, ChangeCounterDB
+
+COUNTER_ID = 1
+# Сколько изменений отдавать за один запрос (дальше - has_more)
+CHANGES_PAGE_SIZE = 500
+
+
+def next_version(session) -> int:
+    """
+    Следующая версия каталога. UPDATE блокирует строку счетчика до конца
+    транзакции, поэтому версии растут в порядке фиксации записей
+    """
+    result = session.execute(
+        update(ChangeCounterDB).where(ChangeCounterDB.id == COUNTER_ID).values(value=ChangeCounterDB.value + 1)
+    )
+    if result.rowcount == 0:
+        session.execute(ChangeCounterDB.__table__.insert().values(id=COUNTER_ID, value=1))
+    return session.execute(select(ChangeCounterDB.value).where(ChangeCounterDB.id == COUNTER_ID)).scalar_one()
+
+
+def current_version(session) -> int:
+    value = session.execute(select(ChangeCounterDB.value).where(ChangeCounterDB.id == COUNTER_ID)).scalar()
+    return value or 0
+
+
+@event.listens_for(RoutingSession, "before_flush")
+def _stamp_changes(session, flush_context, instances):
+    deleted_apps = {obj.id for obj in session.deleted if isinstance(obj, AppDB)}
+    changed = {}
+
+    def touch(app_id: Optional[int], app: Optional[AppDB] = None):
+        if app_id in deleted_apps:
+            return
+        app = app or (session.get(AppDB, app_id) if app_id is not None else None)
+        if app is not None:
+            changed[id(app)] = app
+
+    for obj in session.new:
+        if isinstance(obj, AppDB):
+            changed[id(obj)] = obj
+        elif isinstance(obj, ScreenshotDB):
+            touch(obj.app_id, obj.app)
+    for obj in session.dirty:
+        if isinstance(obj, AppDB) and session.is_modified(obj):
+            changed[id(obj)] = obj
+        elif isinstance(obj, ScreenshotDB) and session.is_modified(obj):
+            touch(obj.app_id, obj.app)
+    for obj in session.deleted:
+        if isinstance(obj, ScreenshotDB):
+            touch(obj.app_id)
+
+    if not changed and not deleted_apps:
+        return
+
+    version = next_version(session)
+    now = datetime.utcnow()
+    for app in changed.values():
+        app.change_version = version
+        app.updated_at = now
+    for app_id in deleted_apps:
+        session.merge(AppTombstoneDB(app_id=app_id, change_version=version, deleted_at=now))
+
+
+def parse_since(value: str):
+    """since - версия (число) или момент времени в ISO 8601"""
+    value = value.strip()
+    if value.isdigit():
+        return int(value), None
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    # updated_at и deleted_at хранятся в UTC без зоны: время со смещением
+    # сначала переводится в UTC; время без зоны считается уже UTC
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return None, moment
+
+
+def changes_since(session, since: str, limit: int = CHANGES_PAGE_SIZE):
+    """
+    Изменения после версии или момента времени: измененные приложения и id
+    удаленных, упорядоченные по версии. Если изменений больше limit,
+    has_more=True и version указывает, откуда продолжать
+    """
+    since_version, since_time = parse_since(since)
+    # Счетчик читается до выборки: запись, зафиксированная после этого,
+    # получит большую версию и попадет в следующую синхронизацию
+    latest = current_version(session)
+
+    apps_query = session.query(AppDB).options(selectinload(AppDB.screenshots))
+    tombstones_query = session.query(AppTombstoneDB)
+    if since_time is None:
+        apps_query = apps_query.filter(AppDB.change_version > since_version)
+        tombstones_query = tombstones_query.filter(AppTombstoneDB.change_version > since_version)
+    else:
+        apps_query = apps_query.filter(AppDB.updated_at > since_time)
+        tombstones_query = tombstones_query.filter(AppTombstoneDB.deleted_at > since_time)
+
+    apps = apps_query.order_by(AppDB.change_version, AppDB.id).limit(limit + 1).all()
+    tombstones = tombstones_query.order_by(AppTombstoneDB.change_version).limit(limit + 1).all()
+    # id, переиспользованный после удаления, - это upsert, а не удаление
+    live_ids = {app.id for app in apps}
+    items = sorted(
+        [(app.change_version, app) for app in apps] +
+        [(tombstone.change_version, tombstone) for tombstone in tombstones if tombstone.app_id not in live_ids],
+        key=lambda item: item[0]
+    )
+
+    has_more = len(items) > limit
+    if has_more:
+        # Одна версия не разрывается между страницами: продолжение идет
+        # со строгого "> version", поэтому неполная последняя версия
+        # отбрасывается, а слишком большая догружается целиком
+        cut_version = items[limit][0]
+        items = [item for item in items if item[0] < cut_version]
+        if not items:
+            items = [(cut_version, app) for app in session.query(AppDB).options(selectinload(AppDB.screenshots))
+                     .filter(AppDB.change_version == cut_version).order_by(AppDB.id)]
+            items += [(cut_version, tombstone) for tombstone in session.query(AppTombstoneDB)
+                      .filter(AppTombstoneDB.change_version == cut_version)]
+        version = items[-1][0]
+    else:
+        version = max([latest] + [item[0] for item in items])
+
+    return {
+        "version": version,
+        "upserts": [obj for _, obj in items if isinstance(obj, AppDB)],
+        "deleted": [obj.app_id for _, obj in items if isinstance(obj, AppTombstoneDB)],
+        "has_more": has_more,
+    }
@@ -1,27 +1,161 @@
 """
 Настройка подключения к базе данных
 """
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker, declarative_base
-from .config import DATABASE_URL, logger
+import itertools
+import threading
+import time
+
+from fastapi import Request, Response
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from .config import (
+    DATABASE_URL,
+    DATABASE_REPLICA_URLS,
+    REPLICA_STICKY_SECONDS,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    logger
+)
+from .pool import MeteredQueuePool, pool_status
+from .breaker import db_breaker
+
+# Cookie, закрепляющий чтение клиента за primary после его записи
+PRIMARY_COOKIE = "ars_read_primary"
+
+
+def make_engine(url: str):
+    """Engine с настроенным пулом соединений"""
+    return create_engine(
+        url,
+        poolclass=MeteredQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+
 
 # Создание engine и session
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = make_engine(DATABASE_URL)
+replica_engines = [make_engine(url) for url in DATABASE_REPLICA_URLS]
+_replica_cycle = itertools.cycle(replica_engines)
+_replica_lock = threading.Lock()
+
+# До этого момента (time.monotonic) все чтения этого процесса идут в primary
+_primary_until = 0.0
+
+
+class RoutingSession(Session):
+    """
+    Сессия с разделением чтения и записи: read-only сессии читают
+    с реплики (одной на всю сессию), остальные работают с primary.
+    Flush всегда уходит в primary.
+    """
+
+    def __init__(self, *args, use_primary: bool = True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.use_primary = use_primary
+        self._replica = None
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.use_primary or self._flushing or not replica_engines:
+            return engine
+        if self._replica is None:
+            with _replica_lock:
+                self._replica = next(_replica_cycle)
+        return self._replica
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_write(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _pin_reads_to_primary(session):
+    """После записи реплики могут отставать - временно читаем из primary"""
+    global _primary_until
+    if session.info.pop("wrote", False):
+        _primary_until = time.monotonic() + REPLICA_STICKY_SECONDS
+
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
-def get_db():
+def get_db(response: Response):
+    """
+    Dependency для получения сессии БД в FastAPI endpoints (primary).
+    Используется endpoints записи: клиент получает cookie, закрепляющий
+    его чтения за primary (и мимо кэша каталога) на REPLICA_STICKY_SECONDS
+    (read-your-writes). Пока circuit breaker открыт - сразу 503.
+    """
+    db_breaker.check()
+    response.set_cookie(
+        PRIMARY_COOKIE,
+        str(time.time() + REPLICA_STICKY_SECONDS),
+        max_age=max(int(REPLICA_STICKY_SECONDS), 1),
+        httponly=True,
+    )
+    db = SessionLocal(use_primary=True)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db(request: Request):
     """
-    Dependency для получения сессии БД в FastAPI endpoints
+    Dependency для read-only endpoints: сессия читает с реплики,
+    если клиент или этот процесс недавно не писали в primary.
+    Breaker здесь не проверяется: endpoint может ответить из снимка или
+    кэша, а перед запросом к БД вызывает db_breaker.check()
     """
-    db = SessionLocal()
+    db = SessionLocal(use_primary=reads_pinned_to_primary(request))
     try:
         yield db
     finally:
         db.close()
 
 
+def reads_pinned_to_primary(request: Request) -> bool:
+    """Нужно ли читать из primary для соблюдения read-your-writes"""
+    return primary_pinned() or client_recently_wrote(request)
+
+
+def primary_pinned() -> bool:
+    """
+    Нужно ли читать из primary без учета клиента: реплик нет или этот
+    процесс недавно писал (фоновые чтения, например заполнение кэша)
+    """
+    return not replica_engines or time.monotonic() < _primary_until
+
+
+def client_recently_wrote(request: Request) -> bool:
+    """Клиент писал в каталог последние REPLICA_STICKY_SECONDS (cookie от get_db)"""
+    pinned_until = request.cookies.get(PRIMARY_COOKIE)
+    if pinned_until:
+        try:
+            return float(pinned_until) > time.time()
+        except ValueError:
+            return False
+    return False
+
+
+def get_pool_metrics():
+    """
+    Метрики пула соединений для endpoint /debug/pool
+    """
+    metrics = {"primary": pool_status(engine.pool)}
+    for index, replica in enumerate(replica_engines):
+        metrics[f"replica_{index}"] = pool_status(replica.pool)
+    return metrics
+
+
 def create_tables():
     """
     Создание всех таблиц в базе данных
@@ -1,12 +1,14 @@
 """
 FastAPI приложение для Rustore API
 """
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, JSONResponse
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional
 from contextlib import asynccontextmanager
+import asyncio
 import os
 
 from .config import (
@@ -14,56 +16,182 @@ from .config import (
     SCREENSHOTS_DIR, 
     ICONS_DIR, 
     CORS_ORIGINS,
+    STARTUP_MODE,
+    EDGE_MODE,
+    ADMISSION_ENABLED,
+    STARTUP_WARM_CONNECTIONS,
     check_static_files
 )
-from .database import get_db, create_tables, SessionLocal
+from .database import (
+    get_db,
+    get_read_db,
+    create_tables,
+    get_pool_metrics,
+    client_recently_wrote,
+    primary_pinned,
+    SessionLocal,
+    engine,
+    replica_engines
+)
 from .models import AppDB, ScreenshotDB
-from .schemas import App, AppCreate, AppUpdate, MessageResponse
+from .schemas import App, AppCreate, AppUpdate, AppChanges, MessageResponse
 from .seed import seed_data
-
+from .migrations import upgrade as run_migrations
+from .startup import StartupReport, FirstRequestTimer, warm_pool, warm_catalog
+from .metrics import MetricsMiddleware, registry as metrics_registry, instrument_sqlalchemy
+from .profiling import ProfilingMiddleware, store as profile_store, token_valid
+from .slow_queries import slow_log, instrument_slow_queries
+from .tracing import TracingMiddleware, exporter as span_exporter, instrument_sqlalchemy_tracing
+from .snapshot import snapshots, app_payload, render_app, render_list, FEATURED_LIMIT
+from .static_export import static_exporter
+from .changes import changes_since, parse_since
+from .cache import catalog_cache
+from .admission import AdmissionMiddleware, controller as admission_controller
+from .breaker import db_breaker, DatabaseUnavailable, BreakerProbeMiddleware, instrument_breaker
+
+
+startup_report = StartupReport(STARTUP_MODE)
 
 # Проверка статических файлов при запуске
-check_static_files()
+# (в fast-режиме откладывается до окончания старта)
+if STARTUP_MODE != "fast":
+    with startup_report.phase("check_static_files"):
+        check_static_files()
 
 
-# Lifespan manager
-@asynccontextmanager
-async def lifespan(app: FastAPI):
+def load_apps_json(category: Optional[str] = None) -> bytes:
+    """JSON ответа /api/apps для кэша: один запрос за приложениями и один за скриншотами"""
+    # Сразу после записи реплика может отставать: кэш заполняется из primary
+    db = SessionLocal(use_primary=primary_pinned())
+    try:
+        query = db.query(AppDB).options(selectinload(AppDB.screenshots))
+        if category:
+            query = query.filter(AppDB.category == category)
+        return render_list(render_app(db_app) for db_app in query.order_by(AppDB.id))
+    finally:
+        db.close()
+
+
+def load_featured_json() -> bytes:
+    """JSON ответа /api/featured для кэша"""
+    db = SessionLocal(use_primary=primary_pinned())
+    try:
+        db_apps = (db.query(AppDB).options(selectinload(AppDB.screenshots))
+                   .order_by(AppDB.rating.desc(), AppDB.id).limit(FEATURED_LIMIT))
+        return render_list(render_app(db_app) for db_app in db_apps)
+    finally:
+        db.close()
+
+
+def warm_catalog_cache():
+    """Заполнение кэша до первого запроса (после деплоя кэш пуст)"""
+    catalog_cache.prefill(("apps", None), load_apps_json)
+    catalog_cache.prefill(("featured",), load_featured_json)
+
+
+async def fast_startup():
     """
-    Управление жизненным циклом приложения
+    Production-режим запуска: схема и данные уже подготовлены деплоем,
+    поэтому create_tables и seed пропускаются, а пул и ORM прогреваются параллельно
     """
-    # Startup
-    try:
+    warm_steps = {
+        "warm_pool": lambda: warm_pool(engine, STARTUP_WARM_CONNECTIONS),
+        "warm_catalog": lambda: warm_catalog(lambda: SessionLocal(use_primary=False)),
+    }
+    if snapshots.enabled:
+        warm_steps["load_snapshot"] = snapshots.current
+    elif catalog_cache.enabled:
+        warm_steps["warm_cache"] = warm_catalog_cache
+    for index, replica in enumerate(replica_engines):
+        warm_steps[f"warm_replica_{index}"] = (
+            lambda replica=replica: warm_pool(replica, STARTUP_WARM_CONNECTIONS)
+        )
+    await startup_report.run_concurrently(**warm_steps)
+    startup_report.mark_ready()
+
+    # Проверка статики не влияет на обслуживание запросов - выполняем в фоне
+    asyncio.get_running_loop().run_in_executor(None, check_static_files)
+    logger.info("🚀 Server started in fast mode")
+
+
+def edge_startup():
+    """
+    Read-only edge-узел: каталог целиком из снимка, БД не нужна
+    """
+    with startup_report.phase("load_snapshot"):
+        snapshot = snapshots.current()
+    startup_report.mark_ready()
+    if snapshot is None:
+        logger.warning(f"⚠️ Edge mode: no catalog snapshot at '{snapshots.path}' yet, catalog returns 503")
+    else:
+        logger.info(f"🚀 Edge node serving snapshot generation {snapshot.generation} ({snapshot.count} apps)")
+
+
+def full_startup():
+    """
+    Запуск для разработки: создание таблиц, seed и подробный лог
+    """
+    with startup_report.phase("create_tables"):
         create_tables()
+    with startup_report.phase("migrations"):
+        run_migrations()
+    with startup_report.phase("seed_data"):
         db = SessionLocal()
         seed_data(db)
         db.close()
+    startup_report.mark_ready()
+
+    logger.info("🚀 Server started on http://localhost:8000")
+    logger.info("📱 API available:")
+    logger.info("   GET /api/apps - list all apps")
+    logger.info("   GET /api/apps/{id} - get app details")
+    logger.info("   GET /api/apps/changes?since=0 - apps changed since a version")
+    logger.info("   GET /api/categories - list categories")
+    logger.info("   GET /api/apps?category=Финансы - filter by category")
+    logger.info("   GET /api/search?q=банк - search apps")
+    logger.info("   GET /api/featured - featured apps")
+    logger.info("   GET /health - health check")
+    logger.info("   GET /debug/files - debug static files")
+    logger.info("   GET /debug/startup - startup timing report")
+    logger.info("   GET /debug/pool - connection pool metrics")
+    logger.info("   GET /metrics - Prometheus metrics")
+    logger.info("   GET /debug/profiles - request profiles (token required)")
+    logger.info("   GET /debug/slow-queries - slow query log with EXPLAIN")
+    logger.info("   GET /debug/traces - recent trace spans")
+    logger.info("   GET /debug/snapshot - shared catalog snapshot status")
+    logger.info("   GET /debug/cache - catalog response cache")
+    logger.info("   GET /debug/admission - concurrency limit and load shedding")
+    logger.info("   GET /debug/breaker - database circuit breaker")
+    logger.info("🌐 React frontend can connect from: http://localhost:3000")
+
+    # Информация о статических файлах
+    logger.info("📁 Static files info:")
+    logger.info(f"   Screenshots: http://localhost:8000/screenshots/")
+    logger.info(f"   Icons: http://localhost:8000/icons/")
+
+    if os.path.exists(SCREENSHOTS_DIR):
+        files = os.listdir(SCREENSHOTS_DIR)
+        logger.info(f"   Found {len(files)} screenshot files")
+
+    if os.path.exists(ICONS_DIR):
+        files = os.listdir(ICONS_DIR)
+        logger.info(f"   Found {len(files)} icon files")
 
-        logger.info("🚀 Server started on http://localhost:8000")
-        logger.info("📱 API available:")
-        logger.info("   GET /api/apps - list all apps")
-        logger.info("   GET /api/apps/{id} - get app details")
-        logger.info("   GET /api/categories - list categories")
-        logger.info("   GET /api/apps?category=Финансы - filter by category")
-        logger.info("   GET /api/search?q=банк - search apps")
-        logger.info("   GET /api/featured - featured apps")
-        logger.info("   GET /health - health check")
-        logger.info("   GET /debug/files - debug static files")
-        logger.info("🌐 React frontend can connect from: http://localhost:3000")
-
-        # Информация о статических файлах
-        logger.info("📁 Static files info:")
-        logger.info(f"   Screenshots: http://localhost:8000/screenshots/")
-        logger.info(f"   Icons: http://localhost:8000/icons/")
-
-        if os.path.exists(SCREENSHOTS_DIR):
-            files = os.listdir(SCREENSHOTS_DIR)
-            logger.info(f"   Found {len(files)} screenshot files")
-
-        if os.path.exists(ICONS_DIR):
-            files = os.listdir(ICONS_DIR)
-            logger.info(f"   Found {len(files)} icon files")
 
+# Lifespan manager
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Управление жизненным циклом приложения
+    """
+    # Startup
+    try:
+        if EDGE_MODE:
+            edge_startup()
+        elif STARTUP_MODE == "fast":
+            await fast_startup()
+        else:
+            full_startup()
     except Exception as e:
         logger.error(f"❌ Startup failed: {e}")
         raise
@@ -81,15 +209,117 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# CORS middleware
+# Контроль допуска: адаптивный лимит параллельности, 503/429 с Retry-After.
+# Добавляется первым - внутрь CORS (у отказов есть CORS заголовки)
+# и метрик (отказы видны на /metrics)
+if ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
+
+# CORS middleware: фронтенд присылает traceparent, поэтому заголовки не ограничиваются
 app.add_middleware(
     CORSMiddleware,
     allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["traceresponse"],
 )
 
+# Замер времени до первого обслуженного запроса
+app.add_middleware(FirstRequestTimer, report=startup_report)
+
+# Метрики запросов и времени БД по маршрутам (/metrics)
+app.add_middleware(MetricsMiddleware)
+instrument_sqlalchemy()
+
+# Журнал медленных запросов с EXPLAIN (/debug/slow-queries)
+instrument_slow_queries()
+
+# Таймауты SQL запросов по маршрутам и circuit breaker БД (/debug/breaker)
+app.add_middleware(BreakerProbeMiddleware)
+instrument_breaker([engine, *replica_engines])
+
+
+@app.exception_handler(DatabaseUnavailable)
+async def database_unavailable_handler(request: Request, error: DatabaseUnavailable):
+    """Breaker открыт: быстрый отказ вместо ожидания зависшей БД"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database is temporarily unavailable, retry later"},
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+def pool_gauges():
+    """Состояние пулов соединений для /metrics"""
+    pools = get_pool_metrics()
+    gauges = []
+    for name, key, help_text in (
+        ("ars_db_pool_in_use", "in_use", "Connections checked out of the pool"),
+        ("ars_db_pool_overflow", "overflow", "Overflow connections above pool_size"),
+        ("ars_db_pool_checkouts", "checkouts", "Connections handed out since start"),
+        ("ars_db_pool_wait_max_ms", "wait_max_ms", "Longest wait for a pooled connection"),
+    ):
+        gauges.append((name, help_text, {
+            (("engine", engine_name),): status.get(key, 0) for engine_name, status in pools.items()
+        }))
+    return gauges
+
+
+metrics_registry.add_collector(pool_gauges)
+
+
+def cache_gauges():
+    """Обращения к кэшу каталога по результату для /metrics"""
+    return [("ars_cache_lookups", "Catalog cache lookups by result (hit, stale, miss, coalesced, error)", {
+        (("result", result),): count for result, count in catalog_cache.stats.items()
+    })]
+
+
+metrics_registry.add_collector(cache_gauges)
+
+
+def admission_gauges():
+    """Состояние контроля допуска для /metrics"""
+    status = admission_controller.status()
+    return [
+        ("ars_admission_limit", "Current adaptive concurrency limit", {(): status["limit"]}),
+        ("ars_admission_inflight", "Requests being processed", {(): status["inflight"]}),
+        ("ars_admission_queued", "Requests waiting for admission", {(): status["queued"]}),
+        ("ars_admission_shed", "Rejected requests by reason", {
+            (("reason", reason),): count for reason, count in status["shed"].items()
+        }),
+    ]
+
+
+if ADMISSION_ENABLED:
+    metrics_registry.add_collector(admission_gauges)
+
+
+def breaker_gauges():
+    """Состояние circuit breaker БД для /metrics"""
+    status = db_breaker.status()
+    return [
+        ("ars_db_breaker_state", "Database circuit breaker state (0 closed, 1 half-open, 2 open)", {
+            (): {"closed": 0, "half_open": 1, "open": 2}[status["state"]]
+        }),
+        ("ars_db_breaker_events", "Breaker transitions and rejected queries", {
+            (("event", name),): count for name, count in status["stats"].items()
+        }),
+    ]
+
+
+if db_breaker.enabled:
+    metrics_registry.add_collector(breaker_gauges)
+
+# Профилирование запросов по токену или выборке (/debug/profiles)
+app.add_middleware(ProfilingMiddleware)
+
+# Трассировка HTTP обработчиков и SQL запросов (traceparent, /debug/traces)
+if span_exporter.enabled:
+    app.add_middleware(TracingMiddleware)
+    instrument_sqlalchemy_tracing()
+
 # Статические файлы с абсолютными путями
 app.mount("/screenshots", StaticFiles(directory=SCREENSHOTS_DIR), name="screenshots")
 app.mount("/icons", StaticFiles(directory=ICONS_DIR), name="icons")
@@ -110,6 +340,143 @@ async def health_check():
     return {"status": "ok", "service": "appstore-api"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(
+        metrics_registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/debug/startup")
+async def debug_startup():
+    """Отчет о времени запуска по фазам"""
+    return startup_report.as_dict()
+
+
+@app.get("/debug/pool")
+async def debug_pool():
+    """Состояние пула соединений: занятые соединения, overflow, ожидание checkout"""
+    return get_pool_metrics()
+
+
+@app.get("/debug/slow-queries")
+async def debug_slow_queries():
+    """Медленные SQL запросы по формам: длительность, endpoints, план EXPLAIN"""
+    return slow_log.report()
+
+
+@app.get("/debug/snapshot")
+async def debug_snapshot():
+    """Снимок каталога, из которого отвечает этот воркер"""
+    return snapshots.status()
+
+
+class RawJSONResponse(Response):
+    """
+    Готовый JSON без повторной сериализации: bytes из кэша или memoryview
+    на страницы mmap снимка (отдается серверу без копирования)
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return content
+
+
+def catalog_snapshot():
+    """
+    Снимок каталога, если endpoints должны отвечать из него.
+    На edge-узле без снимка каталог недоступен (БД там нет).
+    """
+    snapshot = snapshots.current()
+    if snapshot is None and EDGE_MODE:
+        raise HTTPException(status_code=503, detail="Catalog snapshot is not loaded yet")
+    return snapshot
+
+
+def after_catalog_write(app_id: int, *categories):
+    """
+    Обновление производных копий каталога после успешной записи:
+    общего снимка воркеров и статического JSON экспорта
+    """
+    session_factory = lambda: SessionLocal(use_primary=True)
+    catalog_cache.invalidate()
+    snapshots.refresh(session_factory)
+    static_exporter.refresh(session_factory, app_id, categories)
+
+
+def require_writable():
+    """Запись в каталог невозможна на read-only edge-узле"""
+    if EDGE_MODE:
+        raise HTTPException(status_code=405, detail="Read-only edge node: send catalog writes to the primary API")
+
+
+@app.get("/debug/cache")
+async def debug_cache():
+    """Состояние кэша каталога: записи, идущие обновления, статистика"""
+    return catalog_cache.status()
+
+
+@app.get("/debug/admission")
+async def debug_admission():
+    """Контроль допуска: текущий лимит, очередь, латентность, отказы"""
+    return admission_controller.status()
+
+
+@app.get("/debug/breaker")
+async def debug_breaker():
+    """Circuit breaker БД: состояние, ошибки и медленные запросы в окне"""
+    return db_breaker.status()
+
+
+@app.get("/debug/traces")
+async def debug_traces(trace_id: Optional[str] = Query(None)):
+    """Последние спаны из памяти процесса (все или одной трассы)"""
+    return span_exporter.recent(trace_id)
+
+
+def require_profile_token(
+        x_ars_profile: Optional[str] = Header(None),
+        token: Optional[str] = Query(None)
+):
+    """Доступ к профилям только с токеном ARS_PROFILE_TOKEN"""
+    if not token_valid(x_ars_profile or token):
+        raise HTTPException(status_code=403, detail="Profiling token required")
+
+
+@app.get("/debug/profiles", dependencies=[Depends(require_profile_token)])
+async def list_profiles():
+    """Список сохраненных профилей запросов (новые первыми)"""
+    return profile_store.list()
+
+
+@app.get("/debug/profiles/{profile_id}", dependencies=[Depends(require_profile_token)])
+async def get_profile(profile_id: int):
+    """Сводка профиля: топ функций по cumulative time и топ аллокаций"""
+    record = profile_store.get(profile_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return {
+        **record.as_dict(),
+        "cpu": record.cpu_summary,
+        "allocations": record.alloc_summary,
+    }
+
+
+@app.get("/debug/profiles/{profile_id}/download", dependencies=[Depends(require_profile_token)])
+async def download_profile(profile_id: int):
+    """CPU профиль в формате .prof (pstats, snakeviz)"""
+    record = profile_store.get(profile_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(
+        content=record.stats_dump,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="ars-profile-{profile_id}.prof"'}
+    )
+
+
 @app.get("/debug/files")
 async def debug_files():
     """Диагностика статических файлов"""
@@ -139,10 +506,21 @@ async def debug_files():
 
 @app.get("/api/apps", response_model=List[App])
 async def get_apps(
+        request: Request,
         category: Optional[str] = Query(None),
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_read_db)
 ):
     """Получить список приложений с возможностью фильтрации по категории"""
+    snapshot = catalog_snapshot()
+    if snapshot is not None:
+        return RawJSONResponse(snapshot.apps_json(category))
+    # После своей записи клиент читает мимо кэша (read-your-writes),
+    # но если БД недоступна - лучше кэш, чем ошибка
+    if catalog_cache.enabled and (not client_recently_wrote(request) or not db_breaker.closed):
+        return RawJSONResponse(await catalog_cache.get(
+            ("apps", category or None), lambda: load_apps_json(category)
+        ))
+    db_breaker.check()
     try:
         query = db.query(AppDB)
         if category:
@@ -176,9 +554,44 @@ async def get_apps(
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+# Объявлен до /api/apps/{app_id}, иначе "changes" разбирался бы как app_id
+@app.get("/api/apps/changes", response_model=AppChanges)
+async def get_app_changes(
+        since: str = Query("0", description="Версия каталога или момент времени в ISO 8601"),
+        db: Session = Depends(get_read_db)
+):
+    """Приложения, измененные и удаленные после версии since"""
+    if EDGE_MODE:
+        # Версий и tombstones в снимке нет, а БД на edge-узле нет
+        raise HTTPException(status_code=503, detail="Change feed is not available on edge nodes: use the primary API")
+    try:
+        parse_since(since)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="since must be a version number or an ISO 8601 timestamp")
+    db_breaker.check()
+    try:
+        changes = changes_since(db, since)
+        return AppChanges(
+            version=changes["version"],
+            upserts=[App(**app_payload(db_app)) for db_app in changes["upserts"]],
+            deleted=changes["deleted"],
+            has_more=changes["has_more"],
+        )
+    except Exception as e:
+        logger.error(f"Error getting app changes: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
 @app.get("/api/apps/{app_id}", response_model=App)
-async def get_app_by_id(app_id: int, db: Session = Depends(get_db)):
+async def get_app_by_id(app_id: int, db: Session = Depends(get_read_db)):
     """Получить приложение по ID"""
+    snapshot = catalog_snapshot()
+    if snapshot is not None:
+        app_json = snapshot.app_json(app_id)
+        if app_json is None:
+            raise HTTPException(status_code=404, detail="App not found")
+        return RawJSONResponse(app_json)
+    db_breaker.check()
     try:
         db_app = db.query(AppDB).filter(AppDB.id == app_id).first()
         if not db_app:
@@ -210,8 +623,12 @@ async def get_app_by_id(app_id: int, db: Session = Depends(get_db)):
 
 
 @app.get("/api/categories")
-async def get_categories(db: Session = Depends(get_db)):
+async def get_categories(db: Session = Depends(get_read_db)):
     """Получить список всех категорий"""
+    snapshot = catalog_snapshot()
+    if snapshot is not None:
+        return RawJSONResponse(snapshot.categories_json())
+    db_breaker.check()
     try:
         categories = db.query(AppDB.category).distinct().all()
         return [category[0] for category in categories]
@@ -224,9 +641,13 @@ async def get_categories(db: Session = Depends(get_db)):
 @app.get("/api/search", response_model=List[App])
 async def search_apps(
         q: str = Query("", description="Поисковый запрос"),
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_read_db)
 ):
     """Поиск приложений по названию и описанию"""
+    snapshot = catalog_snapshot()
+    if snapshot is not None:
+        return RawJSONResponse(snapshot.search_json(q))
+    db_breaker.check()
     try:
         # Если запрос пустой, возвращаем все приложения
         if not q or q.strip() == "":
@@ -265,8 +686,14 @@ async def search_apps(
 
 
 @app.get("/api/featured", response_model=List[App])
-async def get_featured_apps(db: Session = Depends(get_db)):
+async def get_featured_apps(request: Request, db: Session = Depends(get_read_db)):
     """Получить избранные приложения (с наивысшим рейтингом)"""
+    snapshot = catalog_snapshot()
+    if snapshot is not None:
+        return RawJSONResponse(snapshot.featured_json())
+    if catalog_cache.enabled and (not client_recently_wrote(request) or not db_breaker.closed):
+        return RawJSONResponse(await catalog_cache.get(("featured",), load_featured_json))
+    db_breaker.check()
     try:
         db_apps = db.query(AppDB).order_by(AppDB.rating.desc()).limit(5).all()
 
@@ -296,7 +723,7 @@ async def get_featured_apps(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-@app.post("/api/apps", response_model=App, status_code=201)
+@app.post("/api/apps", response_model=App, status_code=201, dependencies=[Depends(require_writable)])
 async def create_app(app_data: AppCreate, db: Session = Depends(get_db)):
     """Создать новое приложение"""
     try:
@@ -335,6 +762,7 @@ async def create_app(app_data: AppCreate, db: Session = Depends(get_db)):
         }
 
         logger.info(f"✅ Created new app: {db_app.name} (ID: {db_app.id})")
+        after_catalog_write(db_app.id, db_app.category)
         return App(**app_dict)
 
     except Exception as e:
@@ -343,7 +771,7 @@ async def create_app(app_data: AppCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-@app.put("/api/apps/{app_id}", response_model=App)
+@app.put("/api/apps/{app_id}", response_model=App, dependencies=[Depends(require_writable)])
 async def update_app(app_id: int, app_data: AppUpdate, db: Session = Depends(get_db)):
     """Обновить существующее приложение"""
     try:
@@ -351,6 +779,8 @@ async def update_app(app_id: int, app_data: AppUpdate, db: Session = Depends(get
         if not db_app:
             raise HTTPException(status_code=404, detail="App not found")
 
+        old_category = db_app.category
+
         # Обновляем только переданные поля
         update_data = app_data.model_dump(exclude_unset=True, exclude={"screenshots"})
         for field, value in update_data.items():
@@ -358,9 +788,11 @@ async def update_app(app_id: int, app_data: AppUpdate, db: Session = Depends(get
 
         # Обновляем скриншоты если переданы
         if app_data.screenshots is not None:
-            # Удаляем старые скриншоты
-            db.query(ScreenshotDB).filter(ScreenshotDB.app_id == app_id).delete()
-            
+            # Удаляем старые скриншоты через сессию, а не массовым DELETE:
+            # иначе before_flush их не увидит и версия приложения не вырастет
+            for screenshot in list(db_app.screenshots):
+                db.delete(screenshot)
+
             # Добавляем новые
             for screenshot_url in app_data.screenshots:
                 db_screenshot = ScreenshotDB(image_url=screenshot_url, app_id=app_id)
@@ -387,6 +819,7 @@ async def update_app(app_id: int, app_data: AppUpdate, db: Session = Depends(get
         }
 
         logger.info(f"✅ Updated app: {db_app.name} (ID: {db_app.id})")
+        after_catalog_write(db_app.id, old_category, db_app.category)
         return App(**app_dict)
 
     except HTTPException:
@@ -397,7 +830,7 @@ async def update_app(app_id: int, app_data: AppUpdate, db: Session = Depends(get
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-@app.delete("/api/apps/{app_id}", response_model=MessageResponse)
+@app.delete("/api/apps/{app_id}", response_model=MessageResponse, dependencies=[Depends(require_writable)])
 async def delete_app(app_id: int, db: Session = Depends(get_db)):
     """Удалить приложение"""
     try:
@@ -406,10 +839,12 @@ async def delete_app(app_id: int, db: Session = Depends(get_db)):
             raise HTTPException(status_code=404, detail="App not found")
 
         app_name = db_app.name
+        app_category = db_app.category
         db.delete(db_app)
         db.commit()
 
         logger.info(f"✅ Deleted app: {app_name} (ID: {app_id})")
+        after_catalog_write(app_id, app_category)
         return MessageResponse(message=f"App '{app_name}' successfully deleted")
 
     except HTTPException:
@@ -0,0 +1,211 @@
+"""
+Метрики в формате Prometheus: запросы, латентность и время БД по шаблону маршрута
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Границы гистограммы латентности запроса (секунды)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Запросы вне маршрутов API (статика, 404) сводятся в одну метку,
+# чтобы не раздувать число временных рядов
+OTHER_ROUTE = "<other>"
+
+
+class RequestStats:
+    """
+    Статистика одного HTTP запроса, накапливаемая хуками SQLAlchemy
+    """
+    __slots__ = ("scope", "db_queries", "db_seconds")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("ars_request_stats", default=None)
+
+
+def current_route() -> Optional[str]:
+    """Шаблон маршрута текущего запроса (None вне запроса)"""
+    stats = _request_stats.get()
+    if stats is None:
+        return None
+    return route_template(stats.scope)
+
+
+def route_template(scope) -> str:
+    route = scope.get("route")
+    return route.path if route is not None else OTHER_ROUTE
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Хранилище метрик процесса. Обновляется из event loop в конце запроса,
+    поэтому блокировки не нужны.
+    """
+
+    def __init__(self):
+        self.requests = {}
+        self.errors = {}
+        self.latency = {}
+        self.db_queries = {}
+        self.db_seconds = {}
+        self.collectors = []
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        key = (method, route, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        if status >= 500:
+            self.errors[(method, route)] = self.errors.get((method, route), 0) + 1
+
+        histogram = self.latency.get((method, route))
+        if histogram is None:
+            histogram = self.latency[(method, route)] = Histogram()
+        histogram.observe(seconds)
+
+        if stats.db_queries:
+            self.db_queries[route] = self.db_queries.get(route, 0) + stats.db_queries
+            self.db_seconds[route] = self.db_seconds.get(route, 0.0) + stats.db_seconds
+
+    def add_collector(self, collector):
+        """
+        Регистрирует функцию, возвращающую gauge-метрики на момент экспорта:
+        список (name, help, {labels: value})
+        """
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        """Экспорт в текстовом формате Prometheus"""
+        lines = []
+
+        lines.append("# HELP ars_http_requests_total Total HTTP requests by route template")
+        lines.append("# TYPE ars_http_requests_total counter")
+        for (method, route, status), value in sorted(self.requests.items()):
+            lines.append(
+                f'ars_http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {value}'
+            )
+
+        lines.append("# HELP ars_http_request_errors_total HTTP requests answered with 5xx")
+        lines.append("# TYPE ars_http_request_errors_total counter")
+        for (method, route), value in sorted(self.errors.items()):
+            lines.append(f'ars_http_request_errors_total{{method="{method}",route="{_escape(route)}"}} {value}')
+
+        lines.append("# HELP ars_http_request_duration_seconds HTTP request latency")
+        lines.append("# TYPE ars_http_request_duration_seconds histogram")
+        for (method, route), histogram in sorted(self.latency.items()):
+            labels = f'method="{method}",route="{_escape(route)}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'ars_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'ars_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"ars_http_request_duration_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+            lines.append(f"ars_http_request_duration_seconds_count{{{labels}}} {histogram.count}")
+
+        lines.append("# HELP ars_db_queries_total SQL statements executed, by route template")
+        lines.append("# TYPE ars_db_queries_total counter")
+        for route, value in sorted(self.db_queries.items()):
+            lines.append(f'ars_db_queries_total{{route="{_escape(route)}"}} {value}')
+
+        lines.append("# HELP ars_db_query_seconds_total Time spent in SQL statements, by route template")
+        lines.append("# TYPE ars_db_query_seconds_total counter")
+        for route, value in sorted(self.db_seconds.items()):
+            lines.append(f'ars_db_query_seconds_total{{route="{_escape(route)}"}} {value:.6f}')
+
+        for collector in self.collectors:
+            for name, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in samples.items():
+                    label_str = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels)
+                    lines.append(f"{name}{{{label_str}}} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: число запросов, латентность и ошибки по шаблону маршрута.
+    Шаблон берется из scope["route"], который FastAPI заполняет при роутинге.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _request_stats.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            registry.observe_request(
+                scope["method"], route_template(scope), status, time.perf_counter() - started, stats
+            )
+
+
+def instrument_sqlalchemy():
+    """
+    Хуки before/after_cursor_execute для всех engine: число запросов
+    и время БД приписываются текущему HTTP запросу
+    """
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("ars_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["ars_query_start"].pop()
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.db_queries += 1
+            stats.db_seconds += time.perf_counter() - started
+
+    @event.listens_for(Engine, "handle_error")
+    def _handle_error(exception_context):
+        # after_cursor_execute не вызывается при ошибке - снимаем отметку старта
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("ars_query_start"):
+            conn.info["ars_query_start"].pop()
@@ -0,0 +1,222 @@
+"""
+Версионные миграции схемы каталога.
+
+Применённые версии хранятся в таблице ars_schema_migrations. Каждый шаг
+идемпотентен (проверяет наличие индексов/колонок), поэтому безопасен и для
+БД, созданных старым create_all, и для повторного запуска.
+
+    python -m main.migrations status
+    python -m main.migrations upgrade [version]
+    python -m main.migrations downgrade <version>
+"""
+import sys
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from .config import logger
+from .database import Base, engine
+from . import models  # noqa: F401 - регистрирует таблицы в Base.metadata
+
+MIGRATIONS_TABLE = "ars_schema_migrations"
+
+
+class Migration:
+    """
+    Один шаг миграции: up применяет изменения, down откатывает (если возможно)
+    """
+
+    def __init__(self, version: int, description: str, up, down=None):
+        self.version = version
+        self.description = description
+        self.up = up
+        self.down = down
+
+
+def index_exists(conn, table: str, columns) -> bool:
+    """Есть ли индекс (любой, в т.ч. созданный для FK) с таким набором колонок"""
+    columns = list(columns)
+    for index in inspect(conn).get_indexes(table):
+        if list(index["column_names"]) == columns:
+            return True
+    return False
+
+
+def index_name_exists(conn, table: str, name: str) -> bool:
+    return any(index["name"] == name for index in inspect(conn).get_indexes(table))
+
+
+def create_index(conn, name: str, table: str, columns, columns_sql: str):
+    """
+    Создание индекса, если индекса с теми же колонками еще нет.
+    В MySQL - online DDL (ALGORITHM=INPLACE, LOCK=NONE): таблица остается
+    доступной для чтения и записи во время построения индекса.
+    """
+    if index_exists(conn, table, columns):
+        logger.info(f"   index on {table}({', '.join(columns)}) already exists - skipped")
+        return
+    if conn.dialect.name == "mysql":
+        conn.execute(text(
+            f"ALTER TABLE {table} ADD INDEX {name} ({columns_sql}), ALGORITHM=INPLACE, LOCK=NONE"
+        ))
+    else:
+        conn.execute(text(f"CREATE INDEX {name} ON {table} ({columns_sql})"))
+    logger.info(f"   ✅ created index {name} on {table}({columns_sql})")
+
+
+def drop_index(conn, name: str, table: str):
+    if not index_name_exists(conn, table, name):
+        return
+    if conn.dialect.name == "mysql":
+        conn.execute(text(f"ALTER TABLE {table} DROP INDEX {name}, ALGORITHM=INPLACE, LOCK=NONE"))
+    else:
+        conn.execute(text(f"DROP INDEX {name}"))
+    logger.info(f"   🗑️ dropped index {name} on {table}")
+
+
+def column_exists(conn, table: str, column: str) -> bool:
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+
+def add_column(conn, table: str, column: str, ddl: str):
+    """Добавление колонки, если ее еще нет (в MySQL - без блокировки таблицы)"""
+    if column_exists(conn, table, column):
+        return
+    if conn.dialect.name == "mysql":
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}, ALGORITHM=INPLACE, LOCK=NONE"))
+    else:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    logger.info(f"   ✅ added column {table}.{column}")
+
+
+def drop_column(conn, table: str, column: str):
+    if column_exists(conn, table, column):
+        conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+        logger.info(f"   🗑️ dropped column {table}.{column}")
+
+
+# --- Шаги миграций ---
+
+def _baseline_up(conn):
+    # Таблицы, которые раньше создавал create_tables(); существующие не трогаются
+    Base.metadata.create_all(bind=conn, checkfirst=True)
+
+
+def _catalog_indexes_up(conn):
+    create_index(conn, "ix_apps_category_rating", "apps", ["category", "rating"], "category, rating DESC")
+    create_index(conn, "ix_apps_rating", "apps", ["rating"], "rating DESC")
+    # InnoDB сам создает индекс для FK, в остальных БД его может не быть
+    create_index(conn, "ix_screenshots_app_id", "screenshots", ["app_id"], "app_id")
+
+
+def _catalog_indexes_down(conn):
+    drop_index(conn, "ix_apps_category_rating", "apps")
+    drop_index(conn, "ix_apps_rating", "apps")
+    # Индекс по screenshots.app_id в MySQL нужен внешнему ключу - не удаляем
+    if conn.dialect.name != "mysql":
+        drop_index(conn, "ix_screenshots_app_id", "screenshots")
+
+
+def _change_tracking_up(conn):
+    add_column(conn, "apps", "change_version", "BIGINT NOT NULL DEFAULT 0")
+    add_column(conn, "apps", "updated_at", "DATETIME NULL")
+    create_index(conn, "ix_apps_change_version", "apps", ["change_version"], "change_version")
+    for table in ("app_tombstones", "catalog_change_counter"):
+        Base.metadata.tables[table].create(bind=conn, checkfirst=True)
+
+    # Уже существующие приложения - версия 1, с нее клиенты начинают синхронизацию
+    has_counter = conn.execute(text("SELECT COUNT(*) FROM catalog_change_counter")).scalar()
+    if not has_counter:
+        conn.execute(text("UPDATE apps SET change_version = 1, updated_at = :now WHERE change_version = 0"),
+                     {"now": datetime.utcnow()})
+        conn.execute(text("INSERT INTO catalog_change_counter (id, value) VALUES (1, 1)"))
+
+
+def _change_tracking_down(conn):
+    for table in ("catalog_change_counter", "app_tombstones"):
+        Base.metadata.tables[table].drop(bind=conn, checkfirst=True)
+    drop_index(conn, "ix_apps_change_version", "apps")
+    drop_column(conn, "apps", "updated_at")
+    drop_column(conn, "apps", "change_version")
+
+
+MIGRATIONS = [
+    Migration(1, "baseline schema (apps, screenshots)", _baseline_up),
+    Migration(2, "catalog indexes: apps(category, rating DESC), apps(rating DESC), screenshots(app_id)",
+              _catalog_indexes_up, _catalog_indexes_down),
+    Migration(3, "change tracking: apps.change_version, apps.updated_at, app_tombstones, catalog_change_counter",
+              _change_tracking_up, _change_tracking_down),
+]
+
+HEAD = MIGRATIONS[-1].version
+
+
+def _ensure_migrations_table(conn):
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(255) NOT NULL, "
+        "applied_at DATETIME NOT NULL)"
+    ))
+
+
+def current_version(bind=engine) -> int:
+    with bind.begin() as conn:
+        _ensure_migrations_table(conn)
+        version = conn.execute(text(f"SELECT MAX(version) FROM {MIGRATIONS_TABLE}")).scalar()
+    return version or 0
+
+
+def upgrade(target: int = HEAD, bind=engine):
+    """Применяет все миграции до target включительно"""
+    current = current_version(bind)
+    for migration in MIGRATIONS:
+        if current < migration.version <= target:
+            logger.info(f"⬆️ Migration {migration.version}: {migration.description}")
+            # DDL в MySQL не транзакционен: версия фиксируется только после
+            # успешного шага, а сами шаги идемпотентны
+            with bind.begin() as conn:
+                migration.up(conn)
+                conn.execute(
+                    text(f"INSERT INTO {MIGRATIONS_TABLE} (version, description, applied_at) "
+                         "VALUES (:version, :description, :applied_at)"),
+                    {"version": migration.version, "description": migration.description,
+                     "applied_at": datetime.utcnow()}
+                )
+    logger.info(f"✅ Schema at version {max(current, min(target, HEAD))}")
+
+
+def downgrade(target: int, bind=engine):
+    """Откатывает миграции новее target (у которых есть down)"""
+    current = current_version(bind)
+    for migration in reversed(MIGRATIONS):
+        if target < migration.version <= current:
+            if migration.down is None:
+                raise RuntimeError(f"Migration {migration.version} cannot be reverted")
+            logger.info(f"⬇️ Reverting migration {migration.version}: {migration.description}")
+            with bind.begin() as conn:
+                migration.down(conn)
+                conn.execute(
+                    text(f"DELETE FROM {MIGRATIONS_TABLE} WHERE version = :version"),
+                    {"version": migration.version}
+                )
+
+
+def status(bind=engine):
+    current = current_version(bind)
+    for migration in MIGRATIONS:
+        mark = "x" if migration.version <= current else " "
+        print(f"[{mark}] {migration.version:3d}  {migration.description}")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command == "upgrade":
+        upgrade(int(sys.argv[2]) if len(sys.argv) > 2 else HEAD)
+    elif command == "downgrade" and len(sys.argv) > 2:
+        downgrade(int(sys.argv[2]))
+    elif command == "status":
+        status()
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -1,7 +1,7 @@
 """
 SQLAlchemy модели для базы данных
 """
-from sqlalchemy import Column, Integer, String, Float, Text, Date, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Text, Date, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -24,9 +24,21 @@ class AppDB(Base):
     size = Column(String(20))
     price = Column(String(50), default='Бесплатно')
     last_update = Column(Date)
+    # Версия последнего изменения (общий счетчик каталога) и время изменения,
+    # проставляются автоматически при flush (см. changes.py)
+    change_version = Column(BigInteger, nullable=False, default=0, server_default="0", index=True)
+    updated_at = Column(DateTime)
 
     screenshots = relationship("ScreenshotDB", back_populates="app", cascade="all, delete-orphan")
 
+    # Индексы под запросы каталога (добавляются в существующие БД миграцией 2)
+    __table_args__ = (
+        # get_apps?category=... и выборка категории с сортировкой по рейтингу
+        Index("ix_apps_category_rating", "category", rating.desc()),
+        # get_featured_apps: ORDER BY rating DESC LIMIT N
+        Index("ix_apps_rating", rating.desc()),
+    )
+
 
 class ScreenshotDB(Base):
     """
@@ -35,8 +47,35 @@ class ScreenshotDB(Base):
     __tablename__ = "screenshots"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    app_id = Column(Integer, ForeignKey("apps.id", ondelete="CASCADE"))
+    app_id = Column(Integer, ForeignKey("apps.id", ondelete="CASCADE"), index=True)
     image_url = Column(String(255), nullable=False)
 
     app = relationship("AppDB", back_populates="screenshots")
 
+
+
+class AppTombstoneDB(Base):
+    """
+    Запись об удаленном приложении для синхронизации клиентов (/api/apps/changes)
+    """
+    __tablename__ = "app_tombstones"
+
+    app_id = Column(Integer, primary_key=True, autoincrement=False)
+    change_version = Column(BigInteger, nullable=False, index=True)
+    deleted_at = Column(DateTime, nullable=False)
+
+
+class ChangeCounterDB(Base):
+    """
+    Счетчик версий каталога (одна строка). Увеличивается в транзакции записи,
+    блокировка строки упорядочивает версии в порядке фиксации транзакций
+    """
+    __tablename__ = "catalog_change_counter"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    value = Column(BigInteger, nullable=False, default=0)
+
+
+# Проставление версий изменений при flush - для любой записи через ORM,
+# в том числе seed и скриптов вне FastAPI приложения
+from . import changes  # noqa: E402,F401
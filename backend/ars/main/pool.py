@@ -0,0 +1,91 @@
+"""
+Пул соединений с метриками: время ожидания checkout, занятые соединения, overflow
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+# Границы гистограммы времени ожидания соединения (мс)
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class PoolStats:
+    """
+    Потокобезопасные счетчики выдачи соединений из пула
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def record_checkout(self, wait_ms: float):
+        bucket = bisect_left(WAIT_BUCKETS_MS, wait_ms)
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total_ms += wait_ms
+            if wait_ms > self.wait_max_ms:
+                self.wait_max_ms = wait_ms
+            self.wait_buckets[bucket] += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            buckets = {f"le_{bound}ms": count for bound, count in zip(WAIT_BUCKETS_MS, self.wait_buckets)}
+            buckets["le_inf"] = self.wait_buckets[-1]
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max_ms, 3),
+                "wait_histogram": buckets,
+            }
+
+
+class MeteredQueuePool(QueuePool):
+    """
+    QueuePool, замеряющий ожидание свободного соединения.
+    _do_get блокируется, пока пул исчерпан, поэтому его длительность
+    и есть время ожидания checkout.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_timeout()
+            raise
+        self.stats.record_checkout((time.perf_counter() - started) * 1000)
+        return conn
+
+
+def pool_status(pool) -> dict:
+    """Текущее состояние пула и накопленные метрики ожидания"""
+    status = {
+        "pool_class": type(pool).__name__,
+    }
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_in": pool.checkedin(),
+            "in_use": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+        })
+    if isinstance(pool, MeteredQueuePool):
+        status.update(pool.stats.as_dict())
+    return status
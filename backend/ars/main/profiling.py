@@ -0,0 +1,200 @@
+"""
+Профилирование отдельных запросов по требованию: cProfile + tracemalloc
+"""
+import cProfile
+import hmac
+import io
+import itertools
+import marshal
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from collections import deque
+from urllib.parse import parse_qs
+
+from .config import logger, PROFILE_TOKEN, PROFILE_SAMPLE_RATE, PROFILE_BUFFER_SIZE
+
+PROFILE_HEADER = b"x-ars-profile"
+PROFILE_QUERY_PARAM = "__profile"
+# Сколько строк топа функций и аллокаций хранить в текстовой сводке
+SUMMARY_LINES = 30
+
+
+class ProfileRecord:
+    """
+    Результат профилирования одного запроса
+    """
+
+    def __init__(self, profile_id, method, path, status, duration_ms, trigger, stats_dump, cpu_summary,
+                 alloc_summary):
+        self.id = profile_id
+        self.created_at = time.time()
+        self.method = method
+        self.path = path
+        self.status = status
+        self.duration_ms = duration_ms
+        self.trigger = trigger
+        self.stats_dump = stats_dump
+        self.cpu_summary = cpu_summary
+        self.alloc_summary = alloc_summary
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "created_at": self.created_at,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "duration_ms": round(self.duration_ms, 2),
+            "trigger": self.trigger,
+        }
+
+
+class ProfileStore:
+    """
+    Кольцевой буфер последних профилей (старые вытесняются новыми)
+    """
+
+    def __init__(self, size: int):
+        self._records = deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def add(self, record: ProfileRecord):
+        with self._lock:
+            self._records.append(record)
+
+    def list(self):
+        with self._lock:
+            return [record.as_dict() for record in reversed(self._records)]
+
+    def get(self, profile_id: int):
+        with self._lock:
+            for record in self._records:
+                if record.id == profile_id:
+                    return record
+        return None
+
+
+store = ProfileStore(PROFILE_BUFFER_SIZE)
+
+
+def token_valid(token) -> bool:
+    """Профилирование по запросу и выгрузка профилей доступны только с токеном"""
+    if not PROFILE_TOKEN or token is None:
+        return False
+    # Сравнение за постоянное время: токен не подбирается по времени ответа
+    return hmac.compare_digest(token.encode("utf-8"), PROFILE_TOKEN.encode("utf-8"))
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware: профилирует запрос, если передан заголовок X-Ars-Profile
+    или параметр ?__profile= с верным токеном, либо запрос попал в выборку
+    PROFILE_SAMPLE_RATE.
+
+    cProfile и tracemalloc глобальны для потока/процесса, поэтому одновременно
+    профилируется не больше одного запроса; конкурентные корутины того же
+    event loop тоже попадают в профиль.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._busy = threading.Lock()
+
+    def _trigger(self, scope):
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return "header" if token_valid(value.decode("latin-1")) else None
+        query = scope.get("query_string", b"")
+        if PROFILE_QUERY_PARAM.encode() in query:
+            tokens = parse_qs(query.decode("latin-1")).get(PROFILE_QUERY_PARAM, [])
+            return "query" if tokens and token_valid(tokens[0]) else None
+        if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trigger = self._trigger(scope)
+        if trigger is None or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        snapshot_before = tracemalloc.take_snapshot()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.disable()
+            duration_ms = (time.perf_counter() - started) * 1000
+            snapshot_after = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+            try:
+                store.add(_build_record(
+                    scope, status, duration_ms, trigger, profiler, snapshot_before, snapshot_after
+                ))
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to store request profile: {e}")
+            finally:
+                self._busy.release()
+
+
+def _build_record(scope, status, duration_ms, trigger, profiler, snapshot_before, snapshot_after):
+    profiler.create_stats()
+    # Формат .prof (как у cProfile.dump_stats): открывается pstats/snakeviz.
+    # Сериализуем до pstats.Stats - он забирает stats у профайлера
+    stats_dump = marshal.dumps(profiler.stats)
+
+    cpu_out = io.StringIO()
+    pstats.Stats(profiler, stream=cpu_out).sort_stats("cumulative").print_stats(SUMMARY_LINES)
+
+    alloc_filter = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    alloc_diff = snapshot_after.filter_traces(alloc_filter).compare_to(
+        snapshot_before.filter_traces(alloc_filter), "lineno"
+    )
+    alloc_lines = [str(stat) for stat in alloc_diff[:SUMMARY_LINES]]
+
+    path = scope["path"]
+    if scope.get("query_string"):
+        # Токен профилирования не сохраняем
+        query = [
+            item for item in scope["query_string"].decode("latin-1").split("&")
+            if not item.startswith(PROFILE_QUERY_PARAM + "=")
+        ]
+        if query:
+            path = f"{path}?{'&'.join(query)}"
+
+    return ProfileRecord(
+        profile_id=store.next_id(),
+        method=scope["method"],
+        path=path,
+        status=status,
+        duration_ms=duration_ms,
+        trigger=trigger,
+        stats_dump=stats_dump,
+        cpu_summary=cpu_out.getvalue(),
+        alloc_summary="\n".join(alloc_lines),
+    )
@@ -74,6 +74,16 @@ class App(BaseModel):
     screenshots: List[str] = []
 
 
+class AppChanges(BaseModel):
+    """
+    Схема ответа инкрементальной синхронизации каталога
+    """
+    version: int
+    upserts: List[App] = []
+    deleted: List[int] = []
+    has_more: bool = False
+
+
 class MessageResponse(BaseModel):
     """
     Схема для простых ответов с сообщением
@@ -0,0 +1,170 @@
+"""
+Журнал медленных SQL запросов с автоматическим EXPLAIN
+"""
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import logger, SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN, SLOW_QUERY_MAX_SHAPES
+from .metrics import current_route
+
+# execution option, которой помечаются собственные EXPLAIN запросы журнала
+SKIP_OPTION = "ars_skip_slow_log"
+# Сколько последних медленных запросов хранить целиком
+RECENT_SIZE = 200
+
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_RE = re.compile(r"%\(\w+\)s|%s|\?|:\w+")
+_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_sql(statement: str) -> str:
+    """
+    Форма запроса: литералы и параметры заменены на ?, списки IN свернуты,
+    пробелы нормализованы. Запросы одной формы агрегируются вместе.
+    """
+    sql = _STRING_RE.sub("?", statement)
+    sql = _PARAM_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("IN (...)", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+
+def params_shape(parameters, executemany: bool = False):
+    """Типы параметров без значений (значения могут содержать персональные данные)"""
+    if executemany:
+        rows = list(parameters or [])
+        return {"executemany": len(rows), "row": params_shape(rows[0]) if rows else None}
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+class QueryShapeStats:
+    """
+    Агрегат по одной форме запроса
+    """
+
+    def __init__(self, shape: str, statement: str):
+        self.shape = shape
+        self.statement = statement
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.first_seen = time.time()
+        self.last_seen = None
+        self.params_shape = None
+        self.endpoints = {}
+        self.explain = None
+
+    def as_dict(self) -> dict:
+        return {
+            "sql": self.shape,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 2),
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 2),
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "params_shape": self.params_shape,
+            "endpoints": self.endpoints,
+            "explain": self.explain,
+        }
+
+
+class SlowQueryLog:
+    """
+    Хранилище медленных запросов: агрегаты по форме + последние события.
+    EXPLAIN выполняется один раз на форму в отдельном потоке и отдельном
+    соединении, чтобы не задерживать исходный запрос.
+    """
+
+    def __init__(self, threshold_ms: float, explain: bool, max_shapes: int):
+        self.threshold_ms = threshold_ms
+        self.explain_enabled = explain
+        self.max_shapes = max_shapes
+        self.shapes = {}
+        self.recent = deque(maxlen=RECENT_SIZE)
+        self._lock = threading.Lock()
+        self._explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ars-explain")
+
+    def record(self, engine, statement, parameters, executemany, duration_ms, endpoint):
+        shape = normalize_sql(statement)
+        shape_params = params_shape(parameters, executemany)
+        endpoint = endpoint or "<background>"
+
+        with self._lock:
+            stats = self.shapes.get(shape)
+            new_shape = stats is None
+            if new_shape:
+                if len(self.shapes) >= self.max_shapes:
+                    return
+                stats = self.shapes[shape] = QueryShapeStats(shape, statement)
+            stats.count += 1
+            stats.total_ms += duration_ms
+            stats.max_ms = max(stats.max_ms, duration_ms)
+            stats.last_seen = time.time()
+            stats.params_shape = shape_params
+            stats.endpoints[endpoint] = stats.endpoints.get(endpoint, 0) + 1
+            self.recent.append({
+                "sql": shape,
+                "duration_ms": round(duration_ms, 2),
+                "params_shape": shape_params,
+                "endpoint": endpoint,
+                "at": stats.last_seen,
+            })
+
+        logger.warning(f"🐢 Slow query {duration_ms:.1f} ms [{endpoint}]: {shape}")
+
+        if new_shape and self.explain_enabled and not executemany and shape.upper().startswith("SELECT"):
+            self._explainer.submit(self._explain, engine, stats, statement, parameters)
+
+    @staticmethod
+    def _explain(engine, stats: QueryShapeStats, statement, parameters):
+        prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+        try:
+            with engine.connect() as conn:
+                result = conn.execution_options(**{SKIP_OPTION: True}).exec_driver_sql(
+                    prefix + statement, parameters
+                )
+                stats.explain = [dict(row._mapping) for row in result]
+        except Exception as e:
+            stats.explain = {"error": str(e)}
+
+    def report(self) -> dict:
+        with self._lock:
+            shapes = sorted(self.shapes.values(), key=lambda s: s.total_ms, reverse=True)
+            return {
+                "threshold_ms": self.threshold_ms,
+                "shapes": [s.as_dict() for s in shapes],
+                "recent": list(reversed(self.recent)),
+            }
+
+
+slow_log = SlowQueryLog(SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN, SLOW_QUERY_MAX_SHAPES)
+
+
+def instrument_slow_queries():
+    """Хуки SQLAlchemy: замер каждого запроса и запись медленных в журнал"""
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._ars_slow_started = time.perf_counter()
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration_ms = (time.perf_counter() - context._ars_slow_started) * 1000
+        if duration_ms < slow_log.threshold_ms or context.execution_options.get(SKIP_OPTION):
+            return
+        slow_log.record(conn.engine, statement, parameters, executemany, duration_ms, current_route())
@@ -0,0 +1,393 @@
+"""
+Общий read-only снимок каталога для многопроцессного режима (serve.py).
+
+Снимок - файл с заранее сериализованными JSON ответами каталога, который все
+воркеры открывают через mmap: страницы файла лежат в page cache ОС один раз,
+а не копируются в память каждого процесса.
+
+Формат файла (little-endian):
+    заголовок   HEADER: magic, generation, created_at, число приложений,
+                смещение/длина JSON категорий и JSON избранных приложений
+    индекс      INDEX_ENTRY на приложение, отсортирован по id:
+                id, номер категории, рейтинг, смещение и длина JSON приложения,
+                смещение и длина текста для поиска
+    данные      JSON приложений, категорий и избранного, затем тексты для
+                поиска (название и описание в нижнем регистре) подряд
+
+Рядом лежит файл поколения (<path>.gen, 8 байт), тоже отображенный в память
+всех воркеров. После записи в каталог воркер пересобирает снимок, атомарно
+подменяет файл и увеличивает счетчик - остальные воркеры видят новое поколение
+при следующем запросе и переоткрывают снимок. Если файла поколения нет
+(edge-узел, куда снимок копируется извне), новый снимок определяется по
+смене inode/mtime файла.
+
+Выгрузка и просмотр снимка:
+
+    python -m main.snapshot export [path]
+    python -m main.snapshot info [path]
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy.orm import selectinload
+
+from .config import logger, SNAPSHOT_PATH, SNAPSHOT_CHECK_SECONDS
+from .models import AppDB
+from .schemas import App
+
+try:
+    import fcntl
+except ImportError:  # Windows: запись снимка без межпроцессной блокировки
+    fcntl = None
+
+MAGIC = b"ARSSNAP2"
+HEADER = struct.Struct("<8sQdIQIQI")
+INDEX_ENTRY = struct.Struct("<IHfQIQI")
+GENERATION = struct.Struct("<Q")
+# Сколько приложений отдает /api/featured
+FEATURED_LIMIT = 5
+
+
+def app_payload(db_app: AppDB) -> dict:
+    """Поля ответа API для приложения (как в endpoints main.py)"""
+    return {
+        "id": db_app.id,
+        "name": db_app.name,
+        "developer": db_app.developer,
+        "category": db_app.category,
+        "age_rating": db_app.age_rating,
+        "description": db_app.description,
+        "icon_url": db_app.icon_url,
+        "rating": db_app.rating,
+        "version": db_app.version,
+        "size": db_app.size,
+        "price": db_app.price,
+        "last_update": db_app.last_update,
+        "screenshots": [s.image_url for s in db_app.screenshots]
+    }
+
+
+def render_app(db_app: AppDB) -> bytes:
+    """JSON приложения в том же виде, что отдает FastAPI для response_model=App"""
+    return App(**app_payload(db_app)).model_dump_json().encode("utf-8")
+
+
+def render_list(items) -> bytes:
+    return b"[" + b",".join(items) + b"]"
+
+
+def select_featured(db_apps):
+    """Приложения для /api/featured: наивысший рейтинг, при равенстве - меньший id"""
+    return sorted(db_apps, key=lambda db_app: (-(db_app.rating or 0), db_app.id))[:FEATURED_LIMIT]
+
+
+def search_text(db_app: AppDB) -> bytes:
+    """
+    Текст, по которому ищет /api/search. Название и описание разделены
+    переводом строки, а тексты приложений - нулевым байтом, чтобы совпадение
+    не могло пересечь границу поля
+    """
+    text = f"{db_app.name}\n{db_app.description or ''}".lower().replace("\0", " ")
+    return text.encode("utf-8") + b"\0"
+
+
+def _read_generation(path: str) -> int:
+    try:
+        with open(path, "rb") as f:
+            data = f.read(GENERATION.size)
+    except FileNotFoundError:
+        return 0
+    return GENERATION.unpack(data)[0] if len(data) == GENERATION.size else 0
+
+
+def _write_generation(path: str, generation: int):
+    """Счетчик меняется на месте, чтобы mmap воркеров сразу увидел новое значение"""
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(GENERATION.pack(0))
+    with open(path, "r+b") as f:
+        with mmap.mmap(f.fileno(), GENERATION.size) as mm:
+            GENERATION.pack_into(mm, 0, generation)
+
+
+def write_snapshot(db, path: str = SNAPSHOT_PATH) -> int:
+    """
+    Выгрузка каталога из БД в файл снимка. Возвращает номер нового поколения.
+    Файл пишется во временный и подменяется через os.replace - читатели
+    всегда видят либо старый, либо новый снимок целиком.
+    """
+    lock_file = open(path + ".lock", "a")
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        db_apps = db.query(AppDB).options(selectinload(AppDB.screenshots)).order_by(AppDB.id).all()
+        categories = sorted({db_app.category for db_app in db_apps})
+        category_index = {category: index for index, category in enumerate(categories)}
+
+        rendered = [render_app(db_app) for db_app in db_apps]
+        rendered_by_id = {db_app.id: app_json for db_app, app_json in zip(db_apps, rendered)}
+        featured_json = render_list([rendered_by_id[db_app.id] for db_app in select_featured(db_apps)])
+        categories_json = json.dumps(categories, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+        generation = _read_generation(path + ".gen") + 1
+        data_start = HEADER.size + INDEX_ENTRY.size * len(db_apps)
+        blob = bytearray()
+        app_spans = []
+        for app_json in rendered:
+            app_spans.append((data_start + len(blob), len(app_json)))
+            blob += app_json
+        categories_offset = data_start + len(blob)
+        blob += categories_json
+        featured_offset = data_start + len(blob)
+        blob += featured_json
+
+        entries = []
+        for db_app, (offset, length) in zip(db_apps, app_spans):
+            text = search_text(db_app)
+            entries.append(INDEX_ENTRY.pack(
+                db_app.id, category_index[db_app.category], db_app.rating or 0.0,
+                offset, length, data_start + len(blob), len(text)
+            ))
+            blob += text
+
+        header = HEADER.pack(
+            MAGIC, generation, time.time(), len(db_apps),
+            categories_offset, len(categories_json), featured_offset, len(featured_json)
+        )
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            f.write(b"".join(entries))
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        _write_generation(path + ".gen", generation)
+    finally:
+        lock_file.close()
+
+    logger.info(f"📦 Catalog snapshot generation {generation}: {len(db_apps)} apps, {len(blob)} bytes")
+    return generation
+
+
+class CatalogSnapshot:
+    """
+    Открытый через mmap снимок: поиск приложения двоичным поиском по индексу
+    в отображенном файле, без разбора JSON и без копии каталога в процессе.
+
+    Ответы на одно приложение, категории и избранное - memoryview на страницы
+    файла (без копирования до записи в сокет). Поэтому старый снимок при
+    перезагрузке не закрывается явно: mmap освобождается, когда уходит
+    последний ответ, который на него ссылается.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+        (magic, self.generation, self.created_at, self.count,
+         categories_offset, categories_len, featured_offset, featured_len) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot (format {magic!r})")
+        self._categories = (categories_offset, categories_len)
+        self._featured = (featured_offset, featured_len)
+
+    def _entry(self, position: int):
+        return INDEX_ENTRY.unpack_from(self._mm, HEADER.size + position * INDEX_ENTRY.size)
+
+    def _slice(self, offset: int, length: int) -> memoryview:
+        return self._view[offset:offset + length]
+
+    def _entries(self):
+        index = self._view[HEADER.size:HEADER.size + self.count * INDEX_ENTRY.size]
+        return INDEX_ENTRY.iter_unpack(index)
+
+    def app_json(self, app_id: int) -> Optional[memoryview]:
+        low, high = 0, self.count - 1
+        while low <= high:
+            middle = (low + high) // 2
+            entry_id, _, _, offset, length, _, _ = self._entry(middle)
+            if entry_id == app_id:
+                return self._slice(offset, length)
+            if entry_id < app_id:
+                low = middle + 1
+            else:
+                high = middle - 1
+        return None
+
+    def apps_json(self, category: Optional[str] = None) -> bytes:
+        category_index = None
+        if category:
+            categories = json.loads(bytes(self.categories_json()))
+            if category not in categories:
+                return b"[]"
+            category_index = categories.index(category)
+        return render_list([
+            self._slice(offset, length)
+            for _, entry_category, _, offset, length, _, _ in self._entries()
+            if category_index is None or entry_category == category_index
+        ])
+
+    def search_json(self, query: str) -> bytes:
+        """
+        Подстрочный поиск по названию и описанию (как ilike в БД):
+        mmap.find по секции текстов, без разбора JSON приложений
+        """
+        needle = query.strip().lower().encode("utf-8")
+        if not needle:
+            return self.apps_json()
+        if b"\0" in needle or b"\n" in needle or not self.count:
+            return b"[]"
+        _, _, _, _, _, start, _ = self._entry(0)
+        _, _, _, _, _, last_offset, last_length = self._entry(self.count - 1)
+        end = last_offset + last_length
+
+        found = []
+        position = self._mm.find(needle, start, end)
+        while position != -1:
+            # Приложение, в текст которого попало совпадение (индекс отсортирован по смещениям)
+            low, high = 0, self.count - 1
+            while low < high:
+                middle = (low + high + 1) // 2
+                if self._entry(middle)[5] <= position:
+                    low = middle
+                else:
+                    high = middle - 1
+            _, _, _, offset, length, search_offset, search_length = self._entry(low)
+            found.append(self._slice(offset, length))
+            position = self._mm.find(needle, search_offset + search_length, end)
+        return render_list(found)
+
+    def categories_json(self) -> memoryview:
+        return self._slice(*self._categories)
+
+    def featured_json(self) -> memoryview:
+        return self._slice(*self._featured)
+
+    def info(self) -> dict:
+        return {
+            "path": self.path,
+            "generation": self.generation,
+            "created_at": self.created_at,
+            "apps": self.count,
+            "bytes": len(self._mm),
+            "categories": json.loads(bytes(self.categories_json())),
+        }
+
+
+class SnapshotManager:
+    """
+    Текущий снимок процесса. При каждом обращении сверяет поколение из
+    общего файла-счетчика и переоткрывает снимок, если он сменился.
+    Без файла-счетчика раз в SNAPSHOT_CHECK_SECONDS проверяет, не подменили
+    ли сам файл снимка.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._snapshot = None
+        self._generation_mm = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _published_generation(self) -> Optional[int]:
+        if self._generation_mm is None:
+            try:
+                with open(self.path + ".gen", "rb") as f:
+                    self._generation_mm = mmap.mmap(f.fileno(), GENERATION.size, access=mmap.ACCESS_READ)
+            except (FileNotFoundError, ValueError):
+                return None
+        return GENERATION.unpack_from(self._generation_mm, 0)[0]
+
+    def _file_replaced(self, snapshot: CatalogSnapshot) -> bool:
+        now = time.monotonic()
+        if now - self._checked_at < SNAPSHOT_CHECK_SECONDS:
+            return False
+        self._checked_at = now
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size) != snapshot.file_id
+
+    def current(self) -> Optional[CatalogSnapshot]:
+        """Актуальный снимок или None (режим выключен или снимок еще не выгружен)"""
+        if not self.enabled:
+            return None
+        published = self._published_generation()
+        snapshot = self._snapshot
+        if snapshot is not None:
+            if published is None:
+                if not self._file_replaced(snapshot):
+                    return snapshot
+            elif snapshot.generation == published:
+                return snapshot
+        with self._lock:
+            if self._snapshot is snapshot:
+                try:
+                    self._snapshot = CatalogSnapshot(self.path)
+                except (FileNotFoundError, ValueError) as e:
+                    logger.warning(f"⚠️ Catalog snapshot unavailable: {e}")
+                    return snapshot
+                logger.info(f"🔄 Catalog snapshot generation {self._snapshot.generation} loaded")
+            return self._snapshot
+
+    def refresh(self, session_factory):
+        """Пересборка снимка после записи в каталог (из primary)"""
+        if not self.enabled:
+            return
+        db = session_factory()
+        try:
+            write_snapshot(db, self.path)
+        except Exception as e:
+            logger.error(f"❌ Catalog snapshot refresh failed: {e}")
+        finally:
+            db.close()
+
+    def status(self) -> dict:
+        snapshot = self.current()
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "pid": os.getpid(),
+            "generation": snapshot.generation if snapshot else None,
+            "created_at": snapshot.created_at if snapshot else None,
+            "apps": snapshot.count if snapshot else None,
+        }
+
+
+snapshots = SnapshotManager(SNAPSHOT_PATH)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "info"
+    target = sys.argv[2] if len(sys.argv) > 2 else SNAPSHOT_PATH
+    if not target:
+        logger.error("Snapshot path required: argument or ARS_SNAPSHOT_PATH")
+        sys.exit(1)
+    if command == "export":
+        from .database import SessionLocal
+        session = SessionLocal(use_primary=True)
+        try:
+            write_snapshot(session, target)
+        finally:
+            session.close()
+    elif command == "info":
+        print(json.dumps(CatalogSnapshot(target).info(), ensure_ascii=False, indent=2))
+    else:
+        print(__doc__)
+        sys.exit(1)
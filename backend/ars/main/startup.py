@@ -0,0 +1,163 @@
+"""
+Замер фаз запуска сервера и прогрев пула соединений / кэшей
+"""
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from sqlalchemy.orm import configure_mappers
+
+from .config import logger, STARTUP_TARGET_MS
+from .models import AppDB
+
+
+def process_age_seconds() -> Optional[float]:
+    """
+    Сколько секунд назад ОС запустила текущий процесс (Linux, /proc);
+    None, если узнать нельзя
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            stat = f.read()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        # Имя процесса в скобках может содержать пробелы - поля считаются после ")";
+        # starttime - 22-е поле, в тиках с загрузки системы
+        start_ticks = int(stat.rsplit(")", 1)[1].split()[19])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+# Точка отсчета для отчета (шкала time.perf_counter): запуск процесса ОС,
+# включая старт интерпретатора и импорты до этого модуля. Где /proc нет
+# (Windows, macOS), отсчет идет от импорта модуля
+_process_age = process_age_seconds()
+START_ORIGIN = "process_start" if _process_age is not None else "import"
+PROCESS_START = time.perf_counter() - (_process_age or 0.0)
+
+
+class StartupReport:
+    """
+    Отчет о времени запуска: длительность каждой фазы и время до первого запроса
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.phases = []
+        self.ready_ms = None
+        self.first_request_ms = None
+
+    @staticmethod
+    def _since_start() -> float:
+        return (time.perf_counter() - PROCESS_START) * 1000
+
+    @contextmanager
+    def phase(self, name: str):
+        """Замер синхронной фазы запуска"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, (time.perf_counter() - started) * 1000))
+
+    async def run_concurrently(self, **steps):
+        """
+        Параллельный запуск блокирующих шагов в потоках.
+        Каждый шаг замеряется отдельно, общая длительность - как отдельная фаза.
+        """
+        async def timed(name, func):
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(func)
+            except Exception as e:
+                logger.warning(f"⚠️ Startup step '{name}' failed: {e}")
+            finally:
+                self.phases.append((name, (time.perf_counter() - started) * 1000))
+
+        with self.phase("concurrent_total"):
+            await asyncio.gather(*(timed(name, func) for name, func in steps.items()))
+
+    def mark_ready(self):
+        """Приложение готово принимать запросы"""
+        self.ready_ms = self._since_start()
+        logger.info(f"⏱️ Startup report ({self.mode} mode):")
+        for name, duration in self.phases:
+            logger.info(f"   {name:<24} {duration:8.1f} ms")
+        logger.info(f"   {'ready':<24} {self.ready_ms:8.1f} ms since {START_ORIGIN.replace('_', ' ')}")
+
+    def mark_first_request(self):
+        """Обслужен первый запрос - фиксируем time-to-first-request"""
+        self.first_request_ms = self._since_start()
+        if self.first_request_ms <= STARTUP_TARGET_MS:
+            logger.info(
+                f"⏱️ Time to first request: {self.first_request_ms:.1f} ms "
+                f"(target {STARTUP_TARGET_MS:.0f} ms)"
+            )
+        else:
+            logger.warning(
+                f"⚠️ Time to first request: {self.first_request_ms:.1f} ms "
+                f"exceeds target {STARTUP_TARGET_MS:.0f} ms"
+            )
+
+    def as_dict(self) -> dict:
+        return {
+            "mode": self.mode,
+            "measured_from": START_ORIGIN,
+            "phases_ms": {name: round(duration, 1) for name, duration in self.phases},
+            "ready_ms": round(self.ready_ms, 1) if self.ready_ms is not None else None,
+            "first_request_ms": (
+                round(self.first_request_ms, 1) if self.first_request_ms is not None else None
+            ),
+            "target_ms": STARTUP_TARGET_MS,
+            "target_met": (
+                self.first_request_ms <= STARTUP_TARGET_MS
+                if self.first_request_ms is not None else None
+            ),
+        }
+
+
+class FirstRequestTimer:
+    """
+    ASGI middleware: фиксирует момент завершения первого HTTP запроса.
+    После первого запроса сводится к одной проверке флага.
+    """
+
+    def __init__(self, app, report: StartupReport):
+        self.app = app
+        self.report = report
+        self.done = False
+
+    async def __call__(self, scope, receive, send):
+        if self.done or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if not self.done:
+                self.done = True
+                self.report.mark_first_request()
+
+
+def warm_pool(engine, connections: int):
+    """Открывает соединения заранее, чтобы первые запросы не ждали connect"""
+    opened = [engine.connect() for _ in range(connections)]
+    for conn in opened:
+        conn.close()
+
+
+def warm_catalog(session_factory):
+    """
+    Прогрев ORM: конфигурация мапперов и кэш скомпилированных запросов
+    для горячих endpoints каталога
+    """
+    configure_mappers()
+    db = session_factory()
+    try:
+        db.query(AppDB).order_by(AppDB.rating.desc()).limit(5).all()
+        db.query(AppDB.category).distinct().all()
+    finally:
+        db.close()
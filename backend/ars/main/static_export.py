@@ -0,0 +1,213 @@
+"""
+Статический экспорт read-only endpoints каталога в JSON файлы.
+
+Каждый ответ (/api/apps, /api/apps/{id}, /api/categories, /api/featured и
+/api/apps?category=...) пишется в файл с хешем содержимого в имени рядом с
+заранее сжатыми копиями (.gz и .br, если установлен brotli). Такие файлы
+можно отдавать с любого файлового сервера или CDN с бессрочным кэшем.
+manifest.json (короткий кэш) сопоставляет endpoint с текущим файлом:
+
+    {"files": {"/api/apps/3": {"path": "api/apps/3.1f0c9a2b7d4e5f60.json", ...}}}
+
+После записи в каталог перерисовываются только затронутые ответы: карточка
+приложения, листинги его старой и новой категории и общие списки. Файл
+переписывается, только если изменилось содержимое.
+
+    python -m main.static_export [directory]
+"""
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+
+from sqlalchemy.orm import selectinload
+
+from .config import logger, STATIC_EXPORT_DIR, STATIC_EXPORT_KEEP_SECONDS
+from .models import AppDB
+from .snapshot import render_app, render_list, select_featured
+
+try:
+    import fcntl
+except ImportError:  # Windows: экспорт без межпроцессной блокировки
+    fcntl = None
+
+try:
+    import brotli
+except ImportError:  # brotli не обязателен - тогда только gzip
+    brotli = None
+
+MANIFEST = "manifest.json"
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def category_key(category: str) -> str:
+    return f"/api/apps?category={category}"
+
+
+def _category_file(category: str) -> str:
+    # Имя файла не зависит от кириллицы и спецсимволов в названии категории
+    return "api/category/" + hashlib.sha1(category.encode("utf-8")).hexdigest()[:12]
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class StaticExporter:
+    """
+    Экспорт ответов каталога в каталог файлов с манифестом
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_page(self, manifest: dict, key: str, base: str, data: bytes) -> bool:
+        """Пишет ответ, если его содержимое изменилось. True - файл обновлен"""
+        digest = content_hash(data)
+        current = manifest["files"].get(key)
+        relative = f"{base}.{digest}.json"
+        path = os.path.join(self.directory, relative)
+        if current and current["hash"] == digest and os.path.exists(path):
+            return False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, data)
+        entry = {"path": relative, "hash": digest, "bytes": len(data)}
+        # mtime=0 - одинаковое содержимое дает одинаковые .gz файлы
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        _write_atomic(path + ".gz", compressed)
+        entry["gzip_bytes"] = len(compressed)
+        if brotli is not None:
+            compressed = brotli.compress(data, quality=11)
+            _write_atomic(path + ".br", compressed)
+            entry["br_bytes"] = len(compressed)
+        manifest["files"][key] = entry
+        return True
+
+    def _collect_garbage(self, manifest: dict):
+        """
+        Удаляет файлы, на которые манифест больше не ссылается. Удаляются только
+        файлы старше STATIC_EXPORT_KEEP_SECONDS - клиенты со старым манифестом
+        успевают их дочитать.
+        """
+        referenced = {entry["path"] for entry in manifest["files"].values()}
+        deadline = time.time() - STATIC_EXPORT_KEEP_SECONDS
+        api_dir = os.path.join(self.directory, "api")
+        for root, _, files in os.walk(api_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                for suffix in (".gz", ".br"):
+                    if relative.endswith(suffix):
+                        relative = relative[:-len(suffix)]
+                if relative not in referenced and os.path.getmtime(path) < deadline:
+                    os.remove(path)
+
+    def export(self, db, app_ids=None, categories=None):
+        """
+        Экспорт ответов каталога. Без app_ids - полный экспорт всех файлов,
+        иначе только карточки app_ids, листинги categories и общие списки.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        lock_file = open(os.path.join(self.directory, ".lock"), "a")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            manifest = self._load_manifest()
+            full = app_ids is None or manifest is None
+            if manifest is None:
+                manifest = {"files": {}}
+
+            db_apps = db.query(AppDB).options(selectinload(AppDB.screenshots)).order_by(AppDB.id).all()
+            rendered = {db_app.id: render_app(db_app) for db_app in db_apps}
+            all_categories = sorted({db_app.category for db_app in db_apps})
+
+            pages = {
+                "/api/apps": ("api/apps", render_list(rendered.values())),
+                "/api/featured": ("api/featured", render_list(
+                    rendered[db_app.id] for db_app in select_featured(db_apps)
+                )),
+                "/api/categories": ("api/categories", json.dumps(
+                    all_categories, ensure_ascii=False, separators=(",", ":")
+                ).encode("utf-8")),
+            }
+            for category in (all_categories if full else set(categories or ()) & set(all_categories)):
+                pages[category_key(category)] = (_category_file(category), render_list(
+                    rendered[db_app.id] for db_app in db_apps if db_app.category == category
+                ))
+            for app_id in (rendered if full else app_ids):
+                if app_id in rendered:
+                    pages[f"/api/apps/{app_id}"] = (f"api/apps/{app_id}", rendered[app_id])
+
+            # Удаленные приложения и опустевшие категории исчезают из манифеста
+            if full:
+                stale = set(manifest["files"]) - set(pages)
+            else:
+                stale = {f"/api/apps/{app_id}" for app_id in app_ids if app_id not in rendered}
+                stale |= {category_key(category) for category in categories or ()
+                          if category not in all_categories}
+            for key in stale:
+                manifest["files"].pop(key, None)
+
+            written = sum(self._write_page(manifest, key, base, data) for key, (base, data) in pages.items())
+            if written or stale:
+                manifest["generated_at"] = time.time()
+                _write_atomic(
+                    os.path.join(self.directory, MANIFEST),
+                    json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8")
+                )
+            self._collect_garbage(manifest)
+        finally:
+            lock_file.close()
+
+        logger.info(f"🗂️ Static export: {written} files written, {len(stale)} removed "
+                    f"({'full' if full else 'incremental'})")
+        return written
+
+    def refresh(self, session_factory, app_id: int, categories):
+        """Инкрементальный экспорт после записи в каталог (из primary)"""
+        if not self.enabled:
+            return
+        db = session_factory()
+        try:
+            self.export(db, app_ids=[app_id], categories=[c for c in categories if c])
+        except Exception as e:
+            logger.error(f"❌ Static export failed: {e}")
+        finally:
+            db.close()
+
+
+static_exporter = StaticExporter(STATIC_EXPORT_DIR)
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else STATIC_EXPORT_DIR
+    if not target:
+        logger.error("Usage: python -m main.static_export <directory> (or set ARS_STATIC_EXPORT_DIR)")
+        sys.exit(1)
+    from .database import SessionLocal
+    session = SessionLocal(use_primary=True)
+    try:
+        StaticExporter(target).export(session)
+    finally:
+        session.close()
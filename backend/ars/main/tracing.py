@@ -0,0 +1,257 @@
+"""
+Трассировка запросов (W3C traceparent): спаны HTTP обработчиков и SQL запросов.
+
+Каталог (ars) и сервис отзывов (vad) принимают заголовок traceparent и пишут
+спаны с общим trace_id в JSON Lines, поэтому загрузку одной страницы можно
+собрать из обоих файлов:
+
+    python -m main.tracing traces-ars.jsonl ../vad/traces-vad.jsonl
+"""
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque, defaultdict
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import logger, TRACE_EXPORT, TRACE_FILE, TRACE_SAMPLE_RATE
+from .metrics import route_template
+from .slow_queries import normalize_sql
+
+SERVICE_NAME = "ars-catalog"
+# Сколько спанов держать в памяти для /debug/traces
+MEMORY_SPANS = 5000
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    """
+    Один спан: операция с началом, длительностью и родителем
+    """
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start", "_started", "duration_ms",
+                 "attributes", "error")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, kind: str):
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms = None
+        self.attributes = {}
+        self.error = None
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+        exporter.export(self)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def as_dict(self) -> dict:
+        return {
+            "service": SERVICE_NAME,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class SpanExporter:
+    """
+    Экспорт завершенных спанов в JSON Lines файл и/или кольцевой буфер в памяти
+    """
+
+    def __init__(self, mode: str, path: str):
+        self.mode = mode
+        self.memory = deque(maxlen=MEMORY_SPANS)
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1) if mode == "file" else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("file", "memory")
+
+    def export(self, span: Span):
+        record = span.as_dict()
+        self.memory.append(record)
+        if self._file is not None:
+            line = json.dumps(record, ensure_ascii=False, default=str)
+            with self._lock:
+                self._file.write(line + "\n")
+
+    def recent(self, trace_id: Optional[str] = None):
+        spans = list(self.memory)
+        if trace_id:
+            spans = [span for span in spans if span["trace_id"] == trace_id]
+        return spans
+
+
+exporter = SpanExporter(TRACE_EXPORT, TRACE_FILE)
+_current_span: ContextVar[Optional[Span]] = ContextVar("ars_current_span", default=None)
+
+
+def parse_traceparent(value: Optional[str]):
+    """(trace_id, parent_span_id, sampled) из заголовка traceparent или None"""
+    if not value:
+        return None
+    match = _TRACEPARENT_RE.match(value.strip().lower())
+    if not match or match.group(1) == "0" * 32:
+        return None
+    return match.group(1), match.group(2), int(match.group(3), 16) & 1 == 1
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware: серверный спан на каждый HTTP запрос.
+    Продолжает трассу из входящего traceparent или начинает новую
+    и возвращает traceparent клиенту в заголовке traceresponse.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                incoming = parse_traceparent(value.decode("latin-1"))
+                break
+
+        if incoming:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id, sampled = _new_id(128), None, random.random() < TRACE_SAMPLE_RATE
+        if not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        span = Span(trace_id, parent_id, f"{scope['method']} {scope['path']}", "server")
+        token = _current_span.set(span)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                span.attributes["http.status_code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"traceresponse", span.traceparent().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            span.error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            route = route_template(scope)
+            span.name = f"{scope['method']} {route}"
+            span.attributes["http.method"] = scope["method"]
+            span.attributes["http.route"] = route
+            span.attributes["http.target"] = scope["path"]
+            span.finish()
+
+
+def instrument_sqlalchemy_tracing():
+    """Дочерний спан на каждый SQL запрос внутри трассируемого HTTP запроса"""
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        parent = _current_span.get()
+        if parent is None:
+            context._ars_span = None
+            return
+        span = Span(parent.trace_id, parent.span_id, "db.query", "client")
+        span.attributes["db.system"] = conn.engine.dialect.name
+        span.attributes["db.statement"] = normalize_sql(statement)
+        span.attributes["db.url"] = conn.engine.url.render_as_string(hide_password=True)
+        context._ars_span = span
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_ars_span", None)
+        if span is not None:
+            span.finish()
+
+    @event.listens_for(Engine, "handle_error")
+    def _handle_error(exception_context):
+        span = getattr(exception_context.execution_context, "_ars_span", None)
+        if span is not None:
+            span.error = repr(exception_context.original_exception)
+            span.finish()
+
+
+def print_trace_report(paths):
+    """
+    Офлайн-анализ: дерево спанов каждой трассы из нескольких файлов
+    и критический путь (цепочка самых долгих дочерних спанов)
+    """
+    traces = defaultdict(list)
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    span = json.loads(line)
+                    traces[span["trace_id"]].append(span)
+
+    for trace_id, spans in traces.items():
+        children = defaultdict(list)
+        ids = {span["span_id"] for span in spans}
+        roots = []
+        for span in sorted(spans, key=lambda s: s["start"]):
+            if span["parent_id"] in ids:
+                children[span["parent_id"]].append(span)
+            else:
+                roots.append(span)
+        trace_start = min(span["start"] for span in spans)
+        trace_end = max(span["start"] + span["duration_ms"] / 1000 for span in spans)
+        print(f"trace {trace_id}  {(trace_end - trace_start) * 1000:.1f} ms, {len(spans)} spans")
+
+        def walk(span, depth):
+            offset = (span["start"] - trace_start) * 1000
+            label = span["attributes"].get("db.statement") or span["name"]
+            print(f"  {'  ' * depth}+{offset:7.1f} ms {span['duration_ms']:8.1f} ms "
+                  f"[{span['service']}] {label[:100]}")
+            for child in children[span["span_id"]]:
+                walk(child, depth + 1)
+
+        for root in roots:
+            walk(root, 0)
+
+        # Критический путь: от самого долгого корня вниз по самому долгому потомку
+        path = []
+        span = max(roots, key=lambda s: s["duration_ms"], default=None)
+        while span is not None:
+            path.append(f"{span['name']} ({span['duration_ms']:.1f} ms)")
+            span = max(children[span["span_id"]], key=lambda s: s["duration_ms"], default=None)
+        print(f"  critical path: {' -> '.join(path)}\n")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        logger.error("Usage: python -m main.tracing <spans.jsonl> [<spans.jsonl> ...]")
+        sys.exit(1)
+    print_trace_report(sys.argv[1:])
@@ -0,0 +1,55 @@
+"""
+Production-запуск каталога в несколько процессов
+
+Родительский процесс выгружает каталог из БД в файл снимка и запускает
+N воркеров uvicorn. Воркеры читают каталог из общего снимка через mmap
+(см. main/snapshot.py), а запись в любом воркере пересобирает снимок
+и увеличивает счетчик поколения, по которому его подхватывают остальные.
+С ARS_EDGE_MODE=1 выгрузка пропускается - воркеры читают готовый снимок.
+
+    python serve.py --workers 4 --port 8000
+"""
+import argparse
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=None, help="число процессов (ARS_WORKERS, по умолчанию - ядра)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--snapshot", default=None, help="путь к файлу снимка (ARS_SNAPSHOT_PATH)")
+    args = parser.parse_args()
+
+    # Настройки передаются воркерам через окружение, поэтому задаются
+    # до импорта конфигурации
+    os.environ["ARS_SNAPSHOT_PATH"] = (
+        args.snapshot or os.environ.get("ARS_SNAPSHOT_PATH") or os.path.join(BASE_DIR, "catalog.snapshot")
+    )
+    os.environ.setdefault("ARS_STARTUP_MODE", "fast")
+
+    import uvicorn
+    from main.config import logger, SERVE_WORKERS, EDGE_MODE
+    from main.database import SessionLocal
+    from main.snapshot import write_snapshot
+    from main.static_export import static_exporter
+
+    # Edge-узел без БД обслуживает уже скопированный на него снимок
+    if not EDGE_MODE:
+        db = SessionLocal(use_primary=True)
+        try:
+            write_snapshot(db, os.environ["ARS_SNAPSHOT_PATH"])
+            if static_exporter.enabled:
+                static_exporter.export(db)
+        finally:
+            db.close()
+
+    workers = args.workers or SERVE_WORKERS
+    logger.info(f"🚀 Starting {workers} workers on http://{args.host}:{args.port}")
+    uvicorn.run("main.main:app", host=args.host, port=args.port, workers=workers)
+
+
+if __name__ == "__main__":
+    main()
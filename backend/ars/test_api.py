@@ -57,11 +57,32 @@ def test_search():
     apps = response.json()
     print(f"✅ GET /api/search?q=App - Found {len(apps)} apps")
 
+def test_trace_context():
+    """traceparent фронтенда разрешен CORS и продолжает трассу"""
+    traceparent = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    response = requests.options(f"{BASE_URL}/api/apps", headers={
+        "Origin": "http://localhost:5173",
+        "Access-Control-Request-Method": "GET",
+        "Access-Control-Request-Headers": "traceparent",
+    })
+    assert response.status_code == 200
+    assert "traceparent" in response.headers["access-control-allow-headers"].lower()
+    # traceresponse есть только при включенной трассировке (ARS_TRACE_EXPORT)
+    response = requests.get(f"{BASE_URL}/api/apps", headers={"traceparent": traceparent})
+    if "traceresponse" in response.headers:
+        assert response.headers["traceresponse"].split("-")[1] == traceparent.split("-")[1]
+    print("✅ traceparent - allowed by CORS, trace continued")
+
 def test_filter_by_category():
     """Фильтрация по категории"""
     response = requests.get(f"{BASE_URL}/api/apps?category=Финансы")
     assert response.status_code == 200
     apps = response.json()
+    assert all(app["category"] == "Финансы" for app in apps)
+    # Неизвестная категория - пустой список, а не ошибка (в режиме снимка тоже)
+    response = requests.get(f"{BASE_URL}/api/apps?category=Нет такой категории")
+    assert response.status_code == 200
+    assert response.json() == []
     print(f"✅ GET /api/apps?category=Финансы - Found {len(apps)} apps")
 
 def test_create_app():
@@ -112,6 +133,19 @@ def test_delete_app(app_id):
     assert "message" in data
     print(f"✅ DELETE /api/apps/{app_id} - {data['message']}")
 
+def test_app_changes(since=0, deleted_id=None):
+    """Инкрементальная синхронизация: изменения после версии since"""
+    response = requests.get(f"{BASE_URL}/api/apps/changes", params={"since": since})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["version"] >= since
+    if deleted_id is not None:
+        assert deleted_id in data["deleted"]
+        assert deleted_id not in [app["id"] for app in data["upserts"]]
+    print(f"✅ GET /api/apps/changes?since={since} - {len(data['upserts'])} upserts, "
+          f"{len(data['deleted'])} deleted, version {data['version']}")
+    return data["version"]
+
 def run_all_tests():
     """Запуск всех тестов"""
     print("\n" + "="*60)
@@ -130,15 +164,18 @@ def run_all_tests():
         test_get_categories()
         test_search()
         test_filter_by_category()
+        test_trace_context()
         
         # CRUD операции
         print("\n" + "-"*60)
         print("Testing CRUD operations")
         print("-"*60 + "\n")
         
+        version = test_app_changes()
         new_app_id = test_create_app()
         test_update_app(new_app_id)
         test_delete_app(new_app_id)
+        test_app_changes(version, deleted_id=new_app_id)
         
         print("\n" + "="*60)
         print("✅ Все тесты пройдены успешно!")
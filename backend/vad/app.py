@@ -1,9 +1,23 @@
 from flask import Flask, request, jsonify, session
 from flask_cors import CORS
-import pymysql
+from werkzeug.serving import is_running_from_reloader
 from config import Config
+from slow_queries import slow_log
+from tracing import init_tracing, exporter as span_exporter, traced_get
+from circuit_breaker import breaker, DatabaseUnavailable
+from db_pool import pool, get_db_connection, PoolTimeout
+from review_queries import (
+    REVIEW_BY_ID_SQL, InvalidPageRequest, page_query, page_result, page_size
+)
+from rating_stats import (
+    APP_DETAILS_SQL, RATING_STATS_SQL, apply_delta, app_details, rating_result,
+    parse_app_ids, summaries_query, summary, summary_cache
+)
+from vote_buffer import VOTE_STATE_SQL, register_vote, vote_buffer
+from review_tasks import INSERT_REVIEW_SQL, REVIEW_CREATED_AT_SQL, is_duplicate, new_review, review_tasks
+from content_filter import content_filter
+from near_duplicates import CLEAR_BUCKETS_SQL, CLEAR_SIGNATURE_SQL
 import logging
-import requests
 
 # Настройка логирования
 logging.basicConfig(level=logging.DEBUG)
@@ -11,32 +25,57 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = 'jjUIcy5lz4MmoN6vbJ8u'  # Важно: заменить на случайный секретный ключ
-CORS(app, origins=["http://localhost:5173", "http://127.0.0.1:5173"], supports_credentials=True)
+# allow_headers по умолчанию '*': фронтенд присылает traceparent в preflight-запросе
+CORS(app, origins=["http://localhost:5173", "http://127.0.0.1:5173"], supports_credentials=True,
+     expose_headers=["traceresponse"])
+init_tracing(app)
 
-def get_db_connection():
-    try:
-        connection = pymysql.connect(
-            host=Config.MYSQL_HOST,
-            user=Config.MYSQL_USER,
-            password=Config.MYSQL_PASSWORD,
-            database=Config.MYSQL_DB,
-            port=Config.MYSQL_PORT,
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor,
-            connect_timeout=30
-        )
-        logger.info("✅ Успешное подключение к базе данных")
-        return connection
-    except Exception as e:
-        logger.error(f"❌ Ошибка подключения к базе данных: {str(e)}")
-        raise
+# EXPLAIN медленных запросов выполняется в отдельном соединении из пула
+slow_log.connection_factory = get_db_connection
+
+@app.errorhandler(DatabaseUnavailable)
+def database_unavailable(error):
+    # Быстрый отказ вместо ожидания зависшей БД
+    response = jsonify({'success': False, 'error': 'Database is temporarily unavailable, retry later'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+@app.errorhandler(InvalidPageRequest)
+def invalid_page_request(error):
+    return jsonify({'success': False, 'error': str(error)}), 400
+
+@app.errorhandler(PoolTimeout)
+def pool_timeout(error):
+    # Все соединения заняты: клиенту лучше повторить, чем ждать дальше
+    response = jsonify({'success': False, 'error': 'Server is busy, retry later'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@app.route('/api/debug/pool', methods=['GET'])
+def debug_pool():
+    return jsonify({'success': True, 'data': pool.status()})
+
+@app.route('/api/debug/breaker', methods=['GET'])
+def debug_breaker():
+    return jsonify({'success': True, 'data': breaker.status()})
+
+@app.route('/api/debug/slow-queries', methods=['GET'])
+def debug_slow_queries():
+    return jsonify({'success': True, 'data': slow_log.report()})
+
+@app.route('/api/debug/traces', methods=['GET'])
+def debug_traces():
+    return jsonify({'success': True, 'data': span_exporter.recent(request.args.get('trace_id'))})
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     try:
         conn = get_db_connection()
-        conn.close()
-        return jsonify({'status': 'healthy', 'database': 'connected'})
+        try:
+            conn.ping(reconnect=False)
+        finally:
+            conn.close()
+        return jsonify({'status': 'healthy', 'database': 'connected', 'pool': pool.status()})
     except Exception as e:
         return jsonify({'status': 'unhealthy', 'database': 'disconnected', 'error': str(e)}), 500
 
@@ -80,21 +119,12 @@ def get_app_details(app_id):
     conn = get_db_connection()
     try:
         with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM apps WHERE id = %s", (app_id,))
+            # Рейтинг берется из агрегата app_rating_stats
+            cursor.execute(APP_DETAILS_SQL, (app_id,))
             app = cursor.fetchone()
             
             if app:
-                # Получаем рейтинг приложения
-                cursor.execute("""
-                    SELECT AVG(rating) as avg_rating, COUNT(*) as review_count 
-                    FROM reviews WHERE app_id = %s
-                """, (app_id,))
-                rating_data = cursor.fetchone()
-                
-                app['avg_rating'] = float(rating_data['avg_rating']) if rating_data['avg_rating'] else 0
-                app['review_count'] = rating_data['review_count']
-                
-                return jsonify({'success': True, 'data': app})
+                return jsonify({'success': True, 'data': app_details(app)})
             else:
                 return jsonify({'success': False, 'error': 'App not found'}), 404
     except Exception as e:
@@ -143,10 +173,12 @@ def vk_auth():
     if not code:
         return jsonify({'success': False, 'error': 'Code is required'}), 400
     
+    conn = None
     try:
         # Обмен кода на access token
-        token_response = requests.get(
+        token_response = traced_get(
             'https://oauth.vk.com/access_token',
+            propagate=False,
             params={
                 'client_id': Config.VK_CLIENT_ID,
                 'client_secret': Config.VK_CLIENT_SECRET,
@@ -161,8 +193,9 @@ def vk_auth():
             return jsonify({'success': False, 'error': 'Invalid authorization code'}), 400
         
         # Получение информации о пользователе
-        user_response = requests.get(
+        user_response = traced_get(
             'https://api.vk.com/method/users.get',
+            propagate=False,
             params={
                 'access_token': token_data['access_token'],
                 'v': '5.131',
@@ -211,6 +244,12 @@ def vk_auth():
             # Сохраняем в сессии
             session['user_id'] = user_id
             session['user_vk_id'] = user_info['id']
+            # Автор новых отзывов берется из сессии, без чтения users
+            session['user'] = {
+                'first_name': user['first_name'],
+                'last_name': user['last_name'],
+                'avatar': user['avatar']
+            }
             
             return jsonify({
                 'success': True, 
@@ -218,9 +257,15 @@ def vk_auth():
                 'access_token': token_data['access_token']
             })
             
+    except DatabaseUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Ошибка VK аутентификации: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        # Соединение возвращается в пул
+        if conn is not None:
+            conn.close()
 
 @app.route('/api/auth/logout', methods=['POST'])
 def logout():
@@ -252,25 +297,19 @@ def get_user_profile():
 # Обновленные эндпоинты для отзывов с рейтингом
 @app.route('/api/apps/<int:app_id>/reviews', methods=['GET'])
 def get_reviews(app_id):
+    # ?sort=newest|liked|rating_high|rating_low|helpful&limit=20&cursor=<next_cursor>
     logger.info(f"Получение отзывов для app_id: {app_id}")
+    sort = request.args.get('sort', 'newest')
+    limit = page_size(request.args.get('limit'))
+    sql, params = page_query(app_id, sort, request.args.get('cursor'), limit)
     conn = get_db_connection()
     try:
         with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT r.*, u.first_name, u.last_name, u.avatar 
-                FROM reviews r 
-                LEFT JOIN users u ON r.user_id = u.id 
-                WHERE r.app_id = %s 
-                ORDER BY r.created_at DESC
-            """, (app_id,))
-            reviews = cursor.fetchall()
-            
-            for review in reviews:
-                review['date'] = review['created_at'].strftime('%d.%m.%Y')
-                review['author'] = f"{review['first_name']} {review['last_name']}" if review['first_name'] else 'Аноним'
+            cursor.execute(sql, params)
+            reviews, next_cursor = page_result(cursor.fetchall(), sort, limit)
             
             logger.info(f"Найдено {len(reviews)} отзывов")
-            return jsonify({'success': True, 'data': reviews})
+            return jsonify({'success': True, 'data': reviews, 'next_cursor': next_cursor})
     except Exception as e:
         logger.error(f"Ошибка при получении отзывов: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -292,108 +331,166 @@ def add_review(app_id):
     rating = data.get('rating', 0)
     if not (1 <= rating <= 5):
         return jsonify({'success': False, 'error': 'Rating must be between 1 and 5'}), 400
+    
+    # Проверка текста - один проход автомата, без обращения к БД
+    rejection = content_filter.rejection(data['text'])
+    if rejection:
+        return jsonify(rejection), 400
 
+    # Один INSERT: повторный отзыв отсекает уникальный ключ (app_id, user_id),
+    # агрегат рейтинга и кэш обновляет фоновый обработчик
     conn = get_db_connection()
     try:
         with conn.cursor() as cursor:
-            # Проверяем, не оставлял ли пользователь уже отзыв
-            cursor.execute(
-                "SELECT id FROM reviews WHERE app_id = %s AND user_id = %s", 
-                (app_id, user_id)
-            )
-            existing_review = cursor.fetchone()
-            
-            if existing_review:
-                return jsonify({'success': False, 'error': 'You have already reviewed this app'}), 400
-            
-            sql = """
-                INSERT INTO reviews (app_id, user_id, text, rating, likes) 
-                VALUES (%s, %s, %s, %s, %s)
-            """
-            cursor.execute(sql, (app_id, user_id, data['text'], rating, 0))
-            conn.commit()
+            cursor.execute(INSERT_REVIEW_SQL, (app_id, user_id, data['text'], rating))
             review_id = cursor.lastrowid
-            
-            # Получаем созданный отзыв с информацией о пользователе
-            cursor.execute("""
-                SELECT r.*, u.first_name, u.last_name, u.avatar 
-                FROM reviews r 
-                LEFT JOIN users u ON r.user_id = u.id 
-                WHERE r.id = %s
-            """, (review_id,))
-            new_review = cursor.fetchone()
-            new_review['date'] = new_review['created_at'].strftime('%d.%m.%Y')
-            new_review['author'] = f"{new_review['first_name']} {new_review['last_name']}"
-            
-            logger.info(f"Отзыв успешно добавлен с ID: {review_id}")
-            return jsonify({'success': True, 'data': new_review}), 201
+            cursor.execute(REVIEW_CREATED_AT_SQL, (review_id,))
+            created_at = cursor.fetchone()['created_at']
+        conn.commit()
     except Exception as e:
         conn.rollback()
+        if is_duplicate(e):
+            return jsonify({'success': False, 'error': 'You have already reviewed this app'}), 400
         logger.error(f"Ошибка при добавлении отзыва: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
         conn.close()
+    
+    review_tasks.submit(review_id)
+    logger.info(f"Отзыв успешно добавлен с ID: {review_id}")
+    return jsonify({
+        'success': True,
+        'data': new_review(review_id, app_id, user_id, data['text'], rating, session.get('user', {}), created_at)
+    }), 201
+
+@app.route('/api/reviews/<int:review_id>', methods=['PUT'])
+def update_review(review_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'success': False, 'error': 'Authentication required'}), 401
+
+    data = request.get_json() or {}
+    text = data.get('text')
+    rating = data.get('rating')
+    if text is None and rating is None:
+        return jsonify({'success': False, 'error': 'Text or rating is required'}), 400
+    if text is not None and not text:
+        return jsonify({'success': False, 'error': 'Text is required'}), 400
+    if rating is not None and not (1 <= rating <= 5):
+        return jsonify({'success': False, 'error': 'Rating must be between 1 and 5'}), 400
+    rejection = content_filter.rejection(text) if text else None
+    if rejection:
+        return jsonify(rejection), 400
 
-@app.route('/api/reviews/<int:review_id>/like', methods=['POST'])
-def like_review(review_id):
-    logger.info(f"Лайк отзыва: {review_id}")
     conn = get_db_connection()
     try:
         with conn.cursor() as cursor:
-            cursor.execute("UPDATE reviews SET likes = likes + 1 WHERE id = %s", (review_id,))
+            # Строка отзыва блокируется: старая оценка не изменится до коммита
+            cursor.execute("SELECT app_id, user_id, text, rating, aggregated FROM reviews WHERE id = %s FOR UPDATE",
+                           (review_id,))
+            review = cursor.fetchone()
+            if not review:
+                return jsonify({'success': False, 'error': 'Review not found'}), 404
+            if review['user_id'] != user_id:
+                return jsonify({'success': False, 'error': 'You can only edit your own reviews'}), 403
+
+            new_text = text if text is not None else review['text']
+            new_rating = rating if rating is not None else review['rating']
+            cursor.execute("UPDATE reviews SET text = %s, rating = %s WHERE id = %s", (new_text, new_rating, review_id))
+            # Еще не учтенный отзыв обработчик учтет с новой оценкой
+            if review['aggregated']:
+                apply_delta(cursor, review['app_id'], review['rating'], new_rating)
+            # Новый текст: подпись MinHash и корзины LSH пересчитает обработчик
+            text_changed = new_text != review['text']
+            if text_changed:
+                cursor.execute(CLEAR_BUCKETS_SQL, (review_id,))
+                cursor.execute(CLEAR_SIGNATURE_SQL, (review_id,))
             conn.commit()
-            
-            cursor.execute("SELECT likes FROM reviews WHERE id = %s", (review_id,))
-            result = cursor.fetchone()
-            if result:
-                return jsonify({'success': True, 'data': {'likes': result['likes']}})
-            else:
+            summary_cache.invalidate(review['app_id'])
+            if text_changed:
+                review_tasks.submit(review_id)
+
+            cursor.execute(REVIEW_BY_ID_SQL, (review_id,))
+            logger.info(f"Отзыв {review_id} обновлен")
+            return jsonify({'success': True, 'data': cursor.fetchone()})
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Ошибка при обновлении отзыва: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/reviews/<int:review_id>', methods=['DELETE'])
+def delete_review(review_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'success': False, 'error': 'Authentication required'}), 401
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT app_id, user_id, rating, aggregated FROM reviews WHERE id = %s FOR UPDATE",
+                           (review_id,))
+            review = cursor.fetchone()
+            if not review:
                 return jsonify({'success': False, 'error': 'Review not found'}), 404
+            if review['user_id'] != user_id:
+                return jsonify({'success': False, 'error': 'You can only delete your own reviews'}), 403
+
+            cursor.execute("DELETE FROM reviews WHERE id = %s", (review_id,))
+            if review['aggregated']:
+                apply_delta(cursor, review['app_id'], old_rating=review['rating'])
+            conn.commit()
+            summary_cache.invalidate(review['app_id'])
+
+            logger.info(f"Отзыв {review_id} удален")
+            return jsonify({'success': True, 'message': 'Review deleted'})
     except Exception as e:
         conn.rollback()
-        logger.error(f"Ошибка при лайке: {str(e)}")
+        logger.error(f"Ошибка при удалении отзыва: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
         conn.close()
 
+# Оценка полезности отзыва: один голос пользователя, запись в БД
+# пачками через vote_buffer
+def vote_review(review_id, column):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'success': False, 'error': 'Authentication required'}), 401
+    
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(VOTE_STATE_SQL, (user_id, review_id))
+            state = cursor.fetchone()
+    except Exception as e:
+        logger.error(f"Ошибка при оценке отзыва: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        conn.close()
+    
+    body, status = register_vote(state, review_id, user_id, column)
+    return jsonify(body), status
+
+@app.route('/api/reviews/<int:review_id>/like', methods=['POST'])
+def like_review(review_id):
+    logger.info(f"Лайк отзыва: {review_id}")
+    return vote_review(review_id, 'likes')
+
+@app.route('/api/reviews/<int:review_id>/dislike', methods=['POST'])
+def dislike_review(review_id):
+    logger.info(f"Дизлайк отзыва: {review_id}")
+    return vote_review(review_id, 'dislikes')
+
 @app.route('/api/apps/<int:app_id>/rating', methods=['GET'])
 def get_app_rating(app_id):
     logger.info(f"Получение рейтинга для app_id: {app_id}")
     conn = get_db_connection()
     try:
         with conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT 
-                    AVG(rating) as average_rating,
-                    COUNT(*) as reviews_count,
-                    SUM(CASE WHEN rating = 5 THEN 1 ELSE 0 END) as rating_5,
-                    SUM(CASE WHEN rating = 4 THEN 1 ELSE 0 END) as rating_4,
-                    SUM(CASE WHEN rating = 3 THEN 1 ELSE 0 END) as rating_3,
-                    SUM(CASE WHEN rating = 2 THEN 1 ELSE 0 END) as rating_2,
-                    SUM(CASE WHEN rating = 1 THEN 1 ELSE 0 END) as rating_1
-                FROM reviews 
-                WHERE app_id = %s
-            """, (app_id,))
-            rating_data = cursor.fetchone()
-            
-            if rating_data['reviews_count'] > 0:
-                result = {
-                    'average_rating': float(rating_data['average_rating']),
-                    'reviews_count': rating_data['reviews_count'],
-                    'rating_distribution': {
-                        5: rating_data['rating_5'],
-                        4: rating_data['rating_4'],
-                        3: rating_data['rating_3'],
-                        2: rating_data['rating_2'],
-                        1: rating_data['rating_1']
-                    }
-                }
-            else:
-                result = {
-                    'average_rating': 0,
-                    'reviews_count': 0,
-                    'rating_distribution': {5:0, 4:0, 3:0, 2:0, 1:0}
-                }
+            cursor.execute(RATING_STATS_SQL, (app_id,))
+            result = rating_result(cursor.fetchone())
             
             return jsonify({'success': True, 'data': result})
     except Exception as e:
@@ -402,5 +499,53 @@ def get_app_rating(app_id):
     finally:
         conn.close()
 
+@app.route('/api/ratings', methods=['GET'])
+def get_ratings():
+    # Сводки рейтинга для списка приложений: ?app_ids=1,2,3
+    try:
+        app_ids = parse_app_ids(request.args.get('app_ids'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    ratings, missing = summary_cache.get_many(app_ids)
+    if missing:
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(*summaries_query(missing))
+                stats = {row['app_id']: row for row in cursor.fetchall()}
+        except Exception as e:
+            logger.error(f"Ошибка при получении рейтингов: {str(e)}")
+            return jsonify({'success': False, 'error': str(e)}), 500
+        finally:
+            conn.close()
+        loaded = {app_id: summary(stats.get(app_id)) for app_id in missing}
+        summary_cache.put_many(loaded)
+        ratings.update(loaded)
+    
+    return jsonify({'success': True, 'data': {str(app_id): ratings[app_id] for app_id in app_ids}})
+
+@app.route('/api/debug/content-filter', methods=['GET'])
+def debug_content_filter():
+    return jsonify({'success': True, 'data': content_filter.status()})
+
+@app.route('/api/debug/review-tasks', methods=['GET'])
+def debug_review_tasks():
+    return jsonify({'success': True, 'data': review_tasks.status()})
+
+@app.route('/api/debug/votes', methods=['GET'])
+def debug_votes():
+    return jsonify({'success': True, 'data': vote_buffer.status()})
+
+@app.route('/api/debug/ratings-cache', methods=['GET'])
+def debug_ratings_cache():
+    return jsonify({'success': True, 'data': summary_cache.status()})
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    debug = True
+    # С reloader (debug) этот блок выполняется и в родительском процессе,
+    # который только следит за файлами: обработчик отзывов запускается лишь
+    # в обслуживающем процессе
+    if not debug or is_running_from_reloader():
+        review_tasks.start()
+    app.run(host='0.0.0.0', port=5000, debug=debug)
@@ -0,0 +1,625 @@
+import argparse
+import asyncio
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+
+import aiomysql
+import httpx
+import uvicorn
+from itsdangerous import BadSignature
+from flask.sessions import SecureCookieSessionInterface
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response
+from starlette.routing import Route
+
+from app import app as flask_app
+from config import Config
+from circuit_breaker import breaker, DatabaseUnavailable, is_overload
+from content_filter import content_filter
+from near_duplicates import CLEAR_BUCKETS_SQL, CLEAR_SIGNATURE_SQL
+from db_pool import PoolTimeout
+from rating_stats import (
+    APP_DETAILS_SQL, APPLY_DELTA_SQL, RATING_STATS_SQL, app_details, delta_params, rating_result,
+    parse_app_ids, summaries_query, summary, summary_cache
+)
+from review_queries import (
+    REVIEW_BY_ID_SQL, InvalidPageRequest, page_query, page_result, page_size
+)
+from review_tasks import INSERT_REVIEW_SQL, REVIEW_CREATED_AT_SQL, is_duplicate, new_review, review_tasks
+from vote_buffer import VOTE_STATE_SQL, register_vote, vote_buffer
+
+logger = logging.getLogger(__name__)
+
+# Асинхронный режим сервиса отзывов: те же endpoints, что в app.py, на
+# Starlette + aiomysql + httpx. Запрос, ждущий MySQL или VK OAuth, не держит
+# поток - один процесс обслуживает тысячи одновременных запросов.
+#
+#   python asgi_app.py --port 5000 --workers 2
+#
+# Ответы сериализуются JSON провайдером Flask, сессия - cookie Flask с тем же
+# ключом: фронтенд не замечает разницы, режимы можно переключать без
+# повторного входа.
+
+SESSION_COOKIE = flask_app.config['SESSION_COOKIE_NAME']
+SESSION_MAX_AGE = int(flask_app.permanent_session_lifetime.total_seconds())
+session_serializer = SecureCookieSessionInterface().get_signing_serializer(flask_app)
+
+db_pool = None
+http_client = None
+
+# Шаблон маршрута Flask для каждого обработчика: по нему берутся
+# STATEMENT_TIMEOUTS, общие с синхронным режимом
+ROUTE_RULES = {}
+
+
+class JSONResponse(Response):
+    media_type = 'application/json'
+
+    def render(self, content):
+        return flask_app.json.dumps(content).encode('utf-8')
+
+
+def error(message, status_code):
+    return JSONResponse({'success': False, 'error': message}, status_code=status_code)
+
+
+def load_session(request):
+    value = request.cookies.get(SESSION_COOKIE)
+    if not value:
+        return {}
+    try:
+        return dict(session_serializer.loads(value, max_age=SESSION_MAX_AGE))
+    except BadSignature:
+        return {}
+
+
+def save_session(response, data):
+    if data:
+        response.set_cookie(SESSION_COOKIE, session_serializer.dumps(data), max_age=SESSION_MAX_AGE,
+                            httponly=True, path='/')
+    else:
+        response.delete_cookie(SESSION_COOKIE, path='/')
+
+
+@asynccontextmanager
+async def db_connection(request):
+    # Соединение из пула aiomysql с пределом выполнения запросов маршрута;
+    # учитывается circuit breaker, как в db_pool.get_db_connection: выдача и
+    # возврат соединения - одна проба полуоткрытого breaker
+    probe = breaker.check()
+    started = time.perf_counter()
+    try:
+        conn = await asyncio.wait_for(db_pool.acquire(), Config.POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        breaker.record((time.perf_counter() - started) * 1000, failed=True)
+        breaker.release(probe, success=False)
+        raise PoolTimeout(f"No free database connection in {Config.POOL_TIMEOUT:g}s")
+    except Exception:
+        breaker.record((time.perf_counter() - started) * 1000, failed=True)
+        breaker.release(probe, success=False)
+        raise
+    except BaseException:
+        # Отмена запроса (клиент ушел) во время ожидания соединения
+        breaker.release(probe, success=False)
+        raise
+    try:
+        timeout_ms = Config.STATEMENT_TIMEOUTS.get(ROUTE_RULES.get(request.scope.get('endpoint')),
+                                                   Config.STATEMENT_TIMEOUT_MS)
+        if getattr(conn, 'vad_statement_timeout', None) != timeout_ms:
+            async with conn.cursor() as cursor:
+                await cursor.execute(f"SET SESSION max_execution_time = {timeout_ms}")
+            conn.vad_statement_timeout = timeout_ms
+        yield conn
+    except BaseException:
+        # Незавершенная транзакция не должна вернуться в пул
+        if not conn.closed and conn.get_transaction_status():
+            await conn.rollback()
+        raise
+    finally:
+        db_pool.release(conn)
+        breaker.release(probe)
+
+
+async def query(conn, sql, args=None, fetch='all'):
+    # Запрос с учетом в circuit breaker; fetch: 'all', 'one' или None
+    started = time.perf_counter()
+    failed = False
+    try:
+        async with conn.cursor() as cursor:
+            await cursor.execute(sql, args)
+            if fetch == 'all':
+                return await cursor.fetchall()
+            if fetch == 'one':
+                return await cursor.fetchone()
+            return cursor.lastrowid
+    except Exception as e:
+        failed = is_overload(e)
+        raise
+    finally:
+        breaker.record((time.perf_counter() - started) * 1000, failed)
+
+
+async def health_check(request):
+    try:
+        async with db_connection(request) as conn:
+            await conn.ping(reconnect=False)
+        return JSONResponse({'status': 'healthy', 'database': 'connected', 'pool': pool_status()})
+    except Exception as e:
+        return JSONResponse({'status': 'unhealthy', 'database': 'disconnected', 'error': str(e)}, status_code=500)
+
+
+def pool_status():
+    return {
+        'max_size': db_pool.maxsize,
+        'open': db_pool.size,
+        'idle': db_pool.freesize,
+        'in_use': db_pool.size - db_pool.freesize,
+    }
+
+
+async def debug_pool(request):
+    return JSONResponse({'success': True, 'data': pool_status()})
+
+
+async def debug_breaker(request):
+    return JSONResponse({'success': True, 'data': breaker.status()})
+
+
+async def get_apps(request):
+    featured = request.query_params.get('featured') == 'true'
+    top_week = request.query_params.get('topWeek') == 'true'
+    search_query = request.query_params.get('search')
+
+    sql = "SELECT * FROM apps WHERE 1=1"
+    params = []
+    if featured:
+        sql += " AND featured = TRUE"
+    if top_week:
+        sql += " AND top_week = TRUE"
+    if search_query:
+        sql += " AND (name LIKE %s OR category LIKE %s)"
+        params.extend([f'%{search_query}%', f'%{search_query}%'])
+    sql += " ORDER BY created_at DESC"
+
+    async with db_connection(request) as conn:
+        try:
+            apps = await query(conn, sql, params)
+            return JSONResponse({'success': True, 'data': apps})
+        except Exception as e:
+            logger.error(f"Ошибка при получении приложений: {str(e)}")
+            return error(str(e), 500)
+
+
+async def get_app_details(request):
+    app_id = request.path_params['app_id']
+    async with db_connection(request) as conn:
+        try:
+            app = await query(conn, APP_DETAILS_SQL, (app_id,), fetch='one')
+            if not app:
+                return error('App not found', 404)
+            return JSONResponse({'success': True, 'data': app_details(app)})
+        except Exception as e:
+            logger.error(f"Ошибка при получении приложения: {str(e)}")
+            return error(str(e), 500)
+
+
+async def get_categories(request):
+    async with db_connection(request) as conn:
+        try:
+            categories = await query(conn, "SELECT DISTINCT category as name FROM apps WHERE category IS NOT NULL")
+            return JSONResponse({'success': True, 'data': categories})
+        except Exception as e:
+            logger.error(f"Ошибка при получении категорий: {str(e)}")
+            return error(str(e), 500)
+
+
+async def get_apps_by_category(request):
+    async with db_connection(request) as conn:
+        try:
+            apps = await query(conn, "SELECT * FROM apps WHERE category = %s ORDER BY created_at DESC",
+                               (request.path_params['category_name'],))
+            return JSONResponse({'success': True, 'data': apps})
+        except Exception as e:
+            logger.error(f"Ошибка при получении приложений категории: {str(e)}")
+            return error(str(e), 500)
+
+
+async def vk_auth(request):
+    data = await request.json()
+    code = data.get('code')
+    redirect_uri = data.get('redirect_uri')
+    if not code:
+        return error('Code is required', 400)
+
+    try:
+        # Обмен кода на access token: ожидание VK не занимает поток
+        token_response = await http_client.get('https://oauth.vk.com/access_token', params={
+            'client_id': Config.VK_CLIENT_ID,
+            'client_secret': Config.VK_CLIENT_SECRET,
+            'redirect_uri': redirect_uri,
+            'code': code
+        })
+        token_data = token_response.json()
+        if 'access_token' not in token_data:
+            return error('Invalid authorization code', 400)
+
+        user_response = await http_client.get('https://api.vk.com/method/users.get', params={
+            'access_token': token_data['access_token'],
+            'v': '5.131',
+            'fields': 'photo_200,first_name,last_name'
+        })
+        user_data = user_response.json()
+        if 'response' not in user_data:
+            return error('Failed to get user info', 400)
+        user_info = user_data['response'][0]
+
+        async with db_connection(request) as conn:
+            await conn.begin()
+            existing_user = await query(conn, "SELECT * FROM users WHERE vk_id = %s", (user_info['id'],),
+                                        fetch='one')
+            if existing_user:
+                user_id = existing_user['id']
+                await query(conn, "UPDATE users SET first_name = %s, last_name = %s, avatar = %s WHERE id = %s",
+                            (user_info['first_name'], user_info['last_name'], user_info.get('photo_200'), user_id),
+                            fetch=None)
+            else:
+                user_id = await query(
+                    conn, "INSERT INTO users (vk_id, first_name, last_name, avatar) VALUES (%s, %s, %s, %s)",
+                    (user_info['id'], user_info['first_name'], user_info['last_name'], user_info.get('photo_200')),
+                    fetch=None
+                )
+            await conn.commit()
+            user = await query(conn, "SELECT * FROM users WHERE id = %s", (user_id,), fetch='one')
+
+        response = JSONResponse({'success': True, 'data': user, 'access_token': token_data['access_token']})
+        save_session(response, {
+            **load_session(request),
+            'user_id': user_id,
+            'user_vk_id': user_info['id'],
+            'user': {'first_name': user['first_name'], 'last_name': user['last_name'], 'avatar': user['avatar']},
+        })
+        return response
+    except (DatabaseUnavailable, PoolTimeout):
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка VK аутентификации: {str(e)}")
+        return error(str(e), 500)
+
+
+async def logout(request):
+    response = JSONResponse({'success': True, 'message': 'Logged out successfully'})
+    save_session(response, {})
+    return response
+
+
+async def get_user_profile(request):
+    user_id = load_session(request).get('user_id')
+    if not user_id:
+        return error('Not authenticated', 401)
+    async with db_connection(request) as conn:
+        try:
+            user = await query(conn, "SELECT * FROM users WHERE id = %s", (user_id,), fetch='one')
+            if user:
+                return JSONResponse({'success': True, 'data': user})
+            return error('User not found', 404)
+        except Exception as e:
+            logger.error(f"Ошибка при получении профиля: {str(e)}")
+            return error(str(e), 500)
+
+
+async def get_reviews(request):
+    sort = request.query_params.get('sort', 'newest')
+    limit = page_size(request.query_params.get('limit'))
+    sql, params = page_query(request.path_params['app_id'], sort, request.query_params.get('cursor'), limit)
+    async with db_connection(request) as conn:
+        try:
+            reviews, next_cursor = page_result(await query(conn, sql, params), sort, limit)
+            return JSONResponse({'success': True, 'data': reviews, 'next_cursor': next_cursor})
+        except Exception as e:
+            logger.error(f"Ошибка при получении отзывов: {str(e)}")
+            return error(str(e), 500)
+
+
+async def add_review(request):
+    app_id = request.path_params['app_id']
+    session = load_session(request)
+    user_id = session.get('user_id')
+    if not user_id:
+        return error('Authentication required', 401)
+
+    data = await request.json()
+    if not data or not data.get('text'):
+        return error('Text is required', 400)
+    rating = data.get('rating', 0)
+    if not (1 <= rating <= 5):
+        return error('Rating must be between 1 and 5', 400)
+    rejection = content_filter.rejection(data['text'])
+    if rejection:
+        return JSONResponse(rejection, status_code=400)
+
+    async with db_connection(request) as conn:
+        try:
+            await conn.begin()
+            review_id = await query(conn, INSERT_REVIEW_SQL, (app_id, user_id, data['text'], rating), fetch=None)
+            created_at = (await query(conn, REVIEW_CREATED_AT_SQL, (review_id,), fetch='one'))['created_at']
+            await conn.commit()
+        except Exception as e:
+            await conn.rollback()
+            if is_duplicate(e):
+                return error('You have already reviewed this app', 400)
+            logger.error(f"Ошибка при добавлении отзыва: {str(e)}")
+            return error(str(e), 500)
+
+    review_tasks.submit(review_id)
+    review = new_review(review_id, app_id, user_id, data['text'], rating, session.get('user', {}), created_at)
+    return JSONResponse({'success': True, 'data': review}, status_code=201)
+
+
+async def update_review(request):
+    review_id = request.path_params['review_id']
+    user_id = load_session(request).get('user_id')
+    if not user_id:
+        return error('Authentication required', 401)
+
+    data = await request.json() or {}
+    text = data.get('text')
+    rating = data.get('rating')
+    if text is None and rating is None:
+        return error('Text or rating is required', 400)
+    if text is not None and not text:
+        return error('Text is required', 400)
+    if rating is not None and not (1 <= rating <= 5):
+        return error('Rating must be between 1 and 5', 400)
+    rejection = content_filter.rejection(text) if text else None
+    if rejection:
+        return JSONResponse(rejection, status_code=400)
+
+    async with db_connection(request) as conn:
+        try:
+            await conn.begin()
+            review = await query(conn, "SELECT app_id, user_id, text, rating, aggregated FROM reviews WHERE id = %s FOR UPDATE",
+                                 (review_id,), fetch='one')
+            if not review:
+                await conn.rollback()
+                return error('Review not found', 404)
+            if review['user_id'] != user_id:
+                await conn.rollback()
+                return error('You can only edit your own reviews', 403)
+
+            new_text = text if text is not None else review['text']
+            new_rating = rating if rating is not None else review['rating']
+            await query(conn, "UPDATE reviews SET text = %s, rating = %s WHERE id = %s",
+                        (new_text, new_rating, review_id), fetch=None)
+            if review['aggregated'] and new_rating != review['rating']:
+                await query(conn, APPLY_DELTA_SQL, delta_params(review['app_id'], review['rating'], new_rating),
+                            fetch=None)
+            text_changed = new_text != review['text']
+            if text_changed:
+                await query(conn, CLEAR_BUCKETS_SQL, (review_id,), fetch=None)
+                await query(conn, CLEAR_SIGNATURE_SQL, (review_id,), fetch=None)
+            await conn.commit()
+            summary_cache.invalidate(review['app_id'])
+            if text_changed:
+                review_tasks.submit(review_id)
+
+            updated = await query(conn, REVIEW_BY_ID_SQL, (review_id,), fetch='one')
+            return JSONResponse({'success': True, 'data': updated})
+        except Exception as e:
+            await conn.rollback()
+            logger.error(f"Ошибка при обновлении отзыва: {str(e)}")
+            return error(str(e), 500)
+
+
+async def delete_review(request):
+    review_id = request.path_params['review_id']
+    user_id = load_session(request).get('user_id')
+    if not user_id:
+        return error('Authentication required', 401)
+
+    async with db_connection(request) as conn:
+        try:
+            await conn.begin()
+            review = await query(conn, "SELECT app_id, user_id, rating, aggregated FROM reviews WHERE id = %s FOR UPDATE",
+                                 (review_id,), fetch='one')
+            if not review:
+                await conn.rollback()
+                return error('Review not found', 404)
+            if review['user_id'] != user_id:
+                await conn.rollback()
+                return error('You can only delete your own reviews', 403)
+
+            await query(conn, "DELETE FROM reviews WHERE id = %s", (review_id,), fetch=None)
+            if review['aggregated']:
+                await query(conn, APPLY_DELTA_SQL, delta_params(review['app_id'], old_rating=review['rating']),
+                            fetch=None)
+            await conn.commit()
+            summary_cache.invalidate(review['app_id'])
+            return JSONResponse({'success': True, 'message': 'Review deleted'})
+        except Exception as e:
+            await conn.rollback()
+            logger.error(f"Ошибка при удалении отзыва: {str(e)}")
+            return error(str(e), 500)
+
+
+async def vote_review(request, column):
+    review_id = request.path_params['review_id']
+    user_id = load_session(request).get('user_id')
+    if not user_id:
+        return error('Authentication required', 401)
+
+    async with db_connection(request) as conn:
+        try:
+            state = await query(conn, VOTE_STATE_SQL, (user_id, review_id), fetch='one')
+        except Exception as e:
+            logger.error(f"Ошибка при оценке отзыва: {str(e)}")
+            return error(str(e), 500)
+    body, status = register_vote(state, review_id, user_id, column)
+    return JSONResponse(body, status_code=status)
+
+
+async def like_review(request):
+    return await vote_review(request, 'likes')
+
+
+async def dislike_review(request):
+    return await vote_review(request, 'dislikes')
+
+
+async def get_app_rating(request):
+    async with db_connection(request) as conn:
+        try:
+            stats = await query(conn, RATING_STATS_SQL, (request.path_params['app_id'],), fetch='one')
+            result = rating_result(stats)
+            return JSONResponse({'success': True, 'data': result})
+        except Exception as e:
+            logger.error(f"Ошибка при получении рейтинга: {str(e)}")
+            return error(str(e), 500)
+
+
+async def get_ratings(request):
+    try:
+        app_ids = parse_app_ids(request.query_params.get('app_ids'))
+    except ValueError as e:
+        return error(str(e), 400)
+
+    ratings, missing = summary_cache.get_many(app_ids)
+    if missing:
+        async with db_connection(request) as conn:
+            try:
+                rows = await query(conn, *summaries_query(missing))
+            except Exception as e:
+                logger.error(f"Ошибка при получении рейтингов: {str(e)}")
+                return error(str(e), 500)
+        stats = {row['app_id']: row for row in rows}
+        loaded = {app_id: summary(stats.get(app_id)) for app_id in missing}
+        summary_cache.put_many(loaded)
+        ratings.update(loaded)
+    return JSONResponse({'success': True, 'data': {str(app_id): ratings[app_id] for app_id in app_ids}})
+
+
+async def debug_content_filter(request):
+    return JSONResponse({'success': True, 'data': content_filter.status()})
+
+
+async def debug_review_tasks(request):
+    return JSONResponse({'success': True, 'data': review_tasks.status()})
+
+
+async def debug_votes(request):
+    return JSONResponse({'success': True, 'data': vote_buffer.status()})
+
+
+async def debug_ratings_cache(request):
+    return JSONResponse({'success': True, 'data': summary_cache.status()})
+
+
+async def database_unavailable(request, exc):
+    response = error('Database is temporarily unavailable, retry later', 503)
+    response.headers['Retry-After'] = str(exc.retry_after)
+    return response
+
+
+async def invalid_page_request(request, exc):
+    return error(str(exc), 400)
+
+
+async def pool_timeout(request, exc):
+    response = error('Server is busy, retry later', 503)
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global db_pool, http_client
+    db_pool = await aiomysql.create_pool(
+        host=Config.MYSQL_HOST,
+        user=Config.MYSQL_USER,
+        password=Config.MYSQL_PASSWORD,
+        db=Config.MYSQL_DB,
+        port=Config.MYSQL_PORT,
+        charset='utf8mb4',
+        cursorclass=aiomysql.DictCursor,
+        # Чтения без открытой транзакции не держат старый снимок REPEATABLE READ,
+        # запись открывает транзакцию явно
+        autocommit=True,
+        minsize=1,
+        maxsize=Config.ASYNC_POOL_SIZE,
+        pool_recycle=Config.POOL_MAX_LIFETIME,
+        connect_timeout=Config.DB_CONNECT_TIMEOUT,
+        init_command=f"SET SESSION innodb_lock_wait_timeout = {Config.LOCK_WAIT_TIMEOUT}",
+    )
+    http_client = httpx.AsyncClient(timeout=Config.VK_TIMEOUT)
+    review_tasks.start()
+    logger.info(f"🚀 Асинхронный режим: пул MySQL до {Config.ASYNC_POOL_SIZE} соединений")
+    try:
+        yield
+    finally:
+        # Накопленные оценки и очередь новых отзывов дорабатываются до
+        # закрытия пулов
+        await asyncio.to_thread(vote_buffer.stop)
+        await asyncio.to_thread(review_tasks.stop)
+        await http_client.aclose()
+        db_pool.close()
+        await db_pool.wait_closed()
+
+
+def flask_rule(path):
+    # /api/apps/{app_id:int} -> /api/apps/<int:app_id>
+    path = re.sub(r"\{(\w+):int\}", r"<int:\1>", path)
+    return re.sub(r"\{(\w+)\}", r"<string:\1>", path)
+
+
+def route(path, endpoint, methods=('GET',)):
+    ROUTE_RULES[endpoint] = flask_rule(path)
+    return Route(path, endpoint, methods=list(methods))
+
+
+app = Starlette(
+    routes=[
+        route('/api/health', health_check),
+        route('/api/debug/pool', debug_pool),
+        route('/api/debug/breaker', debug_breaker),
+        route('/api/debug/content-filter', debug_content_filter),
+        route('/api/debug/review-tasks', debug_review_tasks),
+        route('/api/debug/votes', debug_votes),
+        route('/api/debug/ratings-cache', debug_ratings_cache),
+        route('/api/apps', get_apps),
+        route('/api/apps/{app_id:int}', get_app_details),
+        route('/api/categories', get_categories),
+        route('/api/categories/{category_name}/apps', get_apps_by_category),
+        route('/api/auth/vk', vk_auth, methods=('POST',)),
+        route('/api/auth/logout', logout, methods=('POST',)),
+        route('/api/user/profile', get_user_profile),
+        route('/api/apps/{app_id:int}/reviews', get_reviews),
+        route('/api/apps/{app_id:int}/reviews', add_review, methods=('POST',)),
+        route('/api/reviews/{review_id:int}', update_review, methods=('PUT',)),
+        route('/api/reviews/{review_id:int}', delete_review, methods=('DELETE',)),
+        route('/api/reviews/{review_id:int}/like', like_review, methods=('POST',)),
+        route('/api/reviews/{review_id:int}/dislike', dislike_review, methods=('POST',)),
+        route('/api/apps/{app_id:int}/rating', get_app_rating),
+        route('/api/ratings', get_ratings),
+    ],
+    middleware=[
+        # allow_headers='*' пропускает traceparent от фронтенда
+        Middleware(CORSMiddleware, allow_origins=["http://localhost:5173", "http://127.0.0.1:5173"],
+                   allow_credentials=True, allow_methods=['*'], allow_headers=['*'],
+                   expose_headers=["traceresponse"]),
+    ],
+    exception_handlers={DatabaseUnavailable: database_unavailable, PoolTimeout: pool_timeout,
+                        InvalidPageRequest: invalid_page_request},
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Сервис отзывов в асинхронном режиме (ASGI)')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+    uvicorn.run('asgi_app:app', host=args.host, port=args.port, workers=args.workers)
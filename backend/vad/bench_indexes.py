@@ -0,0 +1,182 @@
+import argparse
+import logging
+import random
+import statistics
+import time
+
+from migrations import connect, upgrade, downgrade, HEAD
+from review_queries import PUBLIC_REVIEW_COLUMNS
+
+# Планы EXPLAIN и латентность горячих запросов каталога и профиля до
+# миграции 6 (индексы каталога) и после нее. "До" - схема на версии 5,
+# "после" - на HEAD; данные одни и те же.
+#
+# Запускать на отдельной БД: --generate добавляет синтетические данные.
+#
+#   MYSQL_DB=reviews_bench python bench_indexes.py --generate 20000 --runs 50
+
+BEFORE_VERSION = 5
+
+CATEGORIES = [
+    'Финансы', 'Инструменты', 'Игры', 'Государственные', 'Транспорт', 'Покупки',
+    'Навигация', 'Общение', 'Фото и видео', 'Здоровье', 'Продуктивность', 'Музыка',
+]
+
+# Запросы в том виде, в каком их выполняют app.py и user_endpoints.py;
+# параметры подставляет make_params по диапазонам id сгенерированных данных
+QUERIES = {
+    '/api/apps': (
+        "SELECT * FROM apps WHERE 1=1 ORDER BY created_at DESC",
+        lambda ids: ()
+    ),
+    '/api/apps?featured=true': (
+        "SELECT * FROM apps WHERE 1=1 AND featured = TRUE ORDER BY created_at DESC",
+        lambda ids: ()
+    ),
+    '/api/categories': (
+        "SELECT DISTINCT category as name FROM apps WHERE category IS NOT NULL",
+        lambda ids: ()
+    ),
+    '/api/categories/<name>/apps': (
+        "SELECT * FROM apps WHERE category = %s ORDER BY created_at DESC",
+        lambda ids: (random.choice(CATEGORIES),)
+    ),
+    '/api/user/downloads': (
+        "SELECT a.*, ud.downloaded_at FROM user_downloads ud JOIN apps a ON ud.app_id = a.id "
+        "WHERE ud.user_id = %s ORDER BY ud.downloaded_at DESC",
+        lambda ids: (random.randint(*ids['users']),)
+    ),
+    '/api/user/favorites': (
+        "SELECT a.*, uf.added_at FROM user_favorites uf JOIN apps a ON uf.app_id = a.id "
+        "WHERE uf.user_id = %s ORDER BY uf.added_at DESC",
+        lambda ids: (random.randint(*ids['users']),)
+    ),
+    '/api/user/reviews': (
+        f"SELECT {PUBLIC_REVIEW_COLUMNS}, a.name as app_name, a.icon as app_icon "
+        "FROM reviews r JOIN apps a ON r.app_id = a.id "
+        "WHERE r.user_id = %s ORDER BY r.created_at DESC",
+        lambda ids: (random.randint(*ids['users']),)
+    ),
+}
+
+
+def random_time(days=365):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() - random.randint(0, days * 86400)))
+
+
+def insert_batches(cursor, sql, rows, batch=1000):
+    for start in range(0, len(rows), batch):
+        cursor.executemany(sql, rows[start:start + batch])
+
+
+def generate(cursor, apps, users, per_user):
+    # Приложения, пользователи и по per_user загрузок, избранных и отзывов
+    # на пользователя (отзыв - один на приложение, как требует уникальный ключ)
+    print(f"📦 Генерация: {apps} приложений, {users} пользователей, по {per_user} записей профиля")
+    insert_batches(cursor, "INSERT INTO apps (name, description, category, featured, top_week, created_at) "
+                           "VALUES (%s, %s, %s, %s, %s, %s)",
+                   [(f'Bench app {i}', 'Синтетическое приложение для бенчмарка индексов.',
+                     random.choice(CATEGORIES), random.random() < 0.02, random.random() < 0.02, random_time())
+                    for i in range(apps)])
+    cursor.execute("SELECT MAX(vk_id) FROM users")
+    first_vk_id = (cursor.fetchone()[0] or 0) + 1
+    insert_batches(cursor, "INSERT INTO users (vk_id, first_name, last_name) VALUES (%s, %s, %s)",
+                   [(first_vk_id + i, 'Bench', f'User {i}') for i in range(users)])
+    app_ids, user_ids = id_range(cursor, 'apps', apps), id_range(cursor, 'users', users)
+    downloads, favorites, reviews = [], [], []
+    for user_id in range(user_ids[0], user_ids[1] + 1):
+        for app_id in random.sample(range(app_ids[0], app_ids[1] + 1), per_user):
+            downloads.append((user_id, app_id, random_time()))
+            favorites.append((user_id, app_id, random_time()))
+            reviews.append((app_id, user_id, 'Синтетический отзыв для бенчмарка.', random.randint(1, 5),
+                            random_time()))
+    insert_batches(cursor, "INSERT INTO user_downloads (user_id, app_id, downloaded_at) VALUES (%s, %s, %s)",
+                   downloads)
+    insert_batches(cursor, "INSERT INTO user_favorites (user_id, app_id, added_at) VALUES (%s, %s, %s)",
+                   favorites)
+    insert_batches(cursor, "INSERT INTO reviews (app_id, user_id, text, rating, created_at) "
+                           "VALUES (%s, %s, %s, %s, %s)", reviews)
+
+
+def id_range(cursor, table, last=None):
+    # Диапазон id таблицы или только last последних строк
+    cursor.execute(f"SELECT MIN(id), MAX(id) FROM {table}")
+    low, high = cursor.fetchone()
+    if last:
+        low = high - last + 1
+    return low, high
+
+
+def measure(cursor, ids, runs):
+    # Медиана и p95 каждого запроса и его план
+    results = {}
+    for name, (sql, make_params) in QUERIES.items():
+        cursor.execute('EXPLAIN ' + sql, make_params(ids))
+        columns = [column[0] for column in cursor.description]
+        plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        timings = []
+        for _ in range(runs):
+            params = make_params(ids)
+            started = time.perf_counter()
+            cursor.execute(sql, params)
+            cursor.fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results[name] = {
+            'plan': plan,
+            'median': statistics.median(timings),
+            'p95': timings[int(len(timings) * 0.95) - 1],
+        }
+    return results
+
+
+def print_plan(plan):
+    for row in plan:
+        print(f"      {row['table']}: type={row['type']} key={row['key']} rows={row['rows']} extra={row['Extra']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EXPLAIN и латентность запросов каталога до и после миграции 6')
+    parser.add_argument('--generate', type=int, default=0, help='сколько синтетических приложений добавить')
+    parser.add_argument('--users', type=int, default=2000, help='сколько пользователей добавить с --generate')
+    parser.add_argument('--per-user', type=int, default=20, help='загрузок, избранных и отзывов на пользователя')
+    parser.add_argument('--runs', type=int, default=50, help='повторов каждого запроса')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    upgrade(HEAD)
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            if args.generate:
+                generate(cursor, args.generate, args.users, args.per_user)
+            cursor.execute("SELECT COUNT(*) FROM apps")
+            total = cursor.fetchone()[0]
+            if not total:
+                print('❌ Таблица apps пуста - запустите с --generate N')
+                return
+            ids = {'users': id_range(cursor, 'users')}
+            cursor.execute("ANALYZE TABLE apps, reviews, user_downloads, user_favorites")
+            cursor.fetchall()
+            print(f"📊 {total} приложений, {args.runs} повторов каждого запроса\n")
+
+            downgrade(BEFORE_VERSION)
+            before = measure(cursor, ids, args.runs)
+            upgrade(HEAD)
+            after = measure(cursor, ids, args.runs)
+    finally:
+        conn.close()
+
+    for name in QUERIES:
+        b, a = before[name], after[name]
+        speedup = b['median'] / a['median'] if a['median'] else float('inf')
+        print(f"▶ {name}")
+        print(f"   до:    медиана {b['median']:8.3f} мс  p95 {b['p95']:8.3f} мс")
+        print_plan(b['plan'])
+        print(f"   после: медиана {a['median']:8.3f} мс  p95 {a['p95']:8.3f} мс  (x{speedup:.1f})")
+        print_plan(a['plan'])
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import logging
+import statistics
+import time
+
+from app import app
+from db_pool import pool
+
+# Латентность горячих endpoints отзывов без пула (соединение на каждый
+# запрос, POOL_SIZE=0) и с пулом соединений. Запросы идут через Flask
+# test client - без HTTP, только обработчик и БД.
+#
+#   python bench_pool.py --app-id 1 --runs 500
+
+ENDPOINTS = [
+    '/api/apps/{app_id}/reviews',
+    '/api/apps/{app_id}/rating',
+    '/api/health',
+]
+
+
+def measure(client, path, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        response = client.get(path)
+        timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 500:
+            raise RuntimeError(f"{path}: {response.status_code} {response.get_data(as_text=True)}")
+    timings.sort()
+    return {
+        'avg': statistics.mean(timings),
+        'p50': timings[len(timings) // 2],
+        'p95': timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def run(pool_size, app_id, runs):
+    pool.close_all()
+    pool.max_size = pool_size
+    client = app.test_client()
+    # Прогрев: соединения пула и кэши MySQL
+    for endpoint in ENDPOINTS:
+        measure(client, endpoint.format(app_id=app_id), 10)
+    return {endpoint: measure(client, endpoint.format(app_id=app_id), runs) for endpoint in ENDPOINTS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Латентность endpoints отзывов без пула и с пулом соединений')
+    parser.add_argument('--app-id', type=int, default=1)
+    parser.add_argument('--runs', type=int, default=300)
+    parser.add_argument('--pool-size', type=int, default=pool.max_size or 10)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    without_pool = run(0, args.app_id, args.runs)
+    with_pool = run(args.pool_size, args.app_id, args.runs)
+
+    print(f"{'endpoint':32} {'без пула avg/p95, мс':>22} {'с пулом avg/p95, мс':>22} {'экономия, мс':>13}")
+    for endpoint in ENDPOINTS:
+        before, after = without_pool[endpoint], with_pool[endpoint]
+        print(f"{endpoint:32} {before['avg']:>12.2f} / {before['p95']:<7.2f} "
+              f"{after['avg']:>12.2f} / {after['p95']:<7.2f} {before['avg'] - after['avg']:>13.2f}")
+    print(f"\nПул: {pool.status()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import asyncio
+import time
+
+import httpx
+
+# Пропускная способность сервиса отзывов под параллельной нагрузкой.
+# Запускается против каждого режима по очереди на одной и той же БД:
+#
+#   python app.py                          # синхронный Flask, порт 5000
+#   python bench_serving.py --concurrency 500 --requests 20000
+#
+#   python asgi_app.py --port 5000         # асинхронный режим
+#   python bench_serving.py --concurrency 500 --requests 20000
+#
+# Печатает запросов в секунду, перцентили латентности и число ошибок
+# (503 от пула и breaker считаются отдельно).
+
+DEFAULT_PATHS = ['/api/apps/{app_id}/reviews', '/api/apps/{app_id}/rating']
+
+
+async def worker(client, paths, app_ids, counter, total, timings, statuses):
+    while True:
+        index = counter[0]
+        if index >= total:
+            return
+        counter[0] += 1
+        path = paths[index % len(paths)].format(app_id=app_ids[index % len(app_ids)])
+        started = time.perf_counter()
+        try:
+            response = await client.get(path)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        timings.append((time.perf_counter() - started) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        timings, statuses, counter = [], {}, [0]
+        app_ids = list(range(1, args.apps + 1))
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            worker(client, args.paths, app_ids, counter, args.requests, timings, statuses)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    timings.sort()
+
+    def percentile(p):
+        return timings[min(len(timings) - 1, int(len(timings) * p))]
+
+    print(f"🎯 {args.url}: {args.requests} запросов, параллельно {args.concurrency}")
+    print(f"   {args.requests / elapsed:.0f} запросов/с за {elapsed:.1f} с")
+    print(f"   латентность p50 {percentile(0.5):.1f} мс, p95 {percentile(0.95):.1f} мс, "
+          f"p99 {percentile(0.99):.1f} мс")
+    print(f"   ответы: {dict(sorted(statuses.items(), key=str))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест чтения отзывов')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--apps', type=int, default=10, help='id приложений 1..N для запросов')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import itertools
+import threading
+import time
+import logging
+from collections import deque, Counter
+
+import pymysql
+from flask import has_request_context, request
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Защита от медленной или недоступной БД:
+# - соединение при выдаче из пула получает max_execution_time своего endpoint
+#   (STATEMENT_TIMEOUTS, иначе STATEMENT_TIMEOUT_MS), зависший SELECT
+#   прерывается MySQL, а read_timeout ограничивает ожидание ответа сервера;
+# - circuit breaker считает ошибки и медленные запросы за последние
+#   BREAKER_WINDOW_SECONDS и при превышении порога открывается: новые
+#   соединения не открываются, endpoints сразу отвечают 503 с Retry-After.
+#   Через BREAKER_OPEN_SECONDS несколько пробных запросов проверяют БД.
+#
+# Пробный запрос в полуоткрытом состоянии - единица "выдача соединения -
+# возврат": check() выдает токен пробы, release() при возврате соединения
+# засчитывает ее как успешную. Ошибка перегрузки или медленный запрос во
+# время пробы снова открывают breaker. Проба, не вернувшаяся за
+# BREAKER_PROBE_TIMEOUT секунд, тоже открывает breaker - пробные слоты не
+# могут закончиться навсегда.
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Коды MySQL, означающие перегрузку, а не ошибку в запросе:
+# превышен max_execution_time, таймаут блокировки, запрос прерван
+OVERLOAD_ERRNOS = {3024, 1205, 1317}
+# Нет соединения с сервером или оно потеряно (в том числе по read_timeout)
+CONNECTION_ERRNOS = {2003, 2006, 2013, 2055}
+
+
+class DatabaseUnavailable(Exception):
+    def __init__(self, retry_after):
+        super().__init__('Database is temporarily unavailable')
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    # Скользящее окно по секундам; Flask обслуживает запросы в потоках,
+    # поэтому состояние меняется под блокировкой
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.state = CLOSED
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        # [секунда, запросы, ошибки, медленные]
+        self._window = deque()
+        self._opened_at = 0.0
+        # Незавершенные пробы: токен -> время выдачи
+        self._probes = {}
+        self._probe_ids = itertools.count(1)
+        self._probe_successes = 0
+
+    def check(self):
+        # None - БД доступна; в полуоткрытом состоянии - токен пробы, который
+        # нужно вернуть через release(); если БД недоступна - DatabaseUnavailable
+        if not self.enabled or self.state == CLOSED:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= Config.BREAKER_OPEN_SECONDS:
+                self._transition(HALF_OPEN)
+                self._probes.clear()
+                self._probe_successes = 0
+            if self.state == HALF_OPEN:
+                self._expire_probes(now)
+            if self.state == HALF_OPEN and len(self._probes) < Config.BREAKER_HALF_OPEN_PROBES:
+                probe = next(self._probe_ids)
+                self._probes[probe] = now
+                return probe
+            if self.state == CLOSED:
+                return None
+            self.stats['rejected'] += 1
+        raise DatabaseUnavailable(self.retry_after())
+
+    def release(self, probe, success=True):
+        # Проба завершена. success=False - исход неизвестен (соединение не
+        # получено, забыто): слот освобождается без успеха
+        if probe is None:
+            return
+        with self._lock:
+            # Пробы, выданные до повторного открытия, уже не учитываются
+            if self._probes.pop(probe, None) is None or not success:
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= Config.BREAKER_HALF_OPEN_PROBES:
+                self._window.clear()
+                self._transition(CLOSED)
+
+    def _expire_probes(self, now):
+        if self._probes and now - min(self._probes.values()) >= Config.BREAKER_PROBE_TIMEOUT:
+            self._open(f'пробный запрос не завершился за {Config.BREAKER_PROBE_TIMEOUT:g} с')
+
+    def retry_after(self):
+        remaining = Config.BREAKER_OPEN_SECONDS - (time.monotonic() - self._opened_at)
+        return max(1, round(remaining))
+
+    def record(self, duration_ms, failed):
+        if not self.enabled:
+            return
+        slow = duration_ms >= Config.BREAKER_SLOW_MS
+        with self._lock:
+            if self.state == HALF_OPEN:
+                # Успех пробы засчитывает release(), здесь - только отказ
+                if failed or slow:
+                    self._open('пробный запрос неуспешен')
+                return
+            if self.state == OPEN:
+                return
+
+            second = int(time.monotonic())
+            if not self._window or self._window[-1][0] != second:
+                self._window.append([second, 0, 0, 0])
+            bucket = self._window[-1]
+            bucket[1] += 1
+            bucket[2] += failed
+            bucket[3] += slow
+            while self._window[0][0] <= second - Config.BREAKER_WINDOW_SECONDS:
+                self._window.popleft()
+
+            calls, failures, slow_calls = self._totals()
+            if calls < Config.BREAKER_MIN_CALLS:
+                return
+            if failures / calls >= Config.BREAKER_ERROR_RATE:
+                self._open(f'ошибок {failures} из {calls}')
+            elif slow_calls / calls >= Config.BREAKER_SLOW_RATE:
+                self._open(f'медленных запросов {slow_calls} из {calls}')
+
+    def _totals(self):
+        return tuple(sum(bucket[i] for bucket in self._window) for i in (1, 2, 3))
+
+    def _open(self, reason):
+        self._opened_at = time.monotonic()
+        self._window.clear()
+        self._probes.clear()
+        self._transition(OPEN)
+        logger.warning(f"⚡ Circuit breaker БД открыт: {reason}, "
+                       f"запросы отклоняются {Config.BREAKER_OPEN_SECONDS:g} с")
+
+    def _transition(self, state):
+        if state == CLOSED and self.state != CLOSED:
+            logger.info("✅ Circuit breaker БД закрыт")
+        self.state = state
+        self.stats[f'to_{state}'] += 1
+
+    def status(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._expire_probes(time.monotonic())
+            calls, failures, slow_calls = self._totals()
+            return {
+                'enabled': self.enabled,
+                'state': self.state,
+                'window': {'calls': calls, 'failures': failures, 'slow': slow_calls},
+                'retry_after': self.retry_after() if self.state == OPEN else None,
+                'probes': {'in_flight': len(self._probes), 'successes': self._probe_successes}
+                if self.state == HALF_OPEN else None,
+                'stats': dict(self.stats),
+            }
+
+
+breaker = CircuitBreaker(Config.BREAKER_ENABLED)
+
+
+def statement_timeout_ms():
+    # Предел выполнения SELECT для текущего endpoint (0 - без предела)
+    if not has_request_context():
+        return 0
+    rule = request.url_rule.rule if request.url_rule else request.path
+    return Config.STATEMENT_TIMEOUTS.get(rule, Config.STATEMENT_TIMEOUT_MS)
+
+
+def is_overload(error):
+    # Ошибка говорит о состоянии БД (недоступна, перегружена), а не о запросе
+    if isinstance(error, pymysql.err.InterfaceError):
+        return True
+    return (isinstance(error, pymysql.err.MySQLError) and bool(error.args)
+            and error.args[0] in OVERLOAD_ERRNOS | CONNECTION_ERRNOS)
@@ -14,4 +14,81 @@ class Config:
     # VK OAuth configuration
     VK_CLIENT_ID = os.getenv('VK_CLIENT_ID', 'your_vk_app_id')
     VK_CLIENT_SECRET = os.getenv('VK_CLIENT_SECRET', 'your_vk_secure_key')
-    VK_REDIRECT_URI = os.getenv('VK_REDIRECT_URI', 'http://localhost:5173/auth/callback')
\ No newline at end of file
+    VK_REDIRECT_URI = os.getenv('VK_REDIRECT_URI', 'http://localhost:5173/auth/callback')
+    
+    # Журнал медленных запросов: порог в мс и EXPLAIN для новых форм SELECT
+    SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 100))
+    SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN', '1') == '1'
+    
+    # Трассировка: off, memory (только /api/debug/traces) или file (JSON Lines)
+    TRACE_EXPORT = os.getenv('TRACE_EXPORT', 'off')
+    TRACE_FILE = os.getenv('TRACE_FILE', 'traces-vad.jsonl')
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 1.0))
+    
+    # Таймауты запросов: max_execution_time для SELECT в мс по умолчанию и по
+    # шаблонам маршрутов ('/api/apps=1000,/api/apps/<int:app_id>/rating=1000'),
+    # ожидание блокировки строки и ответа сервера (сек). 0 - без предела
+    STATEMENT_TIMEOUT_MS = int(os.getenv('STATEMENT_TIMEOUT_MS', 2000))
+    STATEMENT_TIMEOUTS = {
+        route.strip(): int(value)
+        for route, _, value in (
+            item.partition('=') for item in os.getenv('STATEMENT_TIMEOUTS', '/api/apps=1000').split(',')
+            if '=' in item
+        )
+    }
+    LOCK_WAIT_TIMEOUT = int(os.getenv('LOCK_WAIT_TIMEOUT', 5))
+    DB_READ_TIMEOUT = float(os.getenv('DB_READ_TIMEOUT', 10))
+    DB_CONNECT_TIMEOUT = float(os.getenv('DB_CONNECT_TIMEOUT', 5))
+    
+    # Пул соединений (db_pool.py): максимум открытых соединений (0 - без пула),
+    # ожидание свободного соединения, максимальный возраст соединения и
+    # простой, после которого соединение проверяется ping перед выдачей (сек)
+    POOL_SIZE = int(os.getenv('POOL_SIZE', 10))
+    POOL_TIMEOUT = float(os.getenv('POOL_TIMEOUT', 5))
+    POOL_MAX_LIFETIME = float(os.getenv('POOL_MAX_LIFETIME', 1800))
+    POOL_PING_AFTER = float(os.getenv('POOL_PING_AFTER', 30))
+    
+    # Асинхронный режим (asgi_app.py): соединений aiomysql на процесс
+    # и таймаут запросов к VK API (сек)
+    ASYNC_POOL_SIZE = int(os.getenv('ASYNC_POOL_SIZE', 50))
+    VK_TIMEOUT = float(os.getenv('VK_TIMEOUT', 10))
+    
+    # /api/ratings: максимум приложений в запросе и время жизни сводки
+    # рейтинга приложения в кэше процесса (сек)
+    RATINGS_MAX_APPS = int(os.getenv('RATINGS_MAX_APPS', 300))
+    RATINGS_CACHE_TTL = float(os.getenv('RATINGS_CACHE_TTL', 30))
+    
+    # Буфер оценок отзывов (vote_buffer.py): период записи накопленных
+    # лайков в БД (сек) и число голосов, при котором запись начинается раньше
+    VOTE_FLUSH_INTERVAL = float(os.getenv('VOTE_FLUSH_INTERVAL', 1))
+    VOTE_BUFFER_MAX = int(os.getenv('VOTE_BUFFER_MAX', 5000))
+    
+    # Фоновая обработка новых отзывов (review_tasks.py): потоков-обработчиков
+    # и период прохода по отзывам, чьи задачи потерялись (сек)
+    REVIEW_WORKERS = int(os.getenv('REVIEW_WORKERS', 2))
+    REVIEW_SWEEP_INTERVAL = float(os.getenv('REVIEW_SWEEP_INTERVAL', 30))
+    
+    # Фильтр текста отзывов (content_filter.py): файл шаблонов и как часто
+    # проверять его изменение (сек)
+    CONTENT_FILTER_PATTERNS = os.getenv(
+        'CONTENT_FILTER_PATTERNS',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'content_filter_patterns.txt')
+    )
+    CONTENT_FILTER_RELOAD_INTERVAL = float(os.getenv('CONTENT_FILTER_RELOAD_INTERVAL', 5))
+    
+    # Почти одинаковые отзывы (near_duplicates.py): порог оценки сходства
+    # Жаккара по подписям MinHash
+    NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', 0.8))
+    
+    # Circuit breaker БД: окно (сек), минимум запросов, пороги доли ошибок и
+    # медленных запросов, время в открытом состоянии, число пробных запросов
+    # и сколько ждать их завершения до повторного открытия (сек)
+    BREAKER_ENABLED = os.getenv('BREAKER_ENABLED', '1') == '1'
+    BREAKER_WINDOW_SECONDS = int(os.getenv('BREAKER_WINDOW_SECONDS', 10))
+    BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', 20))
+    BREAKER_ERROR_RATE = float(os.getenv('BREAKER_ERROR_RATE', 0.5))
+    BREAKER_SLOW_MS = float(os.getenv('BREAKER_SLOW_MS', 1000))
+    BREAKER_SLOW_RATE = float(os.getenv('BREAKER_SLOW_RATE', 0.8))
+    BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', 5))
+    BREAKER_HALF_OPEN_PROBES = int(os.getenv('BREAKER_HALF_OPEN_PROBES', 3))
+    BREAKER_PROBE_TIMEOUT = float(os.getenv('BREAKER_PROBE_TIMEOUT', 10))
\ No newline at end of file
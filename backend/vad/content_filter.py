@@ -0,0 +1,262 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import deque, namedtuple
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Фильтр текста отзывов: мат, спам-ссылки и запрещенные фразы.
+#
+# Все шаблоны собраны в один автомат Ахо-Корасик, поэтому проверка - один
+# проход по тексту, и ее стоимость растет с длиной текста, а не с числом
+# шаблонов. Текст и шаблоны нормализуются одинаково: нижний регистр, ё -> е,
+# латинские буквы-двойники -> кириллица (a, e, o, p, c, x, y, k, m, t, h, b),
+# пробелы схлопываются.
+#
+# Файл шаблонов (CONTENT_FILTER_PATTERNS) - строки "категория: шаблон",
+# # - комментарий. По умолчанию шаблон совпадает только с целым словом;
+# * в начале или конце снимает границу слова с этой стороны:
+#   profanity: бля          - только слово целиком
+#   profanity: *пизд*       - в любом месте слова
+#   spam: *t.me/*
+# Файл перечитывается при изменении (проверка не чаще раза в
+# CONTENT_FILTER_RELOAD_INTERVAL секунд), перезапуск сервиса не нужен.
+#
+#   python content_filter.py check "текст"
+#   python content_filter.py scan [--delete]   # проверка всех отзывов в БД
+
+Pattern = namedtuple('Pattern', 'category text word_start word_end')
+
+LOOKALIKES = str.maketrans({
+    'a': 'а', 'e': 'е', 'o': 'о', 'p': 'р', 'c': 'с', 'x': 'х', 'y': 'у',
+    'k': 'к', 'm': 'м', 't': 'т', 'h': 'н', 'b': 'в', 'ё': 'е',
+    # Невидимые символы, которыми разбивают слова
+    '\u200b': None, '\u200c': None, '\u200d': None, '\u00ad': None, '\ufeff': None,
+})
+
+
+def normalize(text):
+    return ' '.join(text.lower().translate(LOOKALIKES).split())
+
+
+def is_word_char(char):
+    return char.isalnum() or char == '_'
+
+
+class Automaton:
+    # Автомат Ахо-Корасик: переходы по символам, суффиксные ссылки и
+    # шаблоны, заканчивающиеся в каждом состоянии (с учетом суффиксов)
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for pattern in patterns:
+            self._add(pattern)
+        self._link()
+        self.size = len(patterns)
+
+    def _add(self, pattern):
+        state = 0
+        for char in pattern.text:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(())
+            state = next_state
+        self.output[state] += (pattern,)
+
+    def _link(self):
+        # Обход в ширину: суффиксная ссылка состояния - самый длинный его
+        # собственный суффикс, который есть в боре
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] += self.output[self.fail[next_state]]
+
+    def search(self, text):
+        # (позиция последнего символа, шаблон) для каждого вхождения
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern in output[state]:
+                yield index, pattern
+
+
+def parse_patterns(lines):
+    patterns = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        category, separator, text = line.partition(':')
+        text = text.strip()
+        if not separator or not text.strip('*'):
+            logger.warning(f"⚠️ Фильтр отзывов: строка {number} пропущена: {line!r}")
+            continue
+        word_start = not text.startswith('*')
+        word_end = not text.endswith('*')
+        patterns.append(Pattern(category.strip(), normalize(text.strip('*')), word_start, word_end))
+    return patterns
+
+
+class ContentFilter:
+    def __init__(self, path, reload_interval):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.automaton = Automaton([])
+        self.categories = {}
+        self.loaded_mtime = None
+        self.loaded_at = None
+        self.reloads = 0
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        # Новый автомат строится целиком и подменяет старый одной ссылкой:
+        # параллельные проверки не видят наполовину собранного автомата
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, encoding='utf-8') as f:
+                patterns = parse_patterns(f)
+        except OSError as e:
+            logger.warning(f"⚠️ Фильтр отзывов: не удалось прочитать {self.path}: {e}")
+            return False
+        started = time.perf_counter()
+        automaton = Automaton(patterns)
+        categories = {}
+        for pattern in patterns:
+            categories[pattern.category] = categories.get(pattern.category, 0) + 1
+        self.automaton, self.categories = automaton, categories
+        self.loaded_mtime, self.loaded_at = mtime, time.time()
+        self.reloads += 1
+        logger.info(f"🛡️ Фильтр отзывов: {len(patterns)} шаблонов, {len(automaton.goto)} состояний "
+                    f"за {(time.perf_counter() - started) * 1000:.1f} мс")
+        return True
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._checked_at = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                return
+            if mtime != self.loaded_mtime:
+                self.reload()
+        finally:
+            self._lock.release()
+
+    def matches(self, text):
+        # Совпавшие шаблоны: {категория: [шаблоны]}
+        self._reload_if_changed()
+        text = normalize(text)
+        found = {}
+        for end, pattern in self.automaton.search(text):
+            start = end - len(pattern.text) + 1
+            if pattern.word_start and start > 0 and is_word_char(text[start - 1]):
+                continue
+            if pattern.word_end and end + 1 < len(text) and is_word_char(text[end + 1]):
+                continue
+            found.setdefault(pattern.category, [])
+            if pattern.text not in found[pattern.category]:
+                found[pattern.category].append(pattern.text)
+        return found
+
+    def rejection(self, text):
+        # Тело ответа 400 для недопустимого текста или None. Сами шаблоны в
+        # ответ не попадают, чтобы их нельзя было подобрать
+        found = self.matches(text)
+        if not found:
+            return None
+        return {
+            'success': False,
+            'error': 'Review text contains forbidden content',
+            'categories': sorted(found)
+        }
+
+    def status(self):
+        return {
+            'path': self.path,
+            'patterns': self.automaton.size,
+            'states': len(self.automaton.goto),
+            'categories': self.categories,
+            'loaded_at': self.loaded_at,
+            'reloads': self.reloads,
+        }
+
+
+content_filter = ContentFilter(Config.CONTENT_FILTER_PATTERNS, Config.CONTENT_FILTER_RELOAD_INTERVAL)
+
+
+def scan(batch_size=1000, delete=False):
+    # Проверка уже сохраненных отзывов порциями по id; --delete удаляет
+    # найденные с поправкой агрегата рейтинга, как DELETE /api/reviews/<id>
+    from db_pool import get_db_connection
+    from rating_stats import apply_delta
+
+    last_id, checked, flagged = 0, 0, 0
+    while True:
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT id, app_id, text FROM reviews WHERE id > %s ORDER BY id LIMIT %s",
+                               (last_id, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                for row in rows:
+                    found = content_filter.matches(row['text'])
+                    if not found:
+                        continue
+                    flagged += 1
+                    print(f"review {row['id']} (app {row['app_id']}): {found}")
+                    if delete:
+                        cursor.execute("SELECT app_id, rating, aggregated FROM reviews WHERE id = %s FOR UPDATE",
+                                       (row['id'],))
+                        review = cursor.fetchone()
+                        if review:
+                            cursor.execute("DELETE FROM reviews WHERE id = %s", (row['id'],))
+                            if review['aggregated']:
+                                apply_delta(cursor, review['app_id'], old_rating=review['rating'])
+                            conn.commit()
+            conn.commit()
+        finally:
+            conn.close()
+        checked += len(rows)
+        last_id = rows[-1]['id']
+    print(f"Проверено отзывов: {checked}, найдено: {flagged}{', удалены' if delete and flagged else ''}")
+    return flagged
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'check' and len(sys.argv) > 2:
+        print(content_filter.matches(' '.join(sys.argv[2:])) or 'OK')
+    elif command == 'scan':
+        scan(delete='--delete' in sys.argv)
+    else:
+        print('Usage: python content_filter.py check "текст" | scan [--delete]')
+        sys.exit(1)
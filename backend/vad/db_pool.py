@@ -0,0 +1,233 @@
+import threading
+import time
+import logging
+from collections import deque, Counter
+
+import pymysql
+
+from config import Config
+from tracing import TracedDictCursor
+from circuit_breaker import breaker, statement_timeout_ms
+
+logger = logging.getLogger(__name__)
+
+# Пул соединений с MySQL, общий для всех endpoints (app.py, user_endpoints.py).
+# Вместо подключения на каждый запрос (TCP, handshake, авторизация)
+# соединение берется из пула и возвращается в него по conn.close():
+# - не больше POOL_SIZE открытых соединений, сверх этого запрос ждет
+#   свободное не дольше POOL_TIMEOUT секунд;
+# - соединение старше POOL_MAX_LIFETIME закрывается (меньше wait_timeout MySQL);
+# - соединение, простоявшее дольше POOL_PING_AFTER, проверяется ping перед выдачей;
+# - при возврате незавершенная транзакция откатывается, чтобы следующий
+#   запрос не видел чужих изменений и старый снимок REPEATABLE READ.
+# POOL_SIZE=0 - без пула, как раньше: соединение на каждый запрос.
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PooledConnection:
+    # Соединение pymysql, у которого close() возвращает его в пул. В
+    # полуоткрытом circuit breaker выдача и возврат соединения - одна проба:
+    # close() засчитывает ее успех, даже если запросов не было (только ping)
+
+    def __init__(self, pool, raw, probe=None):
+        self._pool = pool
+        self._raw = raw
+        self._probe = probe
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw)
+            breaker.release(self._probe)
+
+    def __del__(self):
+        # Забытое соединение не должно навсегда занять место в пуле;
+        # его состояние неизвестно, поэтому оно закрывается
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw, discard=True)
+            breaker.release(self._probe, success=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ConnectionPool:
+    def __init__(self, max_size, timeout, max_lifetime, ping_after):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self.stats = Counter()
+        self._idle = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._wait_total_ms = 0.0
+        self._wait_max_ms = 0.0
+
+    def _connect(self):
+        connection = pymysql.connect(
+            host=Config.MYSQL_HOST,
+            user=Config.MYSQL_USER,
+            password=Config.MYSQL_PASSWORD,
+            database=Config.MYSQL_DB,
+            port=Config.MYSQL_PORT,
+            charset='utf8mb4',
+            cursorclass=TracedDictCursor,
+            connect_timeout=Config.DB_CONNECT_TIMEOUT,
+            read_timeout=Config.DB_READ_TIMEOUT or None,
+            init_command=f"SET SESSION innodb_lock_wait_timeout = {Config.LOCK_WAIT_TIMEOUT}"
+        )
+        connection.vad_created = time.monotonic()
+        connection.vad_statement_timeout = None
+        self.stats['connects'] += 1
+        logger.debug("✅ Новое соединение с базой данных")
+        return connection
+
+    def _acquire_slot(self):
+        # Свободное соединение из пула или право открыть новое (None)
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    item = self._idle.pop()
+                    break
+                if self._size < self.max_size or self.max_size == 0:
+                    self._size += 1
+                    item = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise PoolTimeout(f"No free database connection in {self.timeout:g}s "
+                                      f"(pool size {self.max_size})")
+                self._cond.wait(remaining)
+            wait_ms = (time.monotonic() - started) * 1000
+            self.stats['checkouts'] += 1
+            self._wait_total_ms += wait_ms
+            self._wait_max_ms = max(self._wait_max_ms, wait_ms)
+        return item
+
+    def _usable(self, raw, last_used):
+        now = time.monotonic()
+        if now - raw.vad_created > self.max_lifetime:
+            self.stats['expired'] += 1
+            return False
+        if now - last_used > self.ping_after:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                self.stats['broken'] += 1
+                return False
+        return True
+
+    def get(self, probe=None):
+        started = time.perf_counter()
+        try:
+            item = self._acquire_slot()
+        except PoolTimeout:
+            # Все соединения заняты слишком долго - признак медленной БД
+            breaker.record((time.perf_counter() - started) * 1000, failed=True)
+            raise
+
+        raw = None
+        if item is not None:
+            raw, last_used = item
+            if not self._usable(raw, last_used):
+                self._close(raw)
+                raw = None
+        if raw is None:
+            try:
+                raw = self._connect()
+            except Exception:
+                breaker.record((time.perf_counter() - started) * 1000, failed=True)
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+        else:
+            self.stats['reused'] += 1
+
+        try:
+            self._apply_statement_timeout(raw)
+        except Exception:
+            self.release(raw, discard=True)
+            raise
+        return PooledConnection(self, raw, probe)
+
+    def _apply_statement_timeout(self, raw):
+        # Предел выполнения SELECT текущего endpoint; SET только при изменении
+        timeout_ms = statement_timeout_ms()
+        if raw.vad_statement_timeout != timeout_ms:
+            with raw.cursor(pymysql.cursors.Cursor) as cursor:
+                cursor.execute(f"SET SESSION max_execution_time = {timeout_ms}")
+            raw.vad_statement_timeout = timeout_ms
+
+    def release(self, raw, discard=False):
+        if not discard and self.max_size > 0 and raw.open:
+            try:
+                raw.rollback()
+            except Exception:
+                discard = True
+        else:
+            discard = True
+
+        if discard:
+            self._close(raw)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((raw, time.monotonic()))
+            self._cond.notify()
+
+    def _close(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+        for raw, _ in idle:
+            self._close(raw)
+
+    def status(self):
+        with self._cond:
+            checkouts = self.stats['checkouts']
+            return {
+                'max_size': self.max_size,
+                'open': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'wait_avg_ms': round(self._wait_total_ms / checkouts, 3) if checkouts else 0.0,
+                'wait_max_ms': round(self._wait_max_ms, 3),
+                'stats': dict(self.stats),
+            }
+
+
+pool = ConnectionPool(Config.POOL_SIZE, Config.POOL_TIMEOUT, Config.POOL_MAX_LIFETIME, Config.POOL_PING_AFTER)
+
+
+def get_db_connection():
+    # Пока circuit breaker открыт, соединение не выдается - сразу 503
+    probe = breaker.check()
+    try:
+        return pool.get(probe)
+    except Exception as e:
+        breaker.release(probe, success=False)
+        logger.error(f"❌ Ошибка подключения к базе данных: {str(e)}")
+        raise
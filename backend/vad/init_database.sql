@@ -23,8 +23,11 @@ CREATE TABLE IF NOT EXISTS apps (
     featured BOOLEAN DEFAULT FALSE,
     top_week BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    INDEX category_index (category),
-    INDEX featured_index (featured)
+    -- Списки каталога отдаются в порядке created_at DESC
+    INDEX apps_created_index (created_at),
+    INDEX apps_category_created_index (category, created_at),
+    INDEX apps_featured_created_index (featured, created_at),
+    INDEX apps_top_week_created_index (top_week, created_at)
 );
 
 -- Обновленная таблица отзывов
@@ -35,11 +38,60 @@ CREATE TABLE IF NOT EXISTS reviews (
     text TEXT NOT NULL,
     rating INT DEFAULT 0,
     likes INT DEFAULT 0,
+    dislikes INT NOT NULL DEFAULT 0,
+    -- Нижняя граница Уилсона для доли лайков, пересчитывается при оценке
+    helpful_score DOUBLE NOT NULL DEFAULT 0,
+    -- 0 - отзыв еще не учтен в app_rating_stats фоновым обработчиком
+    aggregated TINYINT(1) NOT NULL DEFAULT 1,
+    -- Подпись MinHash текста (near_duplicates.py) и самый ранний похожий отзыв
+    minhash VARBINARY(256) NULL,
+    duplicate_of INT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL,
-    INDEX app_id_index (app_id),
-    INDEX user_id_index (user_id),
-    INDEX rating_index (rating)
+    INDEX reviews_user_created_index (user_id, created_at),
+    INDEX rating_index (rating),
+    UNIQUE KEY reviews_app_user_unique (app_id, user_id),
+    INDEX reviews_aggregated_index (aggregated),
+    INDEX reviews_duplicate_of_index (duplicate_of),
+    -- Постраничная выдача отзывов приложения по каждому порядку сортировки
+    INDEX reviews_app_created_index (app_id, created_at, id),
+    INDEX reviews_app_likes_index (app_id, likes, id),
+    INDEX reviews_app_rating_index (app_id, rating, id),
+    INDEX reviews_app_helpful_index (app_id, helpful_score, id)
+);
+
+-- Голоса за полезность отзыва: один на пользователя (1 - лайк, -1 - дизлайк)
+CREATE TABLE IF NOT EXISTS review_votes (
+    review_id INT NOT NULL,
+    user_id INT NOT NULL,
+    vote TINYINT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (review_id, user_id),
+    FOREIGN KEY (review_id) REFERENCES reviews(id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Корзины LSH подписей MinHash: отзывы с одинаковой полосой подписи
+CREATE TABLE IF NOT EXISTS review_lsh (
+    band TINYINT UNSIGNED NOT NULL,
+    bucket BIGINT UNSIGNED NOT NULL,
+    review_id INT NOT NULL,
+    PRIMARY KEY (band, bucket, review_id),
+    INDEX review_lsh_review_index (review_id),
+    FOREIGN KEY (review_id) REFERENCES reviews(id) ON DELETE CASCADE
+);
+
+-- Агрегаты рейтинга по приложению, меняются в одной транзакции с отзывом
+CREATE TABLE IF NOT EXISTS app_rating_stats (
+    app_id INT PRIMARY KEY,
+    reviews_count INT NOT NULL DEFAULT 0,
+    rating_sum INT NOT NULL DEFAULT 0,
+    rating_1 INT NOT NULL DEFAULT 0,
+    rating_2 INT NOT NULL DEFAULT 0,
+    rating_3 INT NOT NULL DEFAULT 0,
+    rating_4 INT NOT NULL DEFAULT 0,
+    rating_5 INT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 );
 
 -- Таблица загрузок пользователей
@@ -50,7 +102,9 @@ CREATE TABLE IF NOT EXISTS user_downloads (
     downloaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id),
     FOREIGN KEY (app_id) REFERENCES apps(id),
-    INDEX user_app_index (user_id, app_id)
+    INDEX user_app_index (user_id, app_id),
+    -- Список загрузок профиля: порядок и app_id для JOIN без чтения строк
+    INDEX user_downloads_user_time_index (user_id, downloaded_at, app_id)
 );
 
 -- Таблица избранного
@@ -62,5 +116,5 @@ CREATE TABLE IF NOT EXISTS user_favorites (
     FOREIGN KEY (user_id) REFERENCES users(id),
     FOREIGN KEY (app_id) REFERENCES apps(id),
     UNIQUE KEY unique_user_favorite (user_id, app_id),
-    INDEX user_index (user_id)
+    INDEX user_favorites_user_time_index (user_id, added_at, app_id)
 );
\ No newline at end of file
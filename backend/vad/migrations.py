@@ -0,0 +1,347 @@
+import sys
+import logging
+
+import pymysql
+
+from config import Config
+from review_queries import WILSON_SQL
+from rating_stats import REBUILD_SQL
+
+logger = logging.getLogger(__name__)
+
+# Версионные миграции схемы сервиса отзывов (init_database.sql - схема
+# для новой БД, уже на последней версии).
+#
+# Примененные версии хранятся в vad_schema_migrations. Каждый шаг проверяет
+# наличие колонок и индексов, поэтому безопасен и для БД, созданных из
+# init_database.sql, и для повторного запуска. Индексы строятся online DDL
+# (ALGORITHM=INPLACE, LOCK=NONE) - таблица доступна для чтения и записи.
+#
+#   python migrations.py status
+#   python migrations.py upgrade [version]
+#   python migrations.py downgrade <version>
+
+MIGRATIONS_TABLE = 'vad_schema_migrations'
+
+
+class Migration:
+    def __init__(self, version, description, up, down=None):
+        self.version = version
+        self.description = description
+        self.up = up
+        self.down = down
+
+
+def connect():
+    return pymysql.connect(
+        host=Config.MYSQL_HOST,
+        user=Config.MYSQL_USER,
+        password=Config.MYSQL_PASSWORD,
+        database=Config.MYSQL_DB,
+        port=Config.MYSQL_PORT,
+        charset='utf8mb4',
+        autocommit=True
+    )
+
+
+def column_exists(cursor, table, column):
+    cursor.execute(
+        "SELECT 1 FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+        (table, column)
+    )
+    return cursor.fetchone() is not None
+
+
+def index_exists(cursor, table, name):
+    cursor.execute(
+        "SELECT 1 FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+        (table, name)
+    )
+    return cursor.fetchone() is not None
+
+
+def table_exists(cursor, table):
+    cursor.execute(
+        "SELECT 1 FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+        (table,)
+    )
+    return cursor.fetchone() is not None
+
+
+def add_column(cursor, table, column, ddl):
+    if column_exists(cursor, table, column):
+        return
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}, ALGORITHM=INPLACE, LOCK=NONE")
+    logger.info(f"   ✅ Добавлена колонка {table}.{column}")
+
+
+def drop_column(cursor, table, column):
+    if column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+        logger.info(f"   🗑️ Удалена колонка {table}.{column}")
+
+
+def create_index(cursor, table, name, columns_sql, unique=False):
+    if index_exists(cursor, table, name):
+        return
+    kind = 'UNIQUE INDEX' if unique else 'INDEX'
+    cursor.execute(f"ALTER TABLE {table} ADD {kind} {name} ({columns_sql}), ALGORITHM=INPLACE, LOCK=NONE")
+    logger.info(f"   ✅ Создан индекс {name} on {table}({columns_sql})")
+
+
+def drop_index(cursor, table, name):
+    if index_exists(cursor, table, name):
+        cursor.execute(f"ALTER TABLE {table} DROP INDEX {name}, ALGORITHM=INPLACE, LOCK=NONE")
+        logger.info(f"   🗑️ Удален индекс {name} on {table}")
+
+
+# --- Шаги миграций ---
+
+REVIEW_ORDER_INDEXES = [
+    ('reviews_app_created_index', 'app_id, created_at, id'),
+    ('reviews_app_likes_index', 'app_id, likes, id'),
+    ('reviews_app_rating_index', 'app_id, rating, id'),
+    ('reviews_app_helpful_index', 'app_id, helpful_score, id'),
+]
+
+
+def _review_pagination_up(cursor):
+    add_column(cursor, 'reviews', 'dislikes', 'INT NOT NULL DEFAULT 0')
+    add_column(cursor, 'reviews', 'helpful_score', 'DOUBLE NOT NULL DEFAULT 0')
+    cursor.execute(f"UPDATE reviews SET helpful_score = {WILSON_SQL} WHERE likes > 0 OR dislikes > 0")
+    for name, columns_sql in REVIEW_ORDER_INDEXES:
+        create_index(cursor, 'reviews', name, columns_sql)
+
+
+def _review_pagination_down(cursor):
+    for name, _ in REVIEW_ORDER_INDEXES:
+        drop_index(cursor, 'reviews', name)
+    drop_column(cursor, 'reviews', 'helpful_score')
+    drop_column(cursor, 'reviews', 'dislikes')
+
+
+def _rating_stats_up(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS app_rating_stats (
+            app_id INT PRIMARY KEY,
+            reviews_count INT NOT NULL DEFAULT 0,
+            rating_sum INT NOT NULL DEFAULT 0,
+            rating_1 INT NOT NULL DEFAULT 0,
+            rating_2 INT NOT NULL DEFAULT 0,
+            rating_3 INT NOT NULL DEFAULT 0,
+            rating_4 INT NOT NULL DEFAULT 0,
+            rating_5 INT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute(REBUILD_SQL.format(where=''))
+
+
+def _rating_stats_down(cursor):
+    cursor.execute("DROP TABLE IF EXISTS app_rating_stats")
+
+
+def _review_votes_up(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS review_votes (
+            review_id INT NOT NULL,
+            user_id INT NOT NULL,
+            vote TINYINT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (review_id, user_id),
+            FOREIGN KEY (review_id) REFERENCES reviews(id) ON DELETE CASCADE,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+
+
+def _review_votes_down(cursor):
+    cursor.execute("DROP TABLE IF EXISTS review_votes")
+
+
+def _review_unique_up(cursor):
+    # Повторные отзывы пользователя на приложение не удаляются автоматически:
+    # какой из них оставить, решает модерация
+    cursor.execute("""
+        SELECT app_id, user_id, COUNT(*) AS reviews
+        FROM reviews
+        WHERE user_id IS NOT NULL
+        GROUP BY app_id, user_id
+        HAVING COUNT(*) > 1
+        LIMIT 20
+    """)
+    duplicates = cursor.fetchall()
+    if duplicates:
+        raise RuntimeError(f"Duplicate reviews per (app_id, user_id, count), resolve before migrating: {duplicates}")
+    create_index(cursor, 'reviews', 'reviews_app_user_unique', 'app_id, user_id', unique=True)
+    add_column(cursor, 'reviews', 'aggregated', 'TINYINT(1) NOT NULL DEFAULT 1')
+    create_index(cursor, 'reviews', 'reviews_aggregated_index', 'aggregated')
+
+
+def _review_unique_down(cursor):
+    drop_index(cursor, 'reviews', 'reviews_aggregated_index')
+    drop_column(cursor, 'reviews', 'aggregated')
+    drop_index(cursor, 'reviews', 'reviews_app_user_unique')
+
+
+def _near_duplicates_up(cursor):
+    # Подписи уже сохраненных отзывов: python near_duplicates.py cluster --store --flag
+    add_column(cursor, 'reviews', 'minhash', 'VARBINARY(256) NULL')
+    add_column(cursor, 'reviews', 'duplicate_of', 'INT NULL')
+    create_index(cursor, 'reviews', 'reviews_duplicate_of_index', 'duplicate_of')
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS review_lsh (
+            band TINYINT UNSIGNED NOT NULL,
+            bucket BIGINT UNSIGNED NOT NULL,
+            review_id INT NOT NULL,
+            PRIMARY KEY (band, bucket, review_id),
+            INDEX review_lsh_review_index (review_id),
+            FOREIGN KEY (review_id) REFERENCES reviews(id) ON DELETE CASCADE
+        )
+    """)
+
+
+def _near_duplicates_down(cursor):
+    cursor.execute("DROP TABLE IF EXISTS review_lsh")
+    drop_index(cursor, 'reviews', 'reviews_duplicate_of_index')
+    drop_column(cursor, 'reviews', 'duplicate_of')
+    drop_column(cursor, 'reviews', 'minhash')
+
+
+# Индексы каталога и профиля: (таблица, новый индекс, колонки, старый
+# индекс, который новый делает лишним). Составной индекс отдает строки уже
+# в порядке ORDER BY (без filesort); в списках профиля app_id в конце
+# индекса покрывает выборку из таблицы связи перед JOIN apps. Новый индекс
+# строится раньше, чем удаляется старый: внешнему ключу всегда есть на что
+# опереться
+CATALOG_INDEXES = [
+    # /api/apps (порядок по умолчанию) и поиск
+    ('apps', 'apps_created_index', 'created_at', None),
+    # /api/categories/<name>/apps; DISTINCT category в /api/categories
+    ('apps', 'apps_category_created_index', 'category, created_at', 'category_index'),
+    # /api/apps?featured=true, ?topWeek=true
+    ('apps', 'apps_featured_created_index', 'featured, created_at', 'featured_index'),
+    ('apps', 'apps_top_week_created_index', 'top_week, created_at', None),
+    # /api/user/downloads, /api/user/favorites, /api/user/reviews
+    ('user_downloads', 'user_downloads_user_time_index', 'user_id, downloaded_at, app_id', None),
+    ('user_favorites', 'user_favorites_user_time_index', 'user_id, added_at, app_id', 'user_index'),
+    ('reviews', 'reviews_user_created_index', 'user_id, created_at', 'user_id_index'),
+    # app_id - префикс reviews_app_user_unique и индексов постраничной выдачи
+    ('reviews', None, None, 'app_id_index'),
+]
+
+# Определения удаляемых индексов для отката
+REPLACED_INDEXES = {
+    'category_index': 'category',
+    'featured_index': 'featured',
+    'user_index': 'user_id',
+    'user_id_index': 'user_id',
+    'app_id_index': 'app_id',
+}
+
+
+def _catalog_indexes_up(cursor):
+    for table, name, columns_sql, replaces in CATALOG_INDEXES:
+        if name:
+            create_index(cursor, table, name, columns_sql)
+        if replaces:
+            drop_index(cursor, table, replaces)
+
+
+def _catalog_indexes_down(cursor):
+    for table, name, columns_sql, replaces in reversed(CATALOG_INDEXES):
+        if replaces:
+            create_index(cursor, table, replaces, REPLACED_INDEXES[replaces])
+        if name:
+            drop_index(cursor, table, name)
+
+
+MIGRATIONS = [
+    Migration(1, 'reviews: dislikes, helpful_score и индексы постраничной выдачи по каждому порядку',
+              _review_pagination_up, _review_pagination_down),
+    Migration(2, 'app_rating_stats: агрегаты рейтинга по приложению', _rating_stats_up, _rating_stats_down),
+    Migration(3, 'review_votes: один голос пользователя за отзыв', _review_votes_up, _review_votes_down),
+    Migration(4, 'reviews: уникальный (app_id, user_id) и флаг aggregated для фоновой обработки',
+              _review_unique_up, _review_unique_down),
+    Migration(5, 'reviews: подпись MinHash, duplicate_of и индекс LSH review_lsh',
+              _near_duplicates_up, _near_duplicates_down),
+    Migration(6, 'apps, user_downloads, user_favorites, reviews: составные индексы каталога и профиля',
+              _catalog_indexes_up, _catalog_indexes_down),
+]
+
+HEAD = MIGRATIONS[-1].version
+
+
+def current_version(cursor):
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+        "version INT PRIMARY KEY, "
+        "description VARCHAR(255) NOT NULL, "
+        "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    )
+    cursor.execute(f"SELECT MAX(version) FROM {MIGRATIONS_TABLE}")
+    return cursor.fetchone()[0] or 0
+
+
+def upgrade(target=HEAD):
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            current = current_version(cursor)
+            for migration in MIGRATIONS:
+                if current < migration.version <= target:
+                    logger.info(f"⬆️ Миграция {migration.version}: {migration.description}")
+                    # DDL в MySQL не транзакционен: версия записывается после
+                    # успешного шага, а сами шаги идемпотентны
+                    migration.up(cursor)
+                    cursor.execute(
+                        f"INSERT INTO {MIGRATIONS_TABLE} (version, description) VALUES (%s, %s)",
+                        (migration.version, migration.description)
+                    )
+            logger.info(f"✅ Схема на версии {max(current, min(target, HEAD))}")
+    finally:
+        conn.close()
+
+
+def downgrade(target):
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            current = current_version(cursor)
+            for migration in reversed(MIGRATIONS):
+                if target < migration.version <= current:
+                    if migration.down is None:
+                        raise RuntimeError(f"Migration {migration.version} cannot be reverted")
+                    logger.info(f"⬇️ Откат миграции {migration.version}: {migration.description}")
+                    migration.down(cursor)
+                    cursor.execute(f"DELETE FROM {MIGRATIONS_TABLE} WHERE version = %s", (migration.version,))
+    finally:
+        conn.close()
+
+
+def status():
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            current = current_version(cursor)
+    finally:
+        conn.close()
+    for migration in MIGRATIONS:
+        mark = 'x' if migration.version <= current else ' '
+        print(f"[{mark}] {migration.version:3d}  {migration.description}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    if command == 'upgrade':
+        upgrade(int(sys.argv[2]) if len(sys.argv) > 2 else HEAD)
+    elif command == 'downgrade' and len(sys.argv) > 2:
+        downgrade(int(sys.argv[2]))
+    elif command == 'status':
+        status()
+    else:
+        print('Usage: python migrations.py status | upgrade [version] | downgrade <version>')
+        sys.exit(1)
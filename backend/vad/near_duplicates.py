@@ -0,0 +1,277 @@
+import sys
+import random
+import struct
+import hashlib
+import logging
+import zlib
+
+import numpy as np
+
+from config import Config
+from content_filter import normalize
+
+logger = logging.getLogger(__name__)
+
+# Поиск почти одинаковых отзывов (накрутки: один текст с мелкими правками
+# под разными приложениями) через MinHash и LSH.
+#
+# Текст -> множество символьных 5-грамм нормализованного текста -> подпись
+# из NUM_PERM минимумов хэшей (reviews.minhash). Доля совпавших позиций двух
+# подписей оценивает сходство Жаккара их множеств. Подпись режется на BANDS
+# полос по ROWS значений; отзывы с одинаковой полосой попадают в одну
+# корзину review_lsh (band, bucket). Кандидаты для нового отзыва - только
+# соседи по корзинам (поиск по первичному ключу), а не вся таблица; пары со
+# сходством от 0.8 находятся с вероятностью > 99.9%.
+#
+# Новый и измененный отзыв индексирует фоновый обработчик (review_tasks.py):
+# reviews.duplicate_of - самый ранний похожий отзыв. Весь корпус:
+#
+#   python near_duplicates.py cluster [--store] [--flag]
+#
+# Параметры ниже определяют формат сохраненных подписей: после их
+# изменения подписи нужно пересчитать (cluster --store --rebuild).
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE = 5
+MIN_CHARS = 30  # короткие "Отлично!" совпадают у многих честных отзывов
+PRIME = 2147483647  # 2^31 - 1: (a * x + b) помещается в uint64
+SEED = 20240601
+
+_rng = random.Random(SEED)
+PERM_A = [_rng.randrange(1, PRIME) for _ in range(NUM_PERM)]
+PERM_B = [_rng.randrange(0, PRIME) for _ in range(NUM_PERM)]
+
+SIGNATURE_FORMAT = struct.Struct(f'<{NUM_PERM}I')
+
+FIND_CANDIDATES_SQL = """
+    SELECT DISTINCT l.review_id, r.minhash
+    FROM review_lsh l
+    JOIN reviews r ON r.id = l.review_id
+    WHERE (l.band, l.bucket) IN ({buckets}) AND l.review_id <> %s
+    LIMIT %s
+"""
+
+INSERT_BUCKETS_SQL = "INSERT IGNORE INTO review_lsh (band, bucket, review_id) VALUES (%s, %s, %s)"
+
+STORE_SIGNATURE_SQL = "UPDATE reviews SET minhash = %s, duplicate_of = %s WHERE id = %s"
+
+# Текст отзыва изменился: подпись и корзины пересчитает обработчик
+CLEAR_BUCKETS_SQL = "DELETE FROM review_lsh WHERE review_id = %s"
+CLEAR_SIGNATURE_SQL = "UPDATE reviews SET minhash = NULL, duplicate_of = NULL WHERE id = %s"
+
+MAX_CANDIDATES = 200
+
+
+def shingles(text):
+    text = normalize(text)
+    if len(text) < MIN_CHARS:
+        return []
+    return list({zlib.crc32(text[i:i + SHINGLE].encode('utf-8')) % PRIME
+                 for i in range(len(text) - SHINGLE + 1)})
+
+
+def signature(text):
+    # Подпись MinHash или None для слишком короткого текста
+    values = shingles(text)
+    if not values:
+        return None
+    return tuple(_min_hashes(np.array(values, dtype=np.uint64)).tolist())
+
+
+def _min_hashes(values):
+    a = np.array(PERM_A, dtype=np.uint64)[:, None]
+    b = np.array(PERM_B, dtype=np.uint64)[:, None]
+    return ((a * values[None, :] + b) % PRIME).min(axis=1)
+
+
+def signatures(texts, chunk_shingles=100000):
+    # Подписи для пачки текстов: шинглы многих текстов хэшируются одной
+    # матричной операцией (NUM_PERM x chunk_shingles), минимум по каждому
+    # тексту - reduceat
+    parts = [shingles(text) for text in texts]
+    result = [None] * len(texts)
+    chunk, size = [], 0
+    for i, values in enumerate(parts):
+        if not values:
+            continue
+        if chunk and size + len(values) > chunk_shingles:
+            _fill_signatures(parts, chunk, result)
+            chunk, size = [], 0
+        chunk.append(i)
+        size += len(values)
+    if chunk:
+        _fill_signatures(parts, chunk, result)
+    return result
+
+
+def _fill_signatures(parts, chunk, result):
+    lengths = np.array([len(parts[i]) for i in chunk])
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    values = np.fromiter((x for i in chunk for x in parts[i]), dtype=np.uint64, count=int(lengths.sum()))
+    a = np.array(PERM_A, dtype=np.uint64)[:, None]
+    b = np.array(PERM_B, dtype=np.uint64)[:, None]
+    hashed = (a * values[None, :] + b) % PRIME
+    for i, row in zip(chunk, np.minimum.reduceat(hashed, offsets, axis=1).T.tolist()):
+        result[i] = tuple(row)
+
+
+def pack(sig):
+    return SIGNATURE_FORMAT.pack(*sig) if sig else b''
+
+
+def unpack(data):
+    return SIGNATURE_FORMAT.unpack(data) if data else None
+
+
+def band_buckets(sig):
+    # (полоса, корзина) для каждой из BANDS полос подписи
+    buckets = []
+    for band in range(BANDS):
+        chunk = struct.pack(f'<{ROWS}I', *sig[band * ROWS:(band + 1) * ROWS])
+        buckets.append((band, int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), 'little')))
+    return buckets
+
+
+def similarity(first, second):
+    # Оценка сходства Жаккара по доле совпавших минимумов
+    return sum(x == y for x, y in zip(first, second)) / NUM_PERM
+
+
+def index_review(cursor, review_id, text, threshold=None):
+    # Подпись, корзины LSH и duplicate_of отзыва; возвращает id самого
+    # раннего похожего отзыва или None
+    threshold = Config.NEAR_DUPLICATE_THRESHOLD if threshold is None else threshold
+    sig = signature(text)
+    duplicate_of = None
+    if sig:
+        buckets = band_buckets(sig)
+        cursor.execute(
+            FIND_CANDIDATES_SQL.format(buckets=', '.join(['(%s, %s)'] * len(buckets))),
+            [value for bucket in buckets for value in bucket] + [review_id, MAX_CANDIDATES]
+        )
+        similar = [row['review_id'] for row in cursor.fetchall()
+                   if row['minhash'] and similarity(sig, unpack(row['minhash'])) >= threshold]
+        duplicate_of = min(similar) if similar else None
+        cursor.executemany(INSERT_BUCKETS_SQL, [(band, bucket, review_id) for band, bucket in buckets])
+    cursor.execute(STORE_SIGNATURE_SQL, (pack(sig), duplicate_of, review_id))
+    if duplicate_of:
+        logger.warning(f"🔁 Отзыв {review_id} почти совпадает с отзывом {duplicate_of}")
+    return duplicate_of
+
+
+class DisjointSet:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        parent = self.parent.setdefault(item, item)
+        if parent != item:
+            parent = self.parent[item] = self.find(parent)
+        return parent
+
+    def union(self, first, second):
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            # Корень кластера - самый ранний отзыв
+            self.parent[max(first, second)] = min(first, second)
+
+
+def cluster(batch_size=5000, store=False, flag=False, rebuild=False, threshold=None, report=20):
+    # Кластеры почти одинаковых отзывов по всему корпусу. Подписи считаются
+    # пачками, корзины LSH собираются в памяти; пары внутри каждой корзины
+    # сравниваются по подписям, похожие объединяются (DisjointSet). В памяти
+    # только подписи и app_id: тексты читаются заново для report крупнейших
+    # кластеров. --store сохраняет подписи и корзины отзывов без подписи
+    # (--rebuild - всех), --flag выставляет duplicate_of по кластерам.
+    from db_pool import get_db_connection
+
+    threshold = Config.NEAR_DUPLICATE_THRESHOLD if threshold is None else threshold
+    sigs, app_ids, buckets = {}, {}, {}
+    last_id = 0
+    while True:
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT id, app_id, text, minhash IS NULL AS unsigned FROM reviews "
+                    "WHERE id > %s ORDER BY id LIMIT %s",
+                    (last_id, batch_size)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                batch = signatures([row['text'] for row in rows])
+                for row, sig in zip(rows, batch):
+                    app_ids[row['id']] = row['app_id']
+                    if sig:
+                        sigs[row['id']] = sig
+                        for bucket in band_buckets(sig):
+                            buckets.setdefault(bucket, []).append(row['id'])
+                    if store and (row['unsigned'] or rebuild):
+                        if rebuild:
+                            cursor.execute(CLEAR_BUCKETS_SQL, (row['id'],))
+                        if sig:
+                            cursor.executemany(INSERT_BUCKETS_SQL, [(band, bucket, row['id'])
+                                                                    for band, bucket in band_buckets(sig)])
+                        cursor.execute("UPDATE reviews SET minhash = %s WHERE id = %s", (pack(sig), row['id']))
+            conn.commit()
+        finally:
+            conn.close()
+        last_id = rows[-1]['id']
+        logger.info(f"   подписи: {len(app_ids)} отзывов")
+
+    # Пары, уже попавшие в один кластер, не сравниваются: корзина из тысячи
+    # копий одного текста стоит тысячу find, а не миллион сравнений подписей
+    clusters = DisjointSet()
+    for members in buckets.values():
+        for i, first in enumerate(members):
+            for second in members[i + 1:]:
+                if clusters.find(first) == clusters.find(second):
+                    continue
+                if similarity(sigs[first], sigs[second]) >= threshold:
+                    clusters.union(first, second)
+
+    groups = {}
+    for review_id in clusters.parent:
+        groups.setdefault(clusters.find(review_id), []).append(review_id)
+    groups = sorted((sorted(members) for members in groups.values() if len(members) > 1), key=len, reverse=True)
+
+    if flag and groups:
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.executemany("UPDATE reviews SET duplicate_of = %s WHERE id = %s",
+                                   [(members[0], review_id) for members in groups for review_id in members[1:]])
+            conn.commit()
+        finally:
+            conn.close()
+
+    texts = {}
+    if groups[:report]:
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                first_ids = [members[0] for members in groups[:report]]
+                cursor.execute(f"SELECT id, text FROM reviews WHERE id IN ({', '.join(['%s'] * len(first_ids))})",
+                               first_ids)
+                texts = {row['id']: row['text'] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+    print(f"Отзывов: {len(app_ids)}, с подписью: {len(sigs)}, кластеров почти одинаковых: {len(groups)}")
+    for members in groups[:report]:
+        apps = {app_ids[review_id] for review_id in members}
+        print(f"  {len(members)} отзывов в {len(apps)} приложениях, первый {members[0]}: "
+              f"{texts.get(members[0], '')[:80]!r}")
+    return groups
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1 and sys.argv[1] == 'cluster':
+        cluster(store='--store' in sys.argv, flag='--flag' in sys.argv, rebuild='--rebuild' in sys.argv)
+    else:
+        print('Usage: python near_duplicates.py cluster [--store] [--flag] [--rebuild]')
+        sys.exit(1)
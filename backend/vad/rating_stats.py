@@ -0,0 +1,288 @@
+import sys
+import time
+import logging
+import threading
+
+import pymysql
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Агрегаты рейтинга по приложению: число отзывов, сумма оценок и
+# гистограмма 1-5 в одной строке app_rating_stats. Строка меняется в той же
+# транзакции, что и отзыв (добавление, правка, удаление), поэтому чтение
+# рейтинга - один поиск по первичному ключу вместо AVG/SUM по всем отзывам.
+#
+# Сверка и пересборка из reviews (после ручных правок в БД, импорта или
+# для проверки):
+#
+#   python rating_stats.py check
+#   python rating_stats.py rebuild [app_id ...]
+
+RATINGS = (5, 4, 3, 2, 1)
+
+RATING_STATS_SQL = "SELECT * FROM app_rating_stats WHERE app_id = %s"
+
+# Карточка приложения вместе с рейтингом: два поиска по первичному ключу
+APP_DETAILS_SQL = """
+    SELECT a.*, COALESCE(s.reviews_count, 0) AS review_count, COALESCE(s.rating_sum, 0) AS rating_sum
+    FROM apps a
+    LEFT JOIN app_rating_stats s ON s.app_id = a.id
+    WHERE a.id = %s
+"""
+
+# Сводки для списков приложений: один проход по первичному ключу на весь список
+SUMMARIES_SQL = "SELECT app_id, reviews_count, rating_sum FROM app_rating_stats WHERE app_id IN ({placeholders})"
+
+# Одна инструкция для любого изменения: при первом отзыве строка создается,
+# дальше к счетчикам прибавляются дельты. Блокировка строки агрегата
+# упорядочивает параллельные изменения отзывов одного приложения.
+APPLY_DELTA_SQL = """
+    INSERT INTO app_rating_stats
+        (app_id, reviews_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        reviews_count = reviews_count + VALUES(reviews_count),
+        rating_sum = rating_sum + VALUES(rating_sum),
+        rating_1 = rating_1 + VALUES(rating_1),
+        rating_2 = rating_2 + VALUES(rating_2),
+        rating_3 = rating_3 + VALUES(rating_3),
+        rating_4 = rating_4 + VALUES(rating_4),
+        rating_5 = rating_5 + VALUES(rating_5)
+"""
+
+AGGREGATE_COLUMNS = """
+    COUNT(*), COALESCE(SUM(rating), 0),
+    SUM(rating = 1), SUM(rating = 2), SUM(rating = 3), SUM(rating = 4), SUM(rating = 5)
+"""
+
+REBUILD_SQL = f"""
+    INSERT INTO app_rating_stats
+        (app_id, reviews_count, rating_sum, rating_1, rating_2, rating_3, rating_4, rating_5)
+    SELECT app_id, {AGGREGATE_COLUMNS}
+    FROM reviews
+    {{where}}
+    GROUP BY app_id
+    ON DUPLICATE KEY UPDATE
+        reviews_count = VALUES(reviews_count),
+        rating_sum = VALUES(rating_sum),
+        rating_1 = VALUES(rating_1),
+        rating_2 = VALUES(rating_2),
+        rating_3 = VALUES(rating_3),
+        rating_4 = VALUES(rating_4),
+        rating_5 = VALUES(rating_5)
+"""
+
+# Приложения, у которых в агрегате остались отзывы, а в reviews их нет
+CLEAR_ORPHANS_SQL = """
+    UPDATE app_rating_stats s
+    LEFT JOIN (SELECT DISTINCT app_id FROM reviews) r ON r.app_id = s.app_id
+    SET s.reviews_count = 0, s.rating_sum = 0,
+        s.rating_1 = 0, s.rating_2 = 0, s.rating_3 = 0, s.rating_4 = 0, s.rating_5 = 0
+    WHERE r.app_id IS NULL {where}
+"""
+
+DRIFT_SQL = """
+    SELECT r.app_id,
+           COALESCE(s.reviews_count, 0) AS stored_count, r.reviews_count AS actual_count,
+           COALESCE(s.rating_sum, 0) AS stored_sum, r.rating_sum AS actual_sum
+    FROM (
+        SELECT app_id, COUNT(*) AS reviews_count, COALESCE(SUM(rating), 0) AS rating_sum,
+               SUM(rating = 1) AS rating_1, SUM(rating = 2) AS rating_2, SUM(rating = 3) AS rating_3,
+               SUM(rating = 4) AS rating_4, SUM(rating = 5) AS rating_5
+        FROM reviews WHERE aggregated = 1 GROUP BY app_id
+    ) r
+    LEFT JOIN app_rating_stats s ON s.app_id = r.app_id
+    WHERE s.app_id IS NULL
+       OR (s.reviews_count, s.rating_sum, s.rating_1, s.rating_2, s.rating_3, s.rating_4, s.rating_5)
+          <> (r.reviews_count, r.rating_sum, r.rating_1, r.rating_2, r.rating_3, r.rating_4, r.rating_5)
+    UNION ALL
+    SELECT s.app_id, s.reviews_count, 0, s.rating_sum, 0
+    FROM app_rating_stats s
+    WHERE s.reviews_count <> 0
+      AND NOT EXISTS (SELECT 1 FROM reviews WHERE reviews.app_id = s.app_id AND reviews.aggregated = 1)
+"""
+
+
+def delta_params(app_id, old_rating=None, new_rating=None):
+    # Параметры APPLY_DELTA_SQL: old_rating - оценка до изменения (None для
+    # нового отзыва), new_rating - после (None для удаленного)
+    count = (new_rating is not None) - (old_rating is not None)
+    total = (new_rating or 0) - (old_rating or 0)
+    histogram = [(new_rating == value) - (old_rating == value) for value in (1, 2, 3, 4, 5)]
+    return (app_id, count, total, *histogram)
+
+
+def apply_delta(cursor, app_id, old_rating=None, new_rating=None):
+    if old_rating == new_rating:
+        return
+    cursor.execute(APPLY_DELTA_SQL, delta_params(app_id, old_rating, new_rating))
+
+
+def rating_result(stats):
+    # Ответ /api/apps/<id>/rating из строки агрегата (None - отзывов не было)
+    if not stats or stats['reviews_count'] <= 0:
+        return {
+            'average_rating': 0,
+            'reviews_count': 0,
+            'rating_distribution': {value: 0 for value in RATINGS}
+        }
+    return {
+        'average_rating': stats['rating_sum'] / stats['reviews_count'],
+        'reviews_count': stats['reviews_count'],
+        'rating_distribution': {value: stats[f'rating_{value}'] for value in RATINGS}
+    }
+
+
+def app_details(app):
+    # avg_rating и review_count карточки приложения из строки APP_DETAILS_SQL
+    rating_sum = app.pop('rating_sum')
+    app['avg_rating'] = rating_sum / app['review_count'] if app['review_count'] > 0 else 0
+    return app
+
+
+def summary(stats):
+    # Рейтинг и число отзывов приложения для списков
+    if not stats or stats['reviews_count'] <= 0:
+        return {'average_rating': 0, 'reviews_count': 0}
+    return {
+        'average_rating': round(stats['rating_sum'] / stats['reviews_count'], 2),
+        'reviews_count': stats['reviews_count']
+    }
+
+
+def parse_app_ids(value):
+    # "1,2,3" -> [1, 2, 3] без повторов; ValueError с текстом для ответа 400
+    try:
+        app_ids = list(dict.fromkeys(int(item) for item in (value or '').split(',') if item.strip()))
+    except ValueError:
+        raise ValueError('app_ids must be a comma-separated list of integers')
+    if not app_ids:
+        raise ValueError('app_ids is required')
+    if len(app_ids) > Config.RATINGS_MAX_APPS:
+        raise ValueError(f"At most {Config.RATINGS_MAX_APPS} app_ids per request")
+    return app_ids
+
+
+def summaries_query(app_ids):
+    return SUMMARIES_SQL.format(placeholders=', '.join(['%s'] * len(app_ids))), app_ids
+
+
+class SummaryCache:
+    # Короткоживущий кэш сводок по приложению: повторные списки (главная,
+    # категории, поиск) не ходят в БД. Изменение отзыва в этом процессе
+    # сбрасывает запись сразу, в остальных процессах она живет до TTL.
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, app_ids):
+        # (найденные сводки, id, которые нужно прочитать из БД)
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for app_id in app_ids:
+                entry = self._entries.get(app_id)
+                if entry and entry[0] > now:
+                    found[app_id] = entry[1]
+                else:
+                    missing.append(app_id)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def put_many(self, summaries):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            if len(self._entries) + len(summaries) > self.max_entries:
+                now = time.monotonic()
+                self._entries = {key: entry for key, entry in self._entries.items() if entry[0] > now}
+                if len(self._entries) + len(summaries) > self.max_entries:
+                    self._entries.clear()
+            for app_id, value in summaries.items():
+                self._entries[app_id] = (expires, value)
+
+    def invalidate(self, app_id):
+        with self._lock:
+            self._entries.pop(app_id, None)
+
+    def status(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'ttl': self.ttl, 'hits': self.hits, 'misses': self.misses}
+
+
+summary_cache = SummaryCache(Config.RATINGS_CACHE_TTL)
+
+
+def connect():
+    return pymysql.connect(
+        host=Config.MYSQL_HOST,
+        user=Config.MYSQL_USER,
+        password=Config.MYSQL_PASSWORD,
+        database=Config.MYSQL_DB,
+        port=Config.MYSQL_PORT,
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.DictCursor
+    )
+
+
+def rebuild(app_ids=None):
+    # Пересчет агрегатов из reviews одной транзакцией. INSERT ... SELECT
+    # блокирует прочитанные строки reviews, поэтому отзывы, добавленные во
+    # время пересборки, не теряются: они ждут ее окончания и применяют
+    # дельту к уже пересчитанной строке. Еще не учтенные обработчиком отзывы
+    # (review_tasks.py) помечаются учтенными и входят в пересчет.
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            if app_ids:
+                placeholders = ', '.join(['%s'] * len(app_ids))
+                cursor.execute(f"UPDATE reviews SET aggregated = 1 WHERE aggregated = 0 AND app_id IN ({placeholders})",
+                               app_ids)
+                cursor.execute(REBUILD_SQL.format(where=f"WHERE app_id IN ({placeholders})"), app_ids)
+                cursor.execute(CLEAR_ORPHANS_SQL.format(where=f"AND s.app_id IN ({placeholders})"), app_ids)
+            else:
+                cursor.execute("UPDATE reviews SET aggregated = 1 WHERE aggregated = 0")
+                cursor.execute(REBUILD_SQL.format(where=''))
+                cursor.execute(CLEAR_ORPHANS_SQL.format(where=''))
+        conn.commit()
+        logger.info(f"✅ Агрегаты рейтинга пересчитаны ({'все приложения' if not app_ids else app_ids})")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def check():
+    # Приложения, где агрегат разошелся с reviews
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(DRIFT_SQL)
+            return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else 'check'
+    if command == 'rebuild':
+        rebuild([int(app_id) for app_id in sys.argv[2:]] or None)
+    elif command == 'check':
+        drift = check()
+        for row in drift:
+            print(f"app {row['app_id']}: count {row['stored_count']} -> {row['actual_count']}, "
+                  f"sum {row['stored_sum']} -> {row['actual_sum']}")
+        print(f"Расхождений: {len(drift)}")
+        sys.exit(1 if drift else 0)
+    else:
+        print('Usage: python rating_stats.py check | rebuild [app_id ...]')
+        sys.exit(1)
@@ -0,0 +1,112 @@
+import base64
+import binascii
+import json
+
+# Запросы отзывов, общие для синхронного (app.py) и асинхронного
+# (asgi_app.py) режимов.
+#
+# Отзывы отдаются страницами с курсором (keyset pagination): следующая
+# страница начинается строго после последней строки предыдущей по ключу
+# сортировки и id. Для каждого порядка есть индекс (app_id, ключ, id),
+# поэтому любая страница - короткий проход по индексу, без OFFSET.
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Нижняя граница доверительного интервала Уилсона (z = 1.96) для доли
+# лайков среди оценок полезности. Отзыв с 3 лайками из 3 оценок оказывается
+# ниже отзыва с 90 из 100. Выражение использует колонки строки; в UPDATE
+# MySQL присваивает слева направо, поэтому оно видит уже новые likes/dislikes.
+WILSON_SQL = (
+    "IF(likes + dislikes = 0, 0, "
+    "((likes + 1.9208) / (likes + dislikes) "
+    "- 1.96 * SQRT(likes * dislikes / (likes + dislikes) + 0.9604) / (likes + dislikes)) "
+    "/ (1 + 3.8416 / (likes + dislikes)))"
+)
+
+# Порядок: колонка ключа и направление. Индексы - в migrations.py
+SORT_ORDERS = {
+    'newest': ('created_at', 'DESC'),
+    'liked': ('likes', 'DESC'),
+    'rating_high': ('rating', 'DESC'),
+    'rating_low': ('rating', 'ASC'),
+    'helpful': ('helpful_score', 'DESC'),
+}
+
+# Колонки отзыва, которые видит клиент. Служебные (aggregated, minhash,
+# duplicate_of) не выбираются: подпись MinHash - байты, jsonify их не
+# сериализует
+PUBLIC_REVIEW_COLUMNS = "r.id, r.app_id, r.user_id, r.text, r.rating, r.likes, r.dislikes, r.helpful_score, r.created_at"
+
+# Дата и автор форматируются в MySQL, а не циклом в Python
+REVIEW_COLUMNS = f"""
+    {PUBLIC_REVIEW_COLUMNS}, u.first_name, u.last_name, u.avatar,
+    DATE_FORMAT(r.created_at, '%%d.%%m.%%Y') AS date,
+    IF(u.first_name IS NULL OR u.first_name = '', 'Аноним',
+       CONCAT(u.first_name, ' ', COALESCE(u.last_name, ''))) AS author
+"""
+
+REVIEW_BY_ID_SQL = f"""
+    SELECT {REVIEW_COLUMNS}
+    FROM reviews r
+    LEFT JOIN users u ON r.user_id = u.id
+    WHERE r.id = %s
+"""
+
+
+class InvalidPageRequest(ValueError):
+    pass
+
+
+def encode_cursor(value, review_id):
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat(sep=' ')
+    raw = json.dumps([value, review_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, review_id = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidPageRequest('Invalid cursor')
+    if not isinstance(review_id, int) or not isinstance(value, (int, float, str)):
+        raise InvalidPageRequest('Invalid cursor')
+    return value, review_id
+
+
+def page_size(value):
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        return max(1, min(MAX_PAGE_SIZE, int(value)))
+    except ValueError:
+        raise InvalidPageRequest('limit must be a number')
+
+
+def page_query(app_id, sort='newest', cursor=None, limit=DEFAULT_PAGE_SIZE):
+    # SQL и параметры одной страницы отзывов; выбирается limit + 1 строка,
+    # чтобы узнать, есть ли следующая страница
+    if sort not in SORT_ORDERS:
+        raise InvalidPageRequest(f"sort must be one of: {', '.join(SORT_ORDERS)}")
+    column, direction = SORT_ORDERS[sort]
+    sql = f"SELECT {REVIEW_COLUMNS} FROM reviews r LEFT JOIN users u ON r.user_id = u.id WHERE r.app_id = %s"
+    params = [app_id]
+    if cursor:
+        value, review_id = decode_cursor(cursor)
+        after = '<' if direction == 'DESC' else '>'
+        sql += f" AND (r.{column} {after} %s OR (r.{column} = %s AND r.id {after} %s))"
+        params.extend([value, value, review_id])
+    sql += f" ORDER BY r.{column} {direction}, r.id {direction} LIMIT %s"
+    params.append(limit + 1)
+    return sql, params
+
+
+def page_result(rows, sort, limit):
+    # Строки страницы и курсор следующей (None - страница последняя)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    column = SORT_ORDERS[sort][0]
+    return rows, encode_cursor(rows[-1][column], rows[-1]['id'])
@@ -0,0 +1,199 @@
+import atexit
+import queue
+import threading
+import logging
+
+import pymysql
+
+from config import Config
+from db_pool import get_db_connection
+from rating_stats import apply_delta, summary_cache
+from near_duplicates import index_review
+
+logger = logging.getLogger(__name__)
+
+# Создание отзыва - один INSERT: повтор отзыва пользователя на приложение
+# отсекает уникальный ключ (app_id, user_id), ответ собирается из данных
+# запроса и сессии и created_at, прочитанного из БД по первичному ключу в той
+# же транзакции. Остальное делает фоновый обработчик:
+# - агрегат рейтинга app_rating_stats;
+# - сброс кэша сводок рейтинга;
+# - подпись MinHash и поиск почти одинаковых отзывов (near_duplicates.py).
+#
+# Отзыв создается с aggregated = 0. Обработчик в одной транзакции
+# выставляет aggregated = 1 и применяет оценку к агрегату, поэтому отзыв
+# учитывается ровно один раз. Правка и удаление еще не учтенного отзыва
+# агрегат не трогают - обработчик возьмет актуальную оценку или увидит, что
+# отзыва больше нет. Правка текста сбрасывает подпись (minhash = NULL) и
+# ставит отзыв в очередь повторно. Задачи, потерянные при падении процесса,
+# подбирает периодический проход (в любом процессе) по отзывам без агрегата
+# или без подписи.
+
+INSERT_REVIEW_SQL = """
+    INSERT INTO reviews (app_id, user_id, text, rating, likes, aggregated)
+    VALUES (%s, %s, %s, %s, 0, 0)
+"""
+
+REVIEW_CREATED_AT_SQL = "SELECT created_at FROM reviews WHERE id = %s"
+
+PENDING_REVIEW_SQL = """
+    SELECT app_id, rating, text, aggregated, minhash IS NULL AS unsigned
+    FROM reviews WHERE id = %s FOR UPDATE
+"""
+
+PENDING_REVIEWS_SQL = "SELECT id FROM reviews WHERE aggregated = 0 OR minhash IS NULL ORDER BY id LIMIT %s"
+
+DUPLICATE_ENTRY = 1062
+
+
+def is_duplicate(error):
+    return isinstance(error, pymysql.err.IntegrityError) and error.args and error.args[0] == DUPLICATE_ENTRY
+
+
+def new_review(review_id, app_id, user_id, text, rating, user, created_at):
+    # Ответ на создание отзыва в формате REVIEW_BY_ID_SQL без повторного
+    # чтения отзыва; user - данные автора из сессии, created_at - из БД
+    first_name = user.get('first_name')
+    last_name = user.get('last_name')
+    return {
+        'id': review_id,
+        'app_id': app_id,
+        'user_id': user_id,
+        'text': text,
+        'rating': rating,
+        'likes': 0,
+        'dislikes': 0,
+        'helpful_score': 0,
+        'created_at': created_at,
+        'first_name': first_name,
+        'last_name': last_name,
+        'avatar': user.get('avatar'),
+        'date': created_at.strftime('%d.%m.%Y'),
+        'author': f"{first_name} {last_name or ''}" if first_name else 'Аноним',
+    }
+
+
+class ReviewTaskQueue:
+    def __init__(self, workers, sweep_interval, sweep_batch=500):
+        self.workers = workers
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._atexit_registered = False
+        self.processed = 0
+        self.failures = 0
+
+    def submit(self, review_id):
+        self._ensure_started()
+        self._queue.put(review_id)
+
+    def process(self, review_id):
+        # True - отзыв обработан сейчас, False - уже обработан или удален
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(PENDING_REVIEW_SQL, (review_id,))
+                review = cursor.fetchone()
+                if not review or (review['aggregated'] and not review['unsigned']):
+                    conn.rollback()
+                    return False
+                if not review['aggregated']:
+                    cursor.execute("UPDATE reviews SET aggregated = 1 WHERE id = %s", (review_id,))
+                    apply_delta(cursor, review['app_id'], new_rating=review['rating'])
+                if review['unsigned']:
+                    index_review(cursor, review_id, review['text'])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        summary_cache.invalidate(review['app_id'])
+        return True
+
+    def sweep(self):
+        # Отзывы, чьи задачи потерялись (падение процесса, ошибка БД)
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(PENDING_REVIEWS_SQL, (self.sweep_batch,))
+                review_ids = [row['id'] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+        for review_id in review_ids:
+            self._run_task(review_id)
+        return len(review_ids)
+
+    def _run_task(self, review_id):
+        try:
+            if self.process(review_id):
+                self.processed += 1
+        except Exception as e:
+            # Отзыв остается с aggregated = 0 и будет учтен при следующем проходе
+            self.failures += 1
+            logger.error(f"❌ Не удалось обработать отзыв {review_id}: {str(e)}")
+
+    def _worker(self):
+        while True:
+            review_id = self._queue.get()
+            try:
+                if review_id is None:
+                    return
+                self._run_task(review_id)
+            finally:
+                self._queue.task_done()
+
+    def _sweeper(self):
+        while not self._stopped.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"❌ Ошибка прохода по неучтенным отзывам: {str(e)}")
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self._stopped.clear()
+            threads = [threading.Thread(target=self._worker, name=f'review-tasks-{i}', daemon=True)
+                       for i in range(self.workers)]
+            threads.append(threading.Thread(target=self._sweeper, name='review-tasks-sweep', daemon=True))
+            for thread in threads:
+                thread.start()
+            self._threads = threads
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def start(self):
+        # Запуск обработчика вместе с сервисом: проход подберет отзывы,
+        # оставшиеся неучтенными после предыдущего запуска
+        self._ensure_started()
+
+    def stop(self, timeout=10):
+        # Штатная остановка: очередь дорабатывается до конца
+        with self._lock:
+            threads, self._threads = self._threads, []
+        if not threads:
+            return
+        self._stopped.set()
+        for _ in range(self.workers):
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout=timeout)
+
+    def status(self):
+        return {
+            'queued': self._queue.qsize(),
+            'processed': self.processed,
+            'failures': self.failures,
+            'workers': self.workers,
+        }
+
+
+review_tasks = ReviewTaskQueue(Config.REVIEW_WORKERS, Config.REVIEW_SWEEP_INTERVAL)
@@ -0,0 +1,153 @@
+import re
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pymysql
+from flask import has_request_context, request
+
+from config import Config
+from circuit_breaker import breaker, is_overload
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних медленных запросов хранить целиком
+RECENT_SIZE = 200
+
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_RE = re.compile(r"%\(\w+\)s|%s")
+_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_sql(statement):
+    # Форма запроса: литералы и параметры -> ?, списки IN свернуты
+    sql = _STRING_RE.sub("?", statement)
+    sql = _PARAM_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("IN (...)", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+
+def params_shape(args):
+    # Только типы параметров - значения могут содержать персональные данные
+    if args is None:
+        return None
+    if isinstance(args, dict):
+        return {key: type(value).__name__ for key, value in args.items()}
+    if isinstance(args, (list, tuple)):
+        return [type(value).__name__ for value in args]
+    return type(args).__name__
+
+
+def current_endpoint():
+    if has_request_context():
+        return f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+    return "<background>"
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms, explain_enabled, max_shapes=500):
+        self.threshold_ms = threshold_ms
+        self.explain_enabled = explain_enabled
+        self.max_shapes = max_shapes
+        self.shapes = {}
+        self.recent = deque(maxlen=RECENT_SIZE)
+        # Фабрика соединений для EXPLAIN (задается в app.py)
+        self.connection_factory = None
+        self._lock = threading.Lock()
+        self._explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vad-explain")
+
+    def record(self, statement, args, duration_ms):
+        shape = normalize_sql(statement)
+        shape_params = params_shape(args)
+        endpoint = current_endpoint()
+        now = time.time()
+
+        with self._lock:
+            stats = self.shapes.get(shape)
+            new_shape = stats is None
+            if new_shape:
+                if len(self.shapes) >= self.max_shapes:
+                    return
+                stats = self.shapes[shape] = {
+                    'sql': shape,
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'first_seen': now,
+                    'last_seen': now,
+                    'params_shape': shape_params,
+                    'endpoints': {},
+                    'explain': None,
+                }
+            stats['count'] += 1
+            stats['total_ms'] += duration_ms
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+            stats['last_seen'] = now
+            stats['params_shape'] = shape_params
+            stats['endpoints'][endpoint] = stats['endpoints'].get(endpoint, 0) + 1
+            self.recent.append({
+                'sql': shape,
+                'duration_ms': round(duration_ms, 2),
+                'params_shape': shape_params,
+                'endpoint': endpoint,
+                'at': now,
+            })
+
+        logger.warning(f"🐢 Медленный запрос {duration_ms:.1f} мс [{endpoint}]: {shape}")
+
+        if (new_shape and self.explain_enabled and self.connection_factory
+                and shape.upper().startswith("SELECT")):
+            self._explainer.submit(self._explain, stats, statement, args)
+
+    def _explain(self, stats, statement, args):
+        # EXPLAIN один раз на форму запроса, в отдельном соединении
+        try:
+            conn = self.connection_factory()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("EXPLAIN " + statement, args)
+                    stats['explain'] = cursor.fetchall()
+            finally:
+                conn.close()
+        except Exception as e:
+            stats['explain'] = {'error': str(e)}
+
+    def report(self):
+        with self._lock:
+            shapes = sorted(self.shapes.values(), key=lambda s: s['total_ms'], reverse=True)
+            return {
+                'threshold_ms': self.threshold_ms,
+                'shapes': [
+                    dict(s, total_ms=round(s['total_ms'], 2), max_ms=round(s['max_ms'], 2),
+                         avg_ms=round(s['total_ms'] / s['count'], 2))
+                    for s in shapes
+                ],
+                'recent': list(reversed(self.recent)),
+            }
+
+
+slow_log = SlowQueryLog(Config.SLOW_QUERY_MS, Config.SLOW_QUERY_EXPLAIN)
+
+
+class TimedDictCursor(pymysql.cursors.DictCursor):
+    # DictCursor, замеряющий каждый запрос: медленные пишутся в журнал,
+    # длительность и ошибки перегрузки учитывает circuit breaker БД
+
+    def execute(self, query, args=None):
+        started = time.perf_counter()
+        failed = False
+        try:
+            return super().execute(query, args)
+        except Exception as e:
+            failed = is_overload(e)
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            breaker.record(duration_ms, failed)
+            if duration_ms >= slow_log.threshold_ms and not query.lstrip().upper().startswith("EXPLAIN"):
+                slow_log.record(query, args, duration_ms)
@@ -53,7 +53,15 @@ def test_categories():
 def test_reviews():
     # Получить отзывы
     response = SESSION.get(f"{BASE_URL}/api/apps/1/reviews")
-    print_response(response, "Get Reviews")
+    data = print_response(response, "Get Reviews")
+    
+    # Следующая страница по курсору и другие порядки сортировки
+    if data and data.get('next_cursor'):
+        response = SESSION.get(f"{BASE_URL}/api/apps/1/reviews", params={'cursor': data['next_cursor']})
+        print_response(response, "Get Reviews (Next Page)")
+    for sort in ['liked', 'rating_high', 'rating_low', 'helpful']:
+        response = SESSION.get(f"{BASE_URL}/api/apps/1/reviews", params={'sort': sort, 'limit': 5})
+        print_response(response, f"Get Reviews (sort={sort})")
     
     # Получить рейтинг
     response = SESSION.get(f"{BASE_URL}/api/apps/1/rating")
@@ -84,9 +92,15 @@ def test_review_operations():
             response = SESSION.post(f"{BASE_URL}/api/apps/{app_id}/reviews", json=review_data)
             print_response(response, "Add Review (Unauthorized)")
             
-            # Лайк отзыва
+            # Лайк и дизлайк отзыва: голос только с сессией VK (без нее 401),
+            # один голос пользователя на отзыв (повторный - 400)
             response = SESSION.post(f"{BASE_URL}/api/reviews/1/like")
-            print_response(response, "Like Review")
+            print_response(response, "Like Review (Unauthorized)")
+            assert response.status_code == 401
+            
+            response = SESSION.post(f"{BASE_URL}/api/reviews/1/dislike")
+            print_response(response, "Dislike Review (Unauthorized)")
+            assert response.status_code == 401
 
 def test_user_endpoints():
     # Эти эндпоинты требуют авторизации
@@ -15,7 +15,10 @@ def init_test_data():
     try:
         with connection.cursor() as cursor:
             # Очищаем таблицы
+            cursor.execute("DELETE FROM review_votes")
+            cursor.execute("DELETE FROM review_lsh")
             cursor.execute("DELETE FROM reviews")
+            cursor.execute("DELETE FROM app_rating_stats")
             cursor.execute("DELETE FROM user_downloads")
             cursor.execute("DELETE FROM user_favorites")
             cursor.execute("DELETE FROM apps")
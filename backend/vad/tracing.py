@@ -0,0 +1,198 @@
+import json
+import random
+import re
+import threading
+import time
+import logging
+from collections import deque
+from contextvars import ContextVar
+
+import requests
+from flask import request
+
+from config import Config
+from slow_queries import TimedDictCursor, normalize_sql
+
+logger = logging.getLogger(__name__)
+
+# Трассировка в формате W3C traceparent, совместимом с каталогом (backend/ars):
+# спаны обоих сервисов с общим trace_id собираются офлайн командой
+#   python -m main.tracing traces-ars.jsonl ../vad/traces-vad.jsonl
+SERVICE_NAME = "vad-reviews"
+MEMORY_SPANS = 5000
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+def _new_id(bits):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start", "_started", "duration_ms",
+                 "attributes", "error")
+
+    def __init__(self, trace_id, parent_id, name, kind):
+        self.trace_id = trace_id
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms = None
+        self.attributes = {}
+        self.error = None
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+        exporter.export(self)
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def as_dict(self):
+        return {
+            'service': SERVICE_NAME,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'start': self.start,
+            'duration_ms': round(self.duration_ms, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+class SpanExporter:
+    # Экспорт спанов в JSON Lines файл и/или кольцевой буфер в памяти
+    def __init__(self, mode, path):
+        self.mode = mode
+        self.memory = deque(maxlen=MEMORY_SPANS)
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8', buffering=1) if mode == 'file' else None
+
+    @property
+    def enabled(self):
+        return self.mode in ('file', 'memory')
+
+    def export(self, span):
+        record = span.as_dict()
+        self.memory.append(record)
+        if self._file is not None:
+            line = json.dumps(record, ensure_ascii=False, default=str)
+            with self._lock:
+                self._file.write(line + '\n')
+
+    def recent(self, trace_id=None):
+        spans = list(self.memory)
+        if trace_id:
+            spans = [span for span in spans if span['trace_id'] == trace_id]
+        return spans
+
+
+exporter = SpanExporter(Config.TRACE_EXPORT, Config.TRACE_FILE)
+# Flask обрабатывает запрос в одном потоке, поэтому ContextVar
+# изолирует текущий спан между параллельными запросами
+_current_span = ContextVar('vad_current_span', default=None)
+
+
+def parse_traceparent(value):
+    if not value:
+        return None
+    match = _TRACEPARENT_RE.match(value.strip().lower())
+    if not match or match.group(1) == '0' * 32:
+        return None
+    return match.group(1), match.group(2), int(match.group(3), 16) & 1 == 1
+
+
+def start_span(name, kind='internal'):
+    # Дочерний спан текущего запроса (None, если запрос не трассируется)
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    return Span(parent.trace_id, parent.span_id, name, kind)
+
+
+def init_tracing(app):
+    if not exporter.enabled:
+        return
+
+    @app.before_request
+    def _start_request_span():
+        incoming = parse_traceparent(request.headers.get('traceparent'))
+        if incoming:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id, sampled = _new_id(128), None, random.random() < Config.TRACE_SAMPLE_RATE
+        if not sampled:
+            return
+        span = Span(trace_id, parent_id, f"{request.method} {request.path}", 'server')
+        _current_span.set(span)
+
+    @app.after_request
+    def _add_traceresponse(response):
+        span = _current_span.get()
+        if span is not None:
+            span.attributes['http.status_code'] = response.status_code
+            response.headers['traceresponse'] = span.traceparent()
+        return response
+
+    @app.teardown_request
+    def _finish_request_span(exc):
+        span = _current_span.get()
+        if span is None:
+            return
+        _current_span.set(None)
+        route = request.url_rule.rule if request.url_rule else request.path
+        span.name = f"{request.method} {route}"
+        span.attributes['http.method'] = request.method
+        span.attributes['http.route'] = route
+        span.attributes['http.target'] = request.path
+        if exc is not None:
+            span.error = repr(exc)
+        span.finish()
+
+
+class TracedDictCursor(TimedDictCursor):
+    # Курсор со спаном на каждый SQL запрос (и журналом медленных запросов)
+
+    def execute(self, query, args=None):
+        span = start_span('db.query', 'client')
+        if span is None:
+            return super().execute(query, args)
+        span.attributes['db.system'] = 'mysql'
+        span.attributes['db.statement'] = normalize_sql(query)
+        try:
+            return super().execute(query, args)
+        except Exception as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.finish()
+
+
+def traced_get(url, propagate=True, **kwargs):
+    # requests.get со спаном исходящего вызова. propagate=False - не передавать
+    # traceparent внешним сервисам (VK). В атрибуты попадает только url без query
+    # (params содержат токены)
+    span = start_span(f"GET {url}", 'client')
+    if span is None:
+        return requests.get(url, **kwargs)
+    if propagate:
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers['traceparent'] = span.traceparent()
+        kwargs['headers'] = headers
+    span.attributes['http.method'] = 'GET'
+    span.attributes['http.url'] = url
+    try:
+        response = requests.get(url, **kwargs)
+        span.attributes['http.status_code'] = response.status_code
+        return response
+    except Exception as e:
+        span.error = repr(e)
+        raise
+    finally:
+        span.finish()
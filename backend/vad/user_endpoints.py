@@ -1,5 +1,6 @@
 from flask import jsonify, session
-from app import get_db_connection
+from db_pool import get_db_connection
+from review_queries import PUBLIC_REVIEW_COLUMNS
 
 def register_user_endpoints(app):
     
@@ -58,8 +59,8 @@ def register_user_endpoints(app):
         conn = get_db_connection()
         try:
             with conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT r.*, a.name as app_name, a.icon as app_icon
+                cursor.execute(f"""
+                    SELECT {PUBLIC_REVIEW_COLUMNS}, a.name as app_name, a.icon as app_icon
                     FROM reviews r
                     JOIN apps a ON r.app_id = a.id
                     WHERE r.user_id = %s
@@ -0,0 +1,202 @@
+import atexit
+import threading
+import logging
+
+from config import Config
+from db_pool import get_db_connection
+from review_queries import WILSON_SQL
+
+logger = logging.getLogger(__name__)
+
+# Буфер оценок отзывов (write-behind). Лайк/дизлайк не обновляет строку
+# отзыва сразу: голос попадает в память процесса, ответ строится из
+# счетчиков в БД плюс еще не записанных голосов. Фоновый поток раз в
+# VOTE_FLUSH_INTERVAL секунд пишет накопленное одной транзакцией: строки
+# review_votes и по одному UPDATE на отзыв с суммарным приращением. Горячий
+# отзыв блокируется раз в интервал, а не на каждый лайк.
+#
+# Один голос пользователя на отзыв обеспечивает первичный ключ
+# review_votes (review_id, user_id): голос, уже записанный другим процессом,
+# INSERT IGNORE пропускает, и счетчик за него не увеличивается.
+#
+# При штатной остановке (atexit, lifespan ASGI) буфер сбрасывается; если БД
+# недоступна, голоса остаются в буфере до следующей попытки.
+
+VOTE_COLUMNS = {'likes': 1, 'dislikes': -1}
+
+VOTE_STATE_SQL = """
+    SELECT r.likes, r.dislikes, v.vote
+    FROM reviews r
+    LEFT JOIN review_votes v ON v.review_id = r.id AND v.user_id = %s
+    WHERE r.id = %s
+"""
+
+INSERT_VOTE_SQL = "INSERT IGNORE INTO review_votes (review_id, user_id, vote) VALUES (%s, %s, %s)"
+
+APPLY_VOTES_SQL = f"""
+    UPDATE reviews
+    SET likes = likes + %s, dislikes = dislikes + %s, helpful_score = {WILSON_SQL}
+    WHERE id = %s
+"""
+
+
+class VoteBuffer:
+    def __init__(self, interval, max_pending):
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = {}  # (review_id, user_id) -> 'likes' | 'dislikes'
+        self._deltas = {}  # review_id -> {'likes': n, 'dislikes': n}
+        # Голоса, которые сейчас пишутся в БД: учитываются в ответах до коммита
+        self._inflight = {}
+        self._inflight_deltas = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._atexit_registered = False
+        self.flushed = 0
+        self.duplicates = 0
+        self.failures = 0
+
+    def add(self, review_id, user_id, column):
+        # False - голос этого пользователя за отзыв уже ждет записи
+        self._ensure_started()
+        key = (review_id, user_id)
+        with self._lock:
+            if key in self._pending or key in self._inflight:
+                return False
+            self._pending[key] = column
+            delta = self._deltas.setdefault(review_id, {'likes': 0, 'dislikes': 0})
+            delta[column] += 1
+            if len(self._pending) >= self.max_pending:
+                self._wakeup.set()
+        return True
+
+    def pending_vote(self, review_id, user_id):
+        with self._lock:
+            return self._pending.get((review_id, user_id)) or self._inflight.get((review_id, user_id))
+
+    def estimate(self, review_id, likes, dislikes):
+        # Счетчики из БД плюс голоса, еще не записанные этим процессом
+        with self._lock:
+            for deltas in (self._deltas, self._inflight_deltas):
+                delta = deltas.get(review_id)
+                if delta:
+                    likes += delta['likes']
+                    dislikes += delta['dislikes']
+        return {'likes': likes, 'dislikes': dislikes}
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                pending, self._pending = self._pending, {}
+                self._inflight, self._inflight_deltas = pending, self._deltas
+                self._deltas = {}
+            try:
+                written, duplicates = self._write(pending)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"❌ Не удалось записать {len(pending)} оценок отзывов: {str(e)}")
+                self._restore(pending)
+                return 0
+            finally:
+                with self._lock:
+                    self._inflight, self._inflight_deltas = {}, {}
+            self.flushed += written
+            self.duplicates += duplicates
+            return written
+
+    def _write(self, pending):
+        deltas = {}
+        duplicates = 0
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                # Строки голосов разные - вставки не конкурируют между собой;
+                # счетчик растет только за реально вставленные голоса
+                for (review_id, user_id), column in pending.items():
+                    if cursor.execute(INSERT_VOTE_SQL, (review_id, user_id, VOTE_COLUMNS[column])):
+                        delta = deltas.setdefault(review_id, {'likes': 0, 'dislikes': 0})
+                        delta[column] += 1
+                    else:
+                        duplicates += 1
+                # Порядок по id: параллельные сбросы из разных процессов
+                # блокируют строки отзывов в одном порядке
+                for review_id in sorted(deltas):
+                    cursor.execute(APPLY_VOTES_SQL,
+                                   (deltas[review_id]['likes'], deltas[review_id]['dislikes'], review_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return len(pending) - duplicates, duplicates
+
+    def _restore(self, pending):
+        # Неудачный сброс: голоса возвращаются в буфер до следующей попытки
+        with self._lock:
+            for (review_id, user_id), column in pending.items():
+                if (review_id, user_id) in self._pending:
+                    continue
+                self._pending[(review_id, user_id)] = column
+                delta = self._deltas.setdefault(review_id, {'likes': 0, 'dislikes': 0})
+                delta[column] += 1
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='vote-buffer', daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stop(self):
+        # Последний сброс перед остановкой процесса
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stopped.set()
+            self._wakeup.set()
+            thread.join(timeout=self.interval + 5)
+        written = self.flush()
+        if written:
+            logger.info(f"💾 При остановке записано {written} оценок отзывов")
+
+    def status(self):
+        with self._lock:
+            pending = len(self._pending)
+            reviews = len(self._deltas)
+        return {
+            'pending': pending,
+            'pending_reviews': reviews,
+            'flushed': self.flushed,
+            'duplicates': self.duplicates,
+            'failures': self.failures,
+            'interval': self.interval,
+        }
+
+
+vote_buffer = VoteBuffer(Config.VOTE_FLUSH_INTERVAL, Config.VOTE_BUFFER_MAX)
+
+
+def register_vote(state, review_id, user_id, column):
+    # Голос по строке VOTE_STATE_SQL: (тело ответа, HTTP статус)
+    if not state:
+        return {'success': False, 'error': 'Review not found'}, 404
+    if state['vote'] is not None or not vote_buffer.add(review_id, user_id, column):
+        return {'success': False, 'error': 'You have already rated this review'}, 400
+    return {'success': True, 'data': vote_buffer.estimate(review_id, state['likes'], state['dislikes'])}, 200